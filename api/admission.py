@@ -0,0 +1,252 @@
+# api/admission.py
+"""
+Admission control ของงานอ่านป้าย (decode / detector / reader / fallback OCR) แบบมี priority
+- ลำดับความสำคัญ: gate (กล้องหน้าไม้กั้น, DroidCam, live camera) > upload (อัปโหลดเอง) > batch (วิดีโอ)
+- งานอ่านป้ายรันบน recognition executor (RECOGNITION_WORKERS threads) ไม่บล็อก event loop
+  ช่องว่างเมื่อไหร่ ให้คิวที่ priority สูงสุดก่อนเสมอ (ไม่แย่งงานที่รันอยู่)
+- คิวของแต่ละ class มีขนาดจำกัด: เต็ม -> ปฏิเสธทันที 429 + Retry-After
+  รอเกิน ADMISSION_MAX_WAIT_MS_* (หรือเกินงบเวลาของ request) -> 503 + Retry-After
+- /detect-video: จำนวนงานวิดีโอพร้อมกันจำกัดที่ ADMISSION_BATCH_JOBS แต่ละ frame รอคิว batch (ไม่หมดเวลา)
+- สถิติ (queue depth, in-flight, admitted/rejected/timed out, wait p50/p95 ต่อ class) ที่ GET /api/admission
+หมายเหตุ: YOLO predictor ไม่ thread-safe ตั้ง RECOGNITION_WORKERS > 1 เฉพาะเมื่อรันโมเดลแยกต่อ thread/process ได้
+"""
+import os
+import math
+import time
+import asyncio
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from .tracing import start_span
+
+PRIORITIES = ("gate", "upload", "batch")  # สูง -> ต่ำ
+
+RECOGNITION_WORKERS = max(1, int(os.getenv("RECOGNITION_WORKERS", "1")))
+ADMISSION_QUEUE_MAX = {
+    "gate": int(os.getenv("ADMISSION_QUEUE_GATE", "8")),
+    "upload": int(os.getenv("ADMISSION_QUEUE_UPLOAD", "16")),
+    "batch": int(os.getenv("ADMISSION_QUEUE_BATCH", "4")),
+}
+ADMISSION_MAX_WAIT_MS = {
+    "gate": float(os.getenv("ADMISSION_MAX_WAIT_MS_GATE", "3000")),
+    "upload": float(os.getenv("ADMISSION_MAX_WAIT_MS_UPLOAD", "15000")),
+    "batch": 0.0,  # frame ของวิดีโอรอได้เรื่อยๆ
+}
+ADMISSION_BATCH_JOBS = int(os.getenv("ADMISSION_BATCH_JOBS", "2"))
+_EWMA_ALPHA = 0.2
+
+# ช่องที่ request ปัจจุบันถืออยู่ ({"started", "jobs", "exited"}) ให้ run() ผูกงานบน executor เข้ากับช่อง
+_current_slot: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("admission_slot", default=None)
+
+class AdmissionRejected(Exception):
+    """ไม่รับงาน: 429 (คิวเต็ม) หรือ 503 (รอนานเกิน)"""
+
+    def __init__(self, status_code: int, detail: str, priority: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.priority = priority
+        self.retry_after = retry_after
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=self.status_code,
+            headers={"Retry-After": str(self.retry_after)},
+            content={"detail": self.detail, "priority": self.priority, "retry_after": self.retry_after},
+        )
+
+def classify_priority(priority: Optional[str] = None, *, video: bool = False, image_url: Optional[str] = None,
+                      lane: Optional[str] = None, camera: Optional[str] = None) -> str:
+    """priority ที่ client ระบุ > วิดีโอ = batch > กล้อง/lane/URL กล้อง = gate > อัปโหลดเอง = upload"""
+    if priority and priority.strip().lower() in PRIORITIES:
+        return priority.strip().lower()
+    if video:
+        return "batch"
+    if image_url or lane or camera:
+        return "gate"
+    return "upload"
+
+class AdmissionController:
+    """ใช้จาก event loop เท่านั้น (state ไม่ต้องมี lock) ส่วนงานจริงรันบน executor"""
+
+    def __init__(self, workers: int = RECOGNITION_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recognition")
+        self._in_flight = 0
+        self._waiting: dict[str, deque] = {p: deque() for p in PRIORITIES}
+        self._batch_jobs = 0
+        self._service_ms: Optional[float] = None
+        self._stats = {
+            p: {"admitted": 0, "rejected": 0, "timed_out": 0, "wait_ms": deque(maxlen=512)}
+            for p in PRIORITIES
+        }
+
+    # ---------- slots ----------
+
+    def _retry_after(self, ahead: int) -> int:
+        per_job = (self._service_ms or 1000.0) / 1000
+        return max(1, math.ceil((ahead + 1) * per_job / self.workers))
+
+    def _ahead_of(self, priority: str) -> int:
+        """งานที่ต้องได้ช่องก่อน priority นี้ (รันอยู่ + รอใน class ที่สูงกว่าหรือเท่ากัน)"""
+        n = self._in_flight
+        for p in PRIORITIES:
+            n += len(self._waiting[p])
+            if p == priority:
+                break
+        return n
+
+    def _dispatch(self):
+        while self._in_flight < self.workers:
+            waiter = next((q.popleft() for q in self._waiting.values() if q), None)
+            if waiter is None:
+                return
+            if waiter.done():  # ยกเลิกไปแล้ว
+                continue
+            self._in_flight += 1
+            waiter.set_result(True)
+
+    def _release(self, started: Optional[float]):
+        if started is not None:
+            ms = (time.perf_counter() - started) * 1000
+            self._service_ms = ms if self._service_ms is None else self._service_ms + _EWMA_ALPHA * (ms - self._service_ms)
+        self._in_flight -= 1
+        self._dispatch()
+
+    @staticmethod
+    def _withdraw(queue: deque, waiter: asyncio.Future):
+        waiter.cancel()
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self, priority: str, deadline: Optional[float] = None, bounded: bool = True):
+        """
+        ขอช่องรันงานอ่านป้าย: ได้ทันทีถ้าว่างและไม่มีใครรอ ไม่งั้นเข้าคิวของ class
+        deadline (perf_counter) = งบเวลาของ request: รอเกินนี้ก็ไม่มีประโยชน์ -> 503
+        bounded=False: ไม่จำกัดขนาดคิวและเวลารอ (frame ของงานวิดีโอที่รับไว้แล้ว)
+        """
+        stats = self._stats[priority]
+        t_wait = time.perf_counter()
+        if self._in_flight < self.workers and not any(self._waiting.values()):
+            self._in_flight += 1
+        else:
+            wait_span = start_span("admission.wait", priority=priority, ahead=self._ahead_of(priority))
+            queue = self._waiting[priority]
+            if bounded and len(queue) >= ADMISSION_QUEUE_MAX[priority]:
+                stats["rejected"] += 1
+                if wait_span is not None:
+                    wait_span.end(error="queue full")
+                raise AdmissionRejected(429, f"Recognition queue full ({priority})", priority,
+                                        self._retry_after(self._ahead_of(priority)))
+            timeout = ADMISSION_MAX_WAIT_MS[priority] / 1000 if bounded and ADMISSION_MAX_WAIT_MS[priority] > 0 else None
+            if bounded and deadline is not None:
+                remaining = max(0.0, deadline - t_wait)
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            waiter = asyncio.get_running_loop().create_future()
+            queue.append(waiter)
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            except asyncio.CancelledError:
+                if wait_span is not None:
+                    wait_span.end(error="cancelled")
+                if waiter.done():
+                    self._release(None)  # ได้ช่องพอดีตอนถูกยกเลิก: คืนให้คนถัดไป
+                else:
+                    self._withdraw(queue, waiter)
+                raise
+            if wait_span is not None:
+                wait_span.end(**({} if waiter.done() else {"error": "timed out"}))
+            if not waiter.done():
+                self._withdraw(queue, waiter)
+                stats["timed_out"] += 1
+                raise AdmissionRejected(503, f"Recognition busy, waited {(time.perf_counter() - t_wait) * 1000:.0f} ms ({priority})",
+                                        priority, self._retry_after(self._ahead_of(priority)))
+        stats["admitted"] += 1
+        stats["wait_ms"].append((time.perf_counter() - t_wait) * 1000)
+        held = {"started": time.perf_counter(), "jobs": 0, "exited": False}
+        token = _current_slot.set(held)
+        try:
+            yield
+        finally:
+            _current_slot.reset(token)
+            held["exited"] = True
+            if held["jobs"] == 0:
+                self._release(held["started"])
+            # ยังมีงานรันอยู่บน executor (request ถูกยกเลิกกลางทาง) -> คืนช่องตอนงานนั้นจบใน _job_done
+
+    def _job_done(self, held: dict):
+        held["jobs"] -= 1
+        if held["exited"] and held["jobs"] == 0:
+            self._release(held["started"])
+
+    async def run(self, fn, *args):
+        """
+        รัน fn บน recognition executor (เรียกภายใน slot) พร้อม context ของ caller (trace span)
+        ช่องจะไม่ถูกคืนก่อนงานบน executor จบจริง แม้ coroutine ที่รออยู่จะถูกยกเลิก
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        future = self.executor.submit(ctx.run, fn, *args)
+        held = _current_slot.get()
+        if held is not None:
+            held["jobs"] += 1
+            def finished(_f):
+                # เรียกจาก thread ของ executor
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(self._job_done, held)
+            future.add_done_callback(finished)
+        return await asyncio.wrap_future(future)
+
+    # ---------- batch jobs ----------
+
+    def open_job(self):
+        """รับงานวิดีโอใหม่ ถ้างานพร้อมกันเต็มแล้ว -> AdmissionRejected(429)"""
+        if self._batch_jobs >= ADMISSION_BATCH_JOBS:
+            self._stats["batch"]["rejected"] += 1
+            raise AdmissionRejected(429, f"Too many video jobs running ({self._batch_jobs})", "batch",
+                                    self._retry_after(self._ahead_of("batch")) * 10)
+        self._batch_jobs += 1
+
+    def close_job(self):
+        self._batch_jobs = max(0, self._batch_jobs - 1)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- metrics ----------
+
+    def queue_depths(self) -> dict:
+        return {p: len(q) for p, q in self._waiting.items()}
+
+    def stats(self) -> dict:
+        classes = {}
+        for p in PRIORITIES:
+            s = self._stats[p]
+            waits = sorted(s["wait_ms"])
+            classes[p] = {
+                "queued": len(self._waiting[p]),
+                "queue_max": ADMISSION_QUEUE_MAX[p],
+                "admitted": s["admitted"],
+                "rejected": s["rejected"],
+                "timed_out": s["timed_out"],
+                "wait_ms_p50": round(waits[len(waits) // 2], 1) if waits else None,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1) if waits else None,
+            }
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "batch_jobs": self._batch_jobs,
+            "batch_jobs_max": ADMISSION_BATCH_JOBS,
+            "service_ms": round(self._service_ms, 1) if self._service_ms is not None else None,
+            "classes": classes,
+        }
+
+admission = AdmissionController()
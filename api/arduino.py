@@ -1,233 +1,540 @@
 # api/arduino.py - Arduino/Serial Communication with WebSocket support
+"""
+Gate controller สำหรับ Arduino (gate_control_wifi.ino)
+- thread "gate-writer" เป็นเจ้าของ serial port: เปิด/ต่อใหม่ และเขียนคำสั่งจากคิว
+- thread "gate-reader" อ่าน byte แล้วตัดเป็นบรรทัด จับคู่กับคำสั่งที่รอ ACK ทันทีที่บรรทัดมาถึง
+- ทุกคำสั่งมี correlation id และ future ของ ACK - ผู้เรียก enqueue แล้วคืนทันที หรือ await ACK แบบไม่ block event loop
+- เปิด port ตั้งแต่ startup (keepalive) ส่ง PING เป็น heartbeat และต่อใหม่เองแบบ backoff เมื่อหลุด
+  รถคันแรกหลัง restart ไม่ต้องรอ Arduino reset 2 วินาที
+firmware ไม่มี id ในโปรโตคอล จึงจับคู่คำตอบกับคำสั่งที่รออยู่เก่าสุดที่คาดหวังคำตอบแบบนั้น (PONG, ACK:OPEN, ACK:CLOSE, STATUS:)
+"""
 import os, time
+import asyncio
+import itertools
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+
 import serial
 
+from .metrics import GATE_RTT_SECONDS, GATE_ACK_TIMEOUTS_TOTAL
+from .tracing import start_span
+from .logger import get_logger
+
+log = get_logger("arduino")
+gate_log = get_logger("gate")
+
 SERIAL_ENABLED = os.getenv("SERIAL_ENABLED", "false").lower() == "true"
 SERIAL_PORT    = os.getenv("SERIAL_PORT", "/dev/ttyACM0")   # macOS: /dev/cu.usbmodem*, Linux: /dev/ttyACM0
 SERIAL_URL     = os.getenv("SERIAL_URL")                    # Optional: socket://host:port
 SERIAL_BAUD    = int(os.getenv("SERIAL_BAUD", "115200"))
+GATE_ACK_TIMEOUT_SEC = float(os.getenv("GATE_ACK_TIMEOUT_SEC", "3"))
+GATE_QUEUE_MAX = int(os.getenv("GATE_QUEUE_MAX", "32"))
+GATE_HEARTBEAT_SEC = float(os.getenv("GATE_HEARTBEAT_SEC", "5"))        # 0 = ปิด heartbeat
+GATE_HEARTBEAT_MISSES = int(os.getenv("GATE_HEARTBEAT_MISSES", "2"))    # PING ไม่ตอบติดกันกี่ครั้งจึงต่อใหม่
+GATE_RECONNECT_MAX_SEC = float(os.getenv("GATE_RECONNECT_MAX_SEC", "30"))
 
-_ser = None
+ARDUINO_RESET_DELAY_SEC = 2.0  # Arduino UNO reset ตัวเองเมื่อเปิด port
+_READ_TIMEOUT_SEC = 0.2        # ให้ reader ตื่นมาเช็ค ACK ที่หมดเวลา (บรรทัดที่มาถึงจะถูกอ่านทันที)
+_MAX_LINE_BYTES = 1024
+_WAKE = object()  # ปลุก writer thread ให้ต่อใหม่ทันทีหลัง link หลุด
 
-def _connect():
-    """Establish serial connection to Arduino"""
-    global _ser
-    if _ser and _ser.is_open:
-        return _ser
-    if not SERIAL_ENABLED:
-        print(f"[ARDUINO] ⚠️ SERIAL_ENABLED is False - gate will not work!", flush=True)
-        return None
+class GateUnavailable(Exception):
+    """ส่งคำสั่งไม่ได้ (serial ปิดอยู่ / ต่อไม่ได้ / คิวเต็ม)"""
 
-    port_or_url = SERIAL_URL if SERIAL_URL else SERIAL_PORT
-    
-    # Check if port exists (for physical ports only)
-    if not SERIAL_URL and port_or_url.startswith("/dev/"):
-        import os
-        if not os.path.exists(port_or_url):
-            print(f"[ARDUINO] ❌ Port {port_or_url} does not exist!", flush=True)
-            print(f"[ARDUINO] 💡 Check: 1) Arduino is connected, 2) Port is correct", flush=True)
-            print(f"[ARDUINO] 💡 Available ports: {os.popen('ls /dev/cu.* 2>/dev/null | grep usbmodem || echo None').read().strip()}", flush=True)
-            return None
+def _expected_reply(cmd: str) -> Optional[str]:
+    """prefix ของบรรทัดที่เป็นคำตอบของคำสั่งนี้ (ตาม processCommand ใน firmware)"""
+    cmd = cmd.strip().upper()
+    if cmd == "PING":
+        return "PONG"
+    if cmd == "OPEN" or cmd.startswith("OPEN:"):
+        return "ACK:OPEN"
+    if cmd == "CLOSE":
+        return "ACK:CLOSE"
+    if cmd == "STATUS":
+        return "STATUS:"
+    return None
 
-    try:
-        print(f"[ARDUINO] 🔌 Attempting to connect to {port_or_url} at {SERIAL_BAUD} baud...", flush=True)
-        _ser = serial.serial_for_url(port_or_url, baudrate=SERIAL_BAUD, timeout=2)
-        time.sleep(2.0)  # Wait for Arduino reset
-        print(f"[ARDUINO] ✅ Connected to {port_or_url}", flush=True)
-        
-        # Test connection with PING
+class GateCommand:
+    """คำสั่งหนึ่งรายการ: future ได้บรรทัดคำตอบ ("" = ส่งแล้วแต่ไม่มี ACK ภายในเวลา)"""
+
+    __slots__ = ("cid", "cmd", "expect", "timeout", "future", "queued_at", "sent_at", "deadline", "internal", "span")
+
+    def __init__(self, cid: int, cmd: str, timeout: float, internal: bool = False):
+        self.cid = cid
+        self.cmd = cmd
+        self.internal = internal  # heartbeat - ไม่ log ทุกครั้ง
+        self.expect = _expected_reply(cmd)
+        self.timeout = timeout
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+        self.sent_at = 0.0
+        self.deadline = 0.0
+        self.span = None  # span "gate.command" ของ trace ที่สั่ง (ถ้ามี) จบเมื่อได้ ACK / timeout / error
+
+    def matches(self, line: str) -> bool:
+        if line.startswith("UNKNOWN:"):
+            # firmware ตอบ "UNKNOWN: <cmd ตัวพิมพ์ใหญ่>"
+            return line[len("UNKNOWN:"):].strip() == self.cmd.strip().upper()
+        return line.startswith(self.expect) if self.expect else True
+
+    def resolve(self, response: str):
+        if not self.future.done():
+            self.future.set_result(response)
+
+    def fail(self, exc: Exception):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+def _end_command_span(command: GateCommand):
+    now = time.monotonic()
+    sent = command.sent_at
+    attrs = {
+        "queue_wait_ms": round(((sent or now) - command.queued_at) * 1000, 2),
+        "rtt_ms": round((now - sent) * 1000, 2) if sent else None,
+    }
+    if command.future.cancelled():
+        command.span.end(error="cancelled", **attrs)
+        return
+    exc = command.future.exception()
+    if exc is not None:
+        command.span.end(error=str(exc), **attrs)
+    else:
+        response = command.future.result()
+        command.span.end(error=None if response else "no ACK", response=response, **attrs)
+
+class GateController:
+    """เจ้าของ serial port หนึ่งตัว (หนึ่ง gate device)"""
+
+    def __init__(self, url: str, baud: int = SERIAL_BAUD, name: str = "gate",
+                 queue_max: int = GATE_QUEUE_MAX):
+        self.url = url
+        self.baud = baud
+        self.name = name
+        self._commands: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._pending: deque[GateCommand] = deque()   # เขียนแล้ว รอ ACK
+        self._pending_lock = threading.Lock()
+        self._ser = None
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._cids = itertools.count(1)
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.write_errors = 0
+        self.last_rtt_ms: Optional[float] = None
+        self._recent_rtt_ms: deque[float] = deque(maxlen=256)
+        self.connects = 0
+        self.connect_failures = 0
+        self.heartbeat_misses = 0
+        self._missed_in_row = 0
+        self._keepalive = False
+        self._backoff = 0.5
+        self._next_connect_at = 0.0
+        self._last_ack_at: Optional[float] = None
+        self._last_rx_at: Optional[float] = None
+        self._connected_at: Optional[float] = None
+        self._heartbeat_inflight = False
+        self._listeners: list[Callable[[str], None]] = []
+
+    # ---------- public API ----------
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """เรียก callback(line) ทุกบรรทัดที่ firmware ส่งมา (ใน reader thread - ต้องทำงานเร็ว ไม่ block)"""
+        self._listeners.append(callback)
+
+    def start(self, keepalive: bool = False):
+        """เริ่ม thread - keepalive=True เปิด port ทันทีแล้วคอยส่ง heartbeat / ต่อใหม่เอง"""
+        with self._start_lock:
+            if keepalive:
+                self._keepalive = True
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._writer_loop, name=f"{self.name}-writer", daemon=True),
+                threading.Thread(target=self._reader_loop, name=f"{self.name}-reader", daemon=True),
+            ]
+            for t in self._threads:
+                t.start()
+
+    def submit(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> GateCommand:
+        """ใส่คำสั่งลงคิวแล้วคืนทันที (ผลอยู่ใน .future)"""
+        self.start()
+        command = GateCommand(next(self._cids), cmd, timeout)
+        command.span = start_span("gate.command", cmd=cmd, device=str(self.url), cid=command.cid)
+        if command.span is not None:
+            command.future.add_done_callback(lambda _f, c=command: _end_command_span(c))
         try:
-            _ser.reset_input_buffer()
-            _ser.write(b"PING\n")
-            _ser.flush()
-            time.sleep(0.5)
-            if _ser.in_waiting:
-                response = _ser.readline().decode().strip()
-                print(f"[ARDUINO] 📥 Test response: {response}", flush=True)
-        except Exception as test_e:
-            print(f"[ARDUINO] ⚠️ Test ping failed (but connection OK): {test_e}", flush=True)
-        
-        return _ser
-    except serial.SerialException as e:
-        print(f"[ARDUINO] ❌ Serial connection failed: {e}", flush=True)
-        print(f"[ARDUINO] 💡 Check: 1) Port exists: {port_or_url}, 2) Arduino is connected, 3) No other program using the port", flush=True)
-        _ser = None
-        return None
-    except Exception as e:
-        print(f"[ARDUINO] ❌ Connection failed: {e}", flush=True)
-        import traceback
-        print(f"[ARDUINO] Traceback: {traceback.format_exc()}", flush=True)
-        _ser = None
-        return None
+            self._commands.put_nowait(command)
+        except queue.Full:
+            command.fail(GateUnavailable(f"{self.name}: command queue full"))
+        return command
 
-def send_command(cmd: str, retry_count: int = 2) -> str:
-    """Send command to Arduino and get response"""
-    if not SERIAL_ENABLED:
-        print("[ARDUINO] ⚠️ Serial disabled (SERIAL_ENABLED=false)", flush=True)
-        return ""
-    
-    for attempt in range(retry_count):
+    async def request(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> str:
+        """ส่งคำสั่งแล้วรอคำตอบแบบไม่ block event loop"""
+        return await asyncio.wrap_future(self.submit(cmd, timeout).future)
+
+    def request_sync(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> str:
+        """สำหรับโค้ดที่ไม่ใช่ async (ห้ามเรียกใน event loop)"""
+        command = self.submit(cmd, timeout)
+        # เผื่อเวลาให้ต่อ port ใหม่ก่อนเขียน
+        return command.future.result(timeout + ARDUINO_RESET_DELAY_SEC + 5)
+
+    def close(self):
+        self._stop.set()
         try:
-            ser = _connect()
-            if not ser:
-                if attempt < retry_count - 1:
-                    print(f"[ARDUINO] ⚠️ Retry {attempt + 1}/{retry_count}...", flush=True)
-                    time.sleep(1)
-                    continue
-                print(f"[ARDUINO] ❌ Cannot connect to {SERIAL_PORT} after {retry_count} attempts", flush=True)
-                return ""
-            
-            # Clear any pending input
+            self._commands.put_nowait(None)
+        except queue.Full:
+            pass
+        for t in self._threads:
+            t.join(timeout=2)
+        self._threads = []
+        self._drop_connection(None, "controller closed")
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        rtts = sorted(self._recent_rtt_ms)
+        return {
+            "device": self.url,
+            "connected": self._connected.is_set(),
+            "keepalive": self._keepalive,
+            "connected_for_sec": round(now - self._connected_at, 1) if self._connected_at and self._connected.is_set() else None,
+            "queued": self._commands.qsize(),
+            "awaiting_ack": len(self._pending),
+            "sent": self.sent,
+            "acked": self.acked,
+            "timeouts": self.timeouts,
+            "write_errors": self.write_errors,
+            "connects": self.connects,
+            "reconnects": max(0, self.connects - 1),
+            "connect_failures": self.connect_failures,
+            "heartbeat_misses": self.heartbeat_misses,
+            "last_ack_age_sec": round(now - self._last_ack_at, 2) if self._last_ack_at else None,
+            "last_rx_age_sec": round(now - self._last_rx_at, 2) if self._last_rx_at else None,
+            "rtt_ms_last": self.last_rtt_ms,
+            "rtt_ms_p50": rtts[len(rtts) // 2] if rtts else None,
+            "rtt_ms_p95": rtts[int(0.95 * (len(rtts) - 1))] if rtts else None,
+            "rtt_ms_max": rtts[-1] if rtts else None,
+        }
+
+    # ---------- connection ----------
+
+    def _open(self):
+        if self._ser is not None:
+            return self._ser
+        if not self.url.startswith("socket://") and self.url.startswith("/dev/") and not os.path.exists(self.url):
+            log.error("[ARDUINO] ❌ Port %s does not exist! Check: 1) Arduino is connected, 2) Port is correct", self.url)
+            return None
+        try:
+            log.info("[ARDUINO] 🔌 Attempting to connect to %s at %d baud...", self.url, self.baud)
+            ser = serial.serial_for_url(self.url, baudrate=self.baud, timeout=_READ_TIMEOUT_SEC, write_timeout=2)
+            if not self.url.startswith("socket://"):
+                time.sleep(ARDUINO_RESET_DELAY_SEC)  # Wait for Arduino reset (อยู่ใน gate thread ไม่ใช่ request path)
+            ser.reset_input_buffer()
+        except Exception as e:
+            self.connect_failures += 1
+            log.error("[ARDUINO] ❌ Serial connection failed: %s. Check: 1) Port exists: %s, "
+                      "2) Arduino is connected, 3) No other program using the port", e, self.url)
+            return None
+        self._ser = ser
+        self.connects += 1
+        self._connected_at = time.monotonic()
+        self._missed_in_row = 0
+        self._backoff = 0.5
+        self._connected.set()
+        log.info("[ARDUINO] ✅ Connected to %s%s", self.url,
+                 f" (reconnect #{self.connects - 1})" if self.connects > 1 else "")
+        return ser
+
+    def _drop_connection(self, ser, reason: str):
+        """ปิด port (ถ้ายังเป็นตัวปัจจุบัน) - คำสั่งที่รอ ACK อยู่ถือว่าไม่ได้ ACK"""
+        if ser is not None and ser is not self._ser:
+            return
+        current, self._ser = self._ser, None
+        self._connected.clear()
+        if current is not None:
+            log.warning("[ARDUINO] ⚠️ Connection to %s dropped: %s", self.url, reason)
             try:
-                ser.reset_input_buffer()
-            except:
+                current.close()
+            except Exception:
                 pass
-            
-            # Send command
-            cmd_bytes = f"{cmd}\n".encode()
-            print(f"[ARDUINO] 📤 Sending (attempt {attempt + 1}): {cmd_bytes.decode().strip()}", flush=True)
-            
+        with self._pending_lock:
+            pending, self._pending = list(self._pending), deque()
+        for command in pending:
+            self.timeouts += 1
+            command.resolve("")
+        if current is not None and self._keepalive and not self._stop.is_set():
             try:
-                ser.write(cmd_bytes)
-                ser.flush()
-            except Exception as write_e:
-                print(f"[ARDUINO] ⚠️ Write failed: {write_e}, closing connection...", flush=True)
+                self._commands.put_nowait(_WAKE)
+            except queue.Full:
+                pass
+
+    # ---------- threads ----------
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            if self._keepalive:
+                self._maintain_link()
+                wait = GATE_HEARTBEAT_SEC if self._ser is not None and GATE_HEARTBEAT_SEC > 0 else None
+                if self._ser is None:
+                    wait = max(0.05, self._next_connect_at - time.monotonic())
                 try:
-                    ser.close()
-                except:
-                    pass
-                _ser = None
+                    command = self._commands.get(timeout=wait)
+                except queue.Empty:
+                    continue
+            else:
+                command = self._commands.get()
+            if command is None:
+                break
+            if command is _WAKE or command.future.done():
+                continue
+            self._write(command)
+
+    def _maintain_link(self):
+        """(writer thread) ต่อใหม่แบบ backoff เมื่อหลุด และส่ง PING เมื่อ link เงียบนานเกิน heartbeat"""
+        now = time.monotonic()
+        if self._ser is None:
+            if now < self._next_connect_at:
+                return
+            if self._open() is None:
+                self._next_connect_at = now + self._backoff
+                log.info("[ARDUINO] 🔁 Reconnect to %s in %.1fs", self.url, self._backoff)
+                self._backoff = min(self._backoff * 2, GATE_RECONNECT_MAX_SEC)
+                return
+            self._send_heartbeat()  # ยืนยันว่า firmware ตอบได้จริง
+            return
+        if GATE_HEARTBEAT_SEC <= 0 or self._heartbeat_inflight:
+            return
+        last = max(self._last_rx_at or 0.0, self._connected_at or 0.0)
+        if now - last >= GATE_HEARTBEAT_SEC:
+            self._send_heartbeat()
+
+    def _send_heartbeat(self):
+        command = GateCommand(next(self._cids), "PING", GATE_ACK_TIMEOUT_SEC, internal=True)
+        self._heartbeat_inflight = True
+        command.future.add_done_callback(self._on_heartbeat)
+        self._write(command, retry_count=1)
+
+    def _on_heartbeat(self, future: Future):
+        self._heartbeat_inflight = False
+        if future.exception() is None and future.result().startswith("PONG"):
+            self._missed_in_row = 0
+            return
+        self.heartbeat_misses += 1
+        self._missed_in_row += 1
+        log.warning("[ARDUINO] ⚠️ Heartbeat missed on %s (%d/%d)", self.url, self._missed_in_row, GATE_HEARTBEAT_MISSES)
+        if self._missed_in_row >= GATE_HEARTBEAT_MISSES:
+            self._missed_in_row = 0
+            self._next_connect_at = 0.0
+            self._drop_connection(self._ser, "heartbeat timeout")
+
+    def _write(self, command: GateCommand, retry_count: int = 2):
+        data = f"{command.cmd}\n".encode()
+        for attempt in range(retry_count):
+            ser = self._open()
+            if ser is None:
                 if attempt < retry_count - 1:
-                    time.sleep(1)
+                    self._stop.wait(1.0)
                     continue
-                return ""
-            
-            # Read response (with timeout)
-            response = ""
-            start_time = time.time()
-            while time.time() - start_time < 3:  # 3 second timeout
-                try:
-                    if ser.in_waiting:
-                        line = ser.readline().decode('utf-8', errors='ignore').strip()
-                        if line:
-                            # Skip echo lines (CMD: ...)
-                            if not line.startswith("CMD:"):
-                                response = line
-                                print(f"[ARDUINO] 📥 Response: {response}", flush=True)
-                                break
-                    time.sleep(0.1)
-                except Exception as read_e:
-                    print(f"[ARDUINO] ⚠️ Read error: {read_e}", flush=True)
-                    break
-            
-            if not response:
-                print(f"[ARDUINO] ⚠️ No response from Arduino for command: {cmd}", flush=True)
-                print(f"[ARDUINO] 💡 This might be OK - gate may still open even without response", flush=True)
-            
-            return response
-            
-        except serial.SerialException as e:
-            print(f"[ARDUINO] ❌ Serial error (attempt {attempt + 1}): {e}", flush=True)
+                command.fail(GateUnavailable(f"cannot connect to {self.url}"))
+                return
+            command.sent_at = time.monotonic()
+            command.deadline = command.sent_at + command.timeout
+            # ลงทะเบียนก่อนเขียน เพื่อไม่พลาดคำตอบที่มาเร็ว
+            with self._pending_lock:
+                self._pending.append(command)
             try:
-                if _ser:
-                    _ser.close()
-            except:
-                pass
-            _ser = None
-            if attempt < retry_count - 1:
-                time.sleep(1)
+                if not command.internal:
+                    log.debug("[ARDUINO] 📤 Sending #%d (attempt %d): %s", command.cid, attempt + 1, command.cmd)
+                ser.write(data)
+                ser.flush()
+                self.sent += 1
+                return
+            except Exception as e:
+                self.write_errors += 1
+                with self._pending_lock:
+                    try:
+                        self._pending.remove(command)
+                    except ValueError:
+                        pass
+                self._drop_connection(ser, f"write failed: {e}")
+        command.fail(GateUnavailable(f"write to {self.url} failed"))
+
+    def _reader_loop(self):
+        buf = bytearray()
+        while not self._stop.is_set():
+            ser = self._ser
+            if ser is None:
+                buf.clear()
+                self._connected.wait(0.5)
+                self._expire_pending()
                 continue
-        except Exception as e:
-            print(f"[ARDUINO] ❌ Command failed (attempt {attempt + 1}): {e}", flush=True)
-            import traceback
-            print(f"[ARDUINO] Traceback: {traceback.format_exc()}", flush=True)
-            if attempt < retry_count - 1:
-                time.sleep(1)
+            try:
+                chunk = ser.read(ser.in_waiting or 1)
+            except Exception as e:
+                self._drop_connection(ser, f"read failed: {e}")
                 continue
-    
-    return ""
-
-def send_open_gate(plate_text: str = ""):
-    """Open gate with optional plate text"""
-    print(f"[GATE] 🔧 send_open_gate called with plate_text='{plate_text}'", flush=True)
-    print(f"[GATE] 🔧 SERIAL_ENABLED={SERIAL_ENABLED}, SERIAL_PORT={SERIAL_PORT}, SERIAL_BAUD={SERIAL_BAUD}", flush=True)
-    
+            if chunk:
+                self._last_rx_at = time.monotonic()
+                buf += chunk
+                while True:
+                    nl = buf.find(b"\n")
+                    if nl < 0:
+                        break
+                    line = bytes(buf[:nl]).decode("utf-8", errors="ignore").strip()
+                    del buf[:nl + 1]
+                    if line:
+                        self._on_line(line)
+                if len(buf) > _MAX_LINE_BYTES:  # ขยะที่ไม่มี newline
+                    buf.clear()
+            self._expire_pending()
+
+    def _on_line(self, line: str):
+        if line.startswith("CMD:"):
+            return  # echo ของ firmware
+        for callback in self._listeners:
+            try:
+                callback(line)
+            except Exception as e:
+                log.error("[ARDUINO] ❌ Line listener error: %s", e)
+        now = time.monotonic()
+        with self._pending_lock:
+            command = next((c for c in self._pending if c.matches(line)), None)
+            if command is not None:
+                self._pending.remove(command)
+        if command is None:
+            log.debug("[ARDUINO] 📥 Unsolicited: %s", line)
+            return
+        self.acked += 1
+        self._last_ack_at = now
+        self.last_rtt_ms = round((now - command.sent_at) * 1000, 2)
+        GATE_RTT_SECONDS.labels(str(self.url)).observe(now - command.sent_at)
+        self._recent_rtt_ms.append(self.last_rtt_ms)
+        if not command.internal:
+            log.debug("[ARDUINO] 📥 Response #%d (%s ms): %s", command.cid, self.last_rtt_ms, line)
+        command.resolve(line)
+
+    def _expire_pending(self):
+        now = time.monotonic()
+        expired = []
+        with self._pending_lock:
+            if not self._pending:
+                return
+            for command in list(self._pending):
+                if command.deadline <= now:
+                    self._pending.remove(command)
+                    expired.append(command)
+        for command in expired:
+            self.timeouts += 1
+            GATE_ACK_TIMEOUTS_TOTAL.labels(str(self.url)).inc()
+            log.warning("[ARDUINO] ⚠️ No response from Arduino for command #%d: %s", command.cid, command.cmd)
+            command.resolve("")
+
+gate_controller = GateController(SERIAL_URL if SERIAL_URL else SERIAL_PORT, SERIAL_BAUD)
+
+def send_command(cmd: str, retry_count: int = 2) -> str:
+    """Send command to Arduino and get response (blocking - ใช้นอก event loop)"""
     if not SERIAL_ENABLED:
-        print("[GATE] ⚠️ Serial disabled (SERIAL_ENABLED=false), gate command not sent", flush=True)
-        print("[GATE] 💡 To enable: Set SERIAL_ENABLED=true in environment or .env file", flush=True)
-        return False
-    
-    if plate_text:
-        cmd = f"OPEN:{plate_text}"
-    else:
-        cmd = "OPEN"
-    
-    print(f"[GATE] 📤 Sending gate command: {cmd}", flush=True)
-    print(f"[GATE] 📤 Attempting to connect to Arduino...", flush=True)
-    
+        log.debug("[ARDUINO] Serial disabled (SERIAL_ENABLED=false)")
+        return ""
     try:
-        response = send_command(cmd)
-        
-        success = "ACK:OPEN" in response or "OPEN" in response.upper()
-        if success:
-            print(f"[GATE] ✅ Gate opened successfully! Response: {response}", flush=True)
-        else:
-            print(f"[GATE] ⚠️ Gate command sent but no ACK received. Response: {response}", flush=True)
-            print(f"[GATE] 💡 This might be OK if Arduino doesn't send ACK, but gate should still open", flush=True)
-            # ถ้าไม่มี response แต่ command ส่งไปแล้ว ก็ถือว่าสำเร็จ (บาง Arduino อาจไม่ส่ง ACK)
-            if response == "":
-                print(f"[GATE] ⚠️ No response from Arduino, but command was sent", flush=True)
-                success = True  # ถือว่าสำเร็จถ้าส่ง command ไปแล้ว
-        
-        return success
+        return gate_controller.request_sync(cmd)
     except Exception as e:
-        print(f"[GATE] ❌ Exception in send_open_gate: {e}", flush=True)
-        import traceback
-        print(f"[GATE] Traceback: {traceback.format_exc()}", flush=True)
+        log.error("[ARDUINO] ❌ Command failed: %s", e)
+        return ""
+
+def _open_command(plate_text: str) -> str:
+    return f"OPEN:{plate_text}" if plate_text else "OPEN"
+
+def send_open_gate(plate_text: str = "", controller: Optional[GateController] = None) -> bool:
+    """Open gate with optional plate text - enqueue แล้วคืนทันที (True = เข้าคิวแล้ว)"""
+    if not SERIAL_ENABLED:
+        gate_log.debug("[GATE] Serial disabled (SERIAL_ENABLED=false), gate command not sent")
+        return False
+    command = (controller or gate_controller).submit(_open_command(plate_text))
+    gate_log.debug("[GATE] 📤 Queued gate command #%d: %s", command.cid, command.cmd)
+    return not command.future.done() or command.future.exception() is None
+
+def submit_open_gate(plate_text: str = "", controller: Optional[GateController] = None) -> Optional[GateCommand]:
+    """enqueue OPEN แล้วคืน GateCommand ทันที (None ถ้า serial ปิดอยู่) - ใช้ใน gate-first fast path"""
+    if not SERIAL_ENABLED:
+        gate_log.debug("[GATE] Serial disabled (SERIAL_ENABLED=false), gate command not sent")
+        return None
+    return (controller or gate_controller).submit(_open_command(plate_text))
+
+def open_ack_ok(response: str) -> bool:
+    """ผลของ OPEN: ACK:OPEN = สำเร็จ, ไม่มีคำตอบ = ถือว่าสำเร็จ (บาง Arduino อาจไม่ส่ง ACK)"""
+    return response.startswith("ACK:OPEN") or response == ""
+
+async def open_gate(plate_text: str = "", controller: Optional[GateController] = None) -> bool:
+    """Open gate แล้วรอ ACK แบบ async (ไม่ block event loop)"""
+    if not SERIAL_ENABLED:
+        gate_log.debug("[GATE] Serial disabled (SERIAL_ENABLED=false), gate command not sent")
+        return False
+    try:
+        response = await (controller or gate_controller).request(_open_command(plate_text))
+    except GateUnavailable as e:
+        gate_log.error("[GATE] ❌ Gate command not sent: %s", e)
         return False
 
-def send_close_gate():
-    """Close gate immediately"""
-    response = send_command("CLOSE")
-    return "ACK:CLOSE" in response
+    if response.startswith("ACK:OPEN"):
+        gate_log.debug("[GATE] ✅ Gate opened successfully! Response: %s", response)
+    else:
+        gate_log.warning("[GATE] ⚠️ Gate command sent but no ACK received. Response: %s", response)
+    return open_ack_ok(response)
+
+def send_close_gate(controller: Optional[GateController] = None) -> bool:
+    """Close gate immediately - enqueue แล้วคืนทันที"""
+    if not SERIAL_ENABLED:
+        log.debug("[ARDUINO] Serial disabled (SERIAL_ENABLED=false)")
+        return False
+    command = (controller or gate_controller).submit("CLOSE")
+    return not command.future.done() or command.future.exception() is None
 
 def ping_arduino() -> bool:
     """Test Arduino connection"""
     response = send_command("PING")
     return "PONG" in response
 
-def get_gate_status() -> dict:
-    """Get current gate status"""
-    response = send_command("STATUS")
-    
+def parse_status(response: str) -> dict:
     # Parse response: STATUS:OPEN|ANGLE:90|UPTIME:123s
     status = {
         "connected": bool(response),
-        "is_open": "OPEN" in response,
+        "is_open": response.startswith("STATUS:OPEN"),
         "angle": 0,
         "uptime": 0
     }
-    
+
     if response:
         parts = response.split("|")
         for part in parts:
             if "ANGLE:" in part:
                 try:
                     status["angle"] = int(part.split(":")[1])
-                except:
+                except ValueError:
                     pass
             if "UPTIME:" in part:
                 try:
                     status["uptime"] = int(part.split(":")[1].replace("s", ""))
-                except:
+                except ValueError:
                     pass
-    
+
     return status
 
+def get_gate_status() -> dict:
+    """Get current gate status"""
+    return parse_status(send_command("STATUS"))
+
 def disconnect():
     """Close serial connection"""
-    global _ser
-    if _ser and _ser.is_open:
-        _ser.close()
-        _ser = None
-        print("[ARDUINO] Disconnected", flush=True)
+    gate_controller.close()
+    log.info("[ARDUINO] Disconnected")
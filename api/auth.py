@@ -1,42 +1,90 @@
 # api/auth.py
 import os
+import hmac
+import asyncio
 import hashlib
 import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from sqlalchemy.orm import Session
 from .models import User
 
-def hash_password(password: str, salt: str = None) -> tuple[str, str]:
-    """Hash password with salt"""
+# จำนวนรอบ PBKDF2 ปรับได้ - hash เก่าจะถูกอัปเกรดอัตโนมัติตอน login สำเร็จ
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "100000"))
+LEGACY_HASH_ITERATIONS = 100000  # hash แบบเดิม (hex ล้วน) ใช้ 100,000 รอบ
+KDF_WORKERS = int(os.getenv("KDF_WORKERS", "2"))
+KDF_QUEUE_MAX = int(os.getenv("KDF_QUEUE_MAX", "16"))  # งานที่รอ + กำลังทำ ต่อ worker process
+
+_HASH_SCHEME = "pbkdf2_sha256"
+
+class KDFPoolBusy(Exception):
+    """KDF pool เต็ม - ให้ client ลองใหม่ภายหลัง (503)"""
+
+class KDFPool:
+    """
+    executor แยกสำหรับงาน PBKDF2 (pbkdf2_hmac ปล่อย GIL ระหว่างคำนวณ)
+    จำกัดจำนวนงานค้าง ถ้าเต็มจะปฏิเสธทันทีแทนที่จะต่อคิวยาว
+    """
+
+    def __init__(self, workers: int = KDF_WORKERS, max_pending: int = KDF_QUEUE_MAX):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise KDFPoolBusy(f"KDF pool full ({self.max_pending} pending)")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # คืน slot เมื่องานเสร็จจริง (แม้ request จะถูกยกเลิกไปก่อน)
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+kdf_pool = KDFPool()
+
+def _parse_hash(password_hash: str) -> tuple[int, str]:
+    """แยก (iterations, hex digest) รองรับทั้งรูปแบบใหม่และ hex ล้วนแบบเดิม"""
+    if password_hash.startswith(f"{_HASH_SCHEME}$"):
+        _, iterations, digest = password_hash.split("$", 2)
+        return int(iterations), digest
+    return LEGACY_HASH_ITERATIONS, password_hash
+
+def hash_password(password: str, salt: str = None, iterations: Optional[int] = None) -> tuple[str, str]:
+    """Hash password with salt (คืน "pbkdf2_sha256$<iterations>$<hex>", salt)"""
     if salt is None:
         salt = secrets.token_hex(16)
-    
-    # Use SHA-256 with salt
-    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    password_hash = hash_obj.hex()
-    
+    if iterations is None:
+        iterations = PASSWORD_HASH_ITERATIONS
+
+    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations)
+    password_hash = f"{_HASH_SCHEME}${iterations}${hash_obj.hex()}"
+
     return password_hash, salt
 
 def verify_password(password: str, password_hash: str, salt: str) -> bool:
     """Verify password against hash"""
-    new_hash, _ = hash_password(password, salt)
-    return new_hash == password_hash
+    iterations, digest = _parse_hash(password_hash)
+    new_digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations).hex()
+    return hmac.compare_digest(new_digest, digest)
 
-def create_user(db: Session, username: str, email: str, password: str, role: str = "user") -> Optional[User]:
-    """Create a new user"""
-    # Check if user already exists
-    existing_user = db.query(User).filter(
+def needs_rehash(password_hash: str) -> bool:
+    """True ถ้า hash ใช้จำนวนรอบไม่ตรงกับ PASSWORD_HASH_ITERATIONS ปัจจุบัน"""
+    iterations, _ = _parse_hash(password_hash)
+    return iterations != PASSWORD_HASH_ITERATIONS
+
+def _user_exists(db: Session, username: str, email: str) -> bool:
+    return db.query(User.id).filter(
         (User.username == username) | (User.email == email)
-    ).first()
-    
-    if existing_user:
-        return None
-    
-    # Hash password
-    password_hash, salt = hash_password(password)
-    
-    # Create user
+    ).first() is not None
+
+def _insert_user(db: Session, username: str, email: str, password_hash: str, salt: str, role: str) -> User:
     user = User(
         username=username,
         email=email,
@@ -45,43 +93,70 @@ def create_user(db: Session, username: str, email: str, password: str, role: str
         role=role,
         is_active=True
     )
-    
+
     db.add(user)
     db.commit()
     db.refresh(user)
-    
+
     return user
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate user with username and password"""
-    user = db.query(User).filter(User.username == username).first()
-    
-    if not user:
+def create_user(db: Session, username: str, email: str, password: str, role: str = "user") -> Optional[User]:
+    """Create a new user"""
+    # Check if user already exists
+    if _user_exists(db, username, email):
         return None
-    
-    if not user.is_active:
+
+    password_hash, salt = hash_password(password)
+    return _insert_user(db, username, email, password_hash, salt, role)
+
+async def create_user_async(db: Session, username: str, email: str, password: str, role: str = "user") -> Optional[User]:
+    """เหมือน create_user แต่ hash password ใน KDF pool (ไม่บล็อก event loop)"""
+    if _user_exists(db, username, email):
         return None
-    
-    if not verify_password(password, user.password_hash, user.salt):
+
+    password_hash, salt = await kdf_pool.run(hash_password, password)
+    return _insert_user(db, username, email, password_hash, salt, role)
+
+def _get_login_user(db: Session, username: str) -> Optional[User]:
+    user = db.query(User).filter(User.username == username).first()
+    if not user or not user.is_active:
         return None
-    
+    return user
+
+def _finish_login(db: Session, user: User, new_hash: Optional[tuple[str, str]] = None) -> User:
+    if new_hash:
+        user.password_hash, user.salt = new_hash
     # Update last login
     user.last_login = datetime.utcnow()
     db.commit()
-    
     return user
 
-def generate_session_token() -> str:
-    """Generate a secure session token"""
-    return secrets.token_urlsafe(32)
-
-
-
-
-
+def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+    """Authenticate user with username and password"""
+    user = _get_login_user(db, username)
+    if not user:
+        return None
 
+    if not verify_password(password, user.password_hash, user.salt):
+        return None
 
+    new_hash = hash_password(password) if needs_rehash(user.password_hash) else None
+    return _finish_login(db, user, new_hash)
 
+async def authenticate_user_async(db: Session, username: str, password: str) -> Optional[User]:
+    """เหมือน authenticate_user แต่ตรวจ/อัปเกรด hash ใน KDF pool"""
+    user = _get_login_user(db, username)
+    if not user:
+        return None
 
+    if not await kdf_pool.run(verify_password, password, user.password_hash, user.salt):
+        return None
 
+    new_hash = None
+    if needs_rehash(user.password_hash):
+        new_hash = await kdf_pool.run(hash_password, password)
+    return _finish_login(db, user, new_hash)
 
+def generate_session_token() -> str:
+    """Generate a secure session token"""
+    return secrets.token_urlsafe(32)
@@ -0,0 +1,125 @@
+# api/cascade.py
+"""
+งบเวลา (latency budget) ของ cascade การอ่านป้าย: reader -> character segmentation -> OCR เต็มป้าย
+- งบต่อ request: header X-Latency-Budget-Ms > budget_ms ของ lane (GATE_LANES) > DETECT_BUDGET_MS
+  (0 / ไม่ตั้ง = ไม่จำกัด เช่นงาน /detect-video) นับจากตอนรับ request
+- จับเวลาทุก stage; ก่อนเริ่ม fallback ดูว่าเวลาที่เหลือพอกับเวลาที่ stage นั้นน่าจะใช้ไหม
+  (ค่าประมาณ = EWMA ของเวลาที่ใช้จริง หรือ CASCADE_STAGE_BUDGET_MS ถ้าตั้งไว้) ไม่พอ = ข้าม
+- stage ที่เริ่มแล้วได้ deadline = min(deadline ของ request, เริ่ม + งบของ stage)
+  OCR / segmentation เช็คระหว่างทาง เลยเวลาก็หยุด (ตัดทิ้ง) แล้วใช้ผลดีที่สุดที่มี
+- มี stage ถูกข้ามหรือตัด -> degraded=True ในผลลัพธ์
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from .metrics import STAGE_SECONDS
+from .tracing import span
+from .logger import get_logger
+
+log = get_logger("cascade")
+
+DETECT_BUDGET_MS = float(os.getenv("DETECT_BUDGET_MS", "0"))
+# เช่น {"segmentation": 150, "ocr": 400}: เพดานเวลาของแต่ละ stage (ms) ใช้เป็นค่าประมาณตอนตัดสินใจด้วย
+CASCADE_STAGE_BUDGET_MS: dict[str, float] = {
+    k: float(v) for k, v in json.loads(os.getenv("CASCADE_STAGE_BUDGET_MS", "") or "{}").items()
+}
+_EWMA_ALPHA = 0.2
+
+_expected_lock = threading.Lock()
+_expected_ms: dict[str, float] = {}  # EWMA ของเวลาที่ stage ใช้จริง (เฉพาะครั้งที่ทำจนจบ)
+
+def expected_ms(stage: str) -> float:
+    """เวลาที่คาดว่า stage จะใช้: เพดานที่ตั้งไว้ หรือค่าที่เรียนรู้จากรอบก่อนๆ (ยังไม่เคยรัน = 0)"""
+    if stage in CASCADE_STAGE_BUDGET_MS:
+        return CASCADE_STAGE_BUDGET_MS[stage]
+    return _expected_ms.get(stage, 0.0)
+
+def _observe(stage: str, ms: float):
+    with _expected_lock:
+        prev = _expected_ms.get(stage)
+        _expected_ms[stage] = ms if prev is None else prev + _EWMA_ALPHA * (ms - prev)
+
+def resolve_budget_ms(header_value: Optional[str] = None, lane=None) -> Optional[float]:
+    """header > budget_ms ของ lane > DETECT_BUDGET_MS คืน None = ไม่จำกัด"""
+    for value in (header_value, getattr(lane, "budget_ms", None), DETECT_BUDGET_MS):
+        if value in (None, ""):
+            continue
+        try:
+            budget = float(value)
+        except (TypeError, ValueError):
+            continue
+        return budget if budget > 0 else None
+    return None
+
+class Cascade:
+    """ติดตามเวลาของ request หนึ่งรายการเทียบกับงบ"""
+
+    def __init__(self, budget_ms: Optional[float] = None, t0: Optional[float] = None, path: str = "detect"):
+        self.path = path  # label ของ lpr_stage_seconds
+        self.budget_ms = budget_ms if budget_ms and budget_ms > 0 else None
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.deadline = None if self.budget_ms is None else self.t0 + self.budget_ms / 1000
+        self.stages: dict[str, float] = {}
+        self.skipped: list[str] = []
+        self.cancelled: list[str] = []
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return (self.deadline - time.perf_counter()) * 1000
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.skipped or self.cancelled)
+
+    def should_run(self, stage: str) -> bool:
+        """มีเวลาพอสำหรับ stage นี้ไหม ไม่พอ = บันทึกว่าข้าม"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return True
+        need = expected_ms(stage)
+        if remaining > 0 and remaining >= need:
+            return True
+        self.skipped.append(stage)
+        log.info("[CASCADE] ⏭️ skip %s: %.0f ms left, needs ~%.0f ms", stage, remaining, need)
+        return False
+
+    @contextmanager
+    def stage(self, name: str, cancellable: bool = True):
+        """
+        จับเวลา stage แล้ว yield deadline ของ stage (perf_counter, None = ไม่จำกัด)
+        ให้ฟังก์ชันที่รองรับ deadline หยุดเองเมื่อเลยเวลา
+        cancellable=False: stage หลักที่ต้องทำจนจบ (detector / reader) จับเวลาอย่างเดียว
+        """
+        start = time.perf_counter()
+        deadline = self.deadline
+        if name in CASCADE_STAGE_BUDGET_MS:
+            stage_deadline = start + CASCADE_STAGE_BUDGET_MS[name] / 1000
+            deadline = stage_deadline if deadline is None else min(deadline, stage_deadline)
+        try:
+            with span(name, path=self.path):
+                yield deadline
+        finally:
+            end = time.perf_counter()
+            ms = (end - start) * 1000
+            STAGE_SECONDS.labels(self.path, name).observe(end - start)
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+            if cancellable and deadline is not None and end >= deadline:
+                self.cancelled.append(name)
+                log.info("[CASCADE] ✂️ %s cut at %.0f ms", name, ms)
+            else:
+                _observe(name, ms)
+
+    def summary(self) -> dict:
+        return {
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+            "stages": {k: round(v, 1) for k, v in self.stages.items()},
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "degraded": self.degraded,
+        }
@@ -2,11 +2,15 @@
 Character Segmentation and OCR
 แยกตัวอักษรทีละตัวจากป้ายทะเบียน แล้วค่อย OCR แต่ละตัว
 """
+import time
 import cv2
 import numpy as np
 from typing import List, Tuple, Dict, Optional
 from .local_models import infer_reader
 from .ocr import _tess, _clean, _sharp, _clahe, _th_otsu, _th_adapt, TESS_LANG, WHITE_LIST
+from .logger import get_logger
+
+log = get_logger("segmentation")
 
 def sort_characters_by_position(char_boxes: List[Dict]) -> List[Dict]:
     """
@@ -265,7 +269,8 @@ def read_character_with_model(char_img: np.ndarray) -> Tuple[str, float]:
     
     # ถ้ามี high confidence prediction ให้ใช้เลย
     if best_high_conf:
-        print(f"DEBUG: Model read '{best_high_conf['char']}' (conf={best_high_conf['confidence']:.2f}, variant={best_high_conf['variant']}) [HIGH CONF]", flush=True)
+        log.debug("Model read '%s' (conf=%.2f, variant=%s) [HIGH CONF]",
+                  best_high_conf['char'], best_high_conf['confidence'], best_high_conf['variant'])
         return best_high_conf['char'], best_high_conf['confidence']
     
     # เลือกผลลัพธ์ที่ดีที่สุด
@@ -339,13 +344,14 @@ def ocr_single_character(char_img: np.ndarray, char_class: Optional[str] = None,
         cleaned_class = char_class.strip()
         
         if len(cleaned_class) == 1 and cleaned_class in WHITE_LIST:
-            print(f"DEBUG: Using initial detection class '{cleaned_class}' (conf={model_confidence:.2f})", flush=True)
+            log.debug("Using initial detection class '%s' (conf=%.2f)", cleaned_class, model_confidence)
             return cleaned_class
         
         if len(cleaned_class) > 1:
             first_char = cleaned_class[0]
             if first_char in WHITE_LIST:
-                print(f"DEBUG: Using first char '{first_char}' from initial detection '{cleaned_class}' (conf={model_confidence:.2f})", flush=True)
+                log.debug("Using first char '%s' from initial detection '%s' (conf=%.2f)",
+                          first_char, cleaned_class, model_confidence)
                 return first_char
     
     # ===== Priority 3: ใช้ OCR เป็น Fallback สุดท้าย =====
@@ -385,12 +391,12 @@ def ocr_single_character(char_img: np.ndarray, char_class: Optional[str] = None,
     if not best_text and char_class:
         cleaned_class = char_class.strip()
         if len(cleaned_class) == 1 and cleaned_class in WHITE_LIST:
-            print(f"DEBUG: Using model class '{cleaned_class}' as final fallback (conf={model_confidence:.2f})", flush=True)
+            log.debug("Using model class '%s' as final fallback (conf=%.2f)", cleaned_class, model_confidence)
             return cleaned_class
     
     return best_text[:1] if best_text else ""
 
-def read_plate_by_characters(plate_img: np.ndarray) -> Tuple[str, List[Dict]]:
+def read_plate_by_characters(plate_img: np.ndarray, deadline: Optional[float] = None) -> Tuple[str, List[Dict]]:
     """
     อ่านป้ายทะเบียนโดยแยกตัวอักษรทีละตัวก่อน
     
@@ -402,6 +408,7 @@ def read_plate_by_characters(plate_img: np.ndarray) -> Tuple[str, List[Dict]]:
     
     Args:
         plate_img: ภาพป้ายทะเบียนที่ crop แล้ว
+        deadline: time.perf_counter ที่ต้องเสร็จ เลยเวลาระหว่างอ่านทีละตัว = ยกเลิก คืน ("", [])
         
     Returns:
         (plate_text, character_details)
@@ -440,6 +447,8 @@ def read_plate_by_characters(plate_img: np.ndarray) -> Tuple[str, List[Dict]]:
         
         if char_img is None or char_img.size == 0:
             continue
+        if deadline is not None and time.perf_counter() >= deadline:
+            return "", []  # อ่านไม่ครบทุกตัว ข้อความครึ่งๆ กลางๆ ใช้ไม่ได้
         
         # ใช้ Reader Model อ่านตัวอักษรที่ตัดแล้วโดยตรง
         char_text = ocr_single_character(char_img, char_class=initial_class, model_confidence=initial_conf)
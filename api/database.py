@@ -18,8 +18,8 @@ if not DATABASE_URL:
 # 3) สร้าง engine + session ให้รองรับทั้ง Postgres/SQLite
 engine_kwargs = dict(
     pool_pre_ping=True,
-    pool_size=10,  # เพิ่ม pool size
-    max_overflow=20,  # เพิ่ม overflow
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),  # เพิ่ม pool size (เลือกจากผล benchmarks/bench_load.py)
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),  # เพิ่ม overflow
     pool_recycle=3600,  # Recycle connections after 1 hour
     pool_timeout=30
 )
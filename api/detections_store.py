@@ -0,0 +1,65 @@
+# api/detections_store.py
+"""
+เก็บผล detection ดิบ (reader / detector / character_details) แบบบีบอัด
+แยกออกจากตาราง plate_records เพื่อให้ query รายการเบาลง
+โหลดเฉพาะตอนเปิดดูรายละเอียด (/api/records/{id})
+"""
+import os
+import json
+import zlib
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:  # msgpack เป็น optional - ถ้าไม่มีใช้ JSON แทน
+    msgpack = None
+
+from .models import PlateDetection, PlateRecord
+from .logger import get_logger
+
+log = get_logger("detections")
+
+DETECTIONS_ENCODING = os.getenv("DETECTIONS_ENCODING", "msgpack")  # msgpack | json
+DETECTIONS_ZLIB_LEVEL = int(os.getenv("DETECTIONS_ZLIB_LEVEL", "6"))
+
+def encode_detections(data: Any) -> tuple[str, bytes]:
+    """แปลง dict ของผล detection เป็น (encoding, payload ที่บีบอัดแล้ว)"""
+    if DETECTIONS_ENCODING == "msgpack" and msgpack is not None:
+        raw = msgpack.packb(data, use_bin_type=True)
+        encoding = "msgpack+z"
+    else:
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        encoding = "json+z"
+    return encoding, zlib.compress(raw, DETECTIONS_ZLIB_LEVEL)
+
+def decode_detections(encoding: str, payload: bytes) -> Any:
+    """แปลง payload กลับเป็น dict"""
+    raw = zlib.decompress(payload)
+    if encoding.startswith("msgpack"):
+        if msgpack is None:
+            raise RuntimeError("msgpack is required to decode this record (pip install msgpack)")
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw.decode("utf-8"))
+
+def make_detection_row(data: Any) -> PlateDetection:
+    """สร้างแถว plate_detections สำหรับผูกกับ PlateRecord.detections"""
+    encoding, payload = encode_detections(data)
+    return PlateDetection(encoding=encoding, payload=payload)
+
+def load_detections(record: PlateRecord) -> Optional[Any]:
+    """อ่านผล detection ของ record (รองรับแถวเก่าที่ยังเก็บใน detections_json)"""
+    row = record.detections
+    if row is not None:
+        try:
+            return decode_detections(row.encoding, row.payload)
+        except Exception as e:
+            log.error("ERROR decoding detections for record %s: %s", record.id, e)
+            return None
+
+    legacy = record.detections_json
+    if legacy:
+        try:
+            return json.loads(legacy)
+        except Exception:
+            return legacy
+    return None
@@ -0,0 +1,392 @@
+# api/event_bus.py
+"""
+Event bus สำหรับส่ง event (detection / gate) ข้าม uvicorn worker
+- แต่ละ worker ส่ง event ให้ WebSocket client ของตัวเองทันที แล้ว publish ลง bus
+- worker อื่นรับจาก bus แล้วส่งต่อให้ client ของตัวเอง (ข้าม event ที่ตัวเองเป็นคนส่ง)
+- event ที่มาพร้อมกันเป็นชุดจะถูกรวมส่งเป็น batch เดียว
+- วัด fan-out lag (เวลาตั้งแต่ publish จนถึง worker ปลายทาง)
+
+EVENT_BUS_BACKEND:
+  local     - worker เดียว (ค่าเริ่มต้น ไม่มีการส่งข้าม process)
+  unix      - broker ผ่าน Unix socket บนเครื่องเดียวกัน (worker แรกที่ได้ lock เป็น broker)
+  postgres  - PostgreSQL LISTEN/NOTIFY (ใช้ DATABASE_URL เดิม)
+  redis     - Redis pub/sub (ถ้าไม่มี package redis จะใช้ unix broker แทน)
+"""
+import os
+import json
+import time
+import fcntl
+import asyncio
+from collections import deque
+from typing import Callable, Iterator, Optional
+from uuid import uuid4
+
+from .logger import get_logger
+
+log = get_logger("bus")
+
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "local")  # local | unix | postgres | redis
+EVENT_BUS_SOCKET = os.getenv("EVENT_BUS_SOCKET", "/tmp/thai_lpr_events.sock")
+EVENT_BUS_CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "thai_lpr_events")
+EVENT_BUS_REDIS_URL = os.getenv("EVENT_BUS_REDIS_URL", "redis://localhost:6379/0")
+EVENT_BUS_BATCH_MS = float(os.getenv("EVENT_BUS_BATCH_MS", "0"))  # รอรวม batch เพิ่ม (0 = รวมเฉพาะที่ค้างอยู่)
+EVENT_BUS_BATCH_MAX = int(os.getenv("EVENT_BUS_BATCH_MAX", "64"))
+EVENT_BUS_QUEUE_MAX = int(os.getenv("EVENT_BUS_QUEUE_MAX", "1024"))
+
+_MAX_LINE_BYTES = 4 * 1024 * 1024
+_PEER_BUFFER_MAX = 1024 * 1024
+_PG_NOTIFY_MAX = 7900  # payload ของ NOTIFY ต้องไม่เกิน 8000 bytes
+
+def _encode_envelope(origin: str, events: list) -> str:
+    return json.dumps({"o": origin, "e": events}, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class EventBus:
+    """ฐานของทุก backend: คิวขาออก + batching + สถิติ lag"""
+
+    max_payload: Optional[int] = None
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid4().hex[:8]}"
+        self._deliver: Optional[Callable[[dict], None]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self.published = 0
+        self.dropped = 0
+        self.batches_sent = 0
+        self.send_errors = 0
+        self.received = 0
+        self.lag_max_ms = 0.0
+        self._lag_sum_ms = 0.0
+        self._recent_lag_ms: deque[float] = deque(maxlen=256)
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    async def start(self, deliver: Callable[[dict], None]):
+        """deliver = ฟังก์ชันส่ง event ให้ client ใน worker นี้ (เช่น manager.publish_local)"""
+        self._deliver = deliver
+        self._queue = asyncio.Queue(maxsize=EVENT_BUS_QUEUE_MAX)
+        self._tasks = [asyncio.create_task(self._sender()), asyncio.create_task(self._run())]
+        log.info("[BUS] ✅ %s started (origin=%s)", self.name, self.origin)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+
+    def publish(self, message: dict):
+        """ส่ง event ให้ worker อื่น (ไม่ block - ถ้าคิวเต็มจะทิ้ง)"""
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait([time.time(), message])
+            self.published += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if EVENT_BUS_BATCH_MS > 0:
+                deadline = loop.time() + EVENT_BUS_BATCH_MS / 1000
+                while len(batch) < EVENT_BUS_BATCH_MAX:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            while len(batch) < EVENT_BUS_BATCH_MAX and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            for payload in self._frames(batch):
+                try:
+                    await self._send(payload)
+                    self.batches_sent += 1
+                except Exception as e:
+                    self.send_errors += 1
+                    log.warning("[BUS] ⚠️ Publish failed (%s): %s", self.name, e)
+
+    def _frames(self, batch: list) -> Iterator[str]:
+        """แบ่ง batch ให้แต่ละ payload ไม่เกิน max_payload (ถ้า backend มีข้อจำกัด)"""
+        if self.max_payload is None:
+            yield _encode_envelope(self.origin, batch)
+            return
+        chunk: list = []
+        for item in batch:
+            candidate = _encode_envelope(self.origin, chunk + [item])
+            if len(candidate.encode("utf-8")) <= self.max_payload:
+                chunk.append(item)
+                continue
+            if chunk:
+                yield _encode_envelope(self.origin, chunk)
+            chunk = [item]
+            if len(_encode_envelope(self.origin, chunk).encode("utf-8")) > self.max_payload:
+                self.dropped += 1
+                log.warning("[BUS] ⚠️ Event too large for %s, not relayed", self.name)
+                chunk = []
+        if chunk:
+            yield _encode_envelope(self.origin, chunk)
+
+    def _receive(self, payload):
+        try:
+            envelope = json.loads(payload)
+        except (ValueError, TypeError):
+            return
+        if envelope.get("o") == self.origin:
+            return  # ส่งให้ client ของตัวเองไปแล้วตอน publish
+        now = time.time()
+        for sent_at, message in envelope.get("e", ()):
+            lag_ms = max(0.0, (now - sent_at) * 1000)
+            self._lag_sum_ms += lag_ms
+            self._recent_lag_ms.append(lag_ms)
+            if lag_ms > self.lag_max_ms:
+                self.lag_max_ms = lag_ms
+            self.received += 1
+            self._deliver(message)
+
+    async def _send(self, payload: str):
+        raise NotImplementedError
+
+    async def _run(self):
+        """รับ event จาก worker อื่น (ทำงานตลอดอายุ process)"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        recent = sorted(self._recent_lag_ms)
+        return {
+            "backend": self.name,
+            "origin": self.origin,
+            "published": self.published,
+            "dropped": self.dropped,
+            "batches_sent": self.batches_sent,
+            "send_errors": self.send_errors,
+            "received": self.received,
+            "queue_pending": self._queue.qsize() if self._queue else 0,
+            "lag_ms_avg": round(self._lag_sum_ms / self.received, 2) if self.received else 0.0,
+            "lag_ms_p95": round(recent[int(0.95 * (len(recent) - 1))], 2) if recent else 0.0,
+            "lag_ms_max": round(self.lag_max_ms, 2),
+        }
+
+class LocalBus(EventBus):
+    """worker เดียว - ไม่มีอะไรต้องส่งข้าม process"""
+
+    async def start(self, deliver: Callable[[dict], None]):
+        self._deliver = deliver
+
+    def publish(self, message: dict):
+        self.published += 1
+
+class UnixSocketBus(EventBus):
+    """
+    broker บน Unix socket สำหรับหลาย worker บนเครื่องเดียวกัน
+    worker ที่ได้ flock ของ <socket>.lock จะเปิด broker, ทุก worker (รวมตัว broker) ต่อเป็น client
+    ถ้า worker ที่เป็น broker ตาย lock จะหลุดและ worker อื่นขึ้นมาแทน
+    """
+
+    def __init__(self, path: str = EVENT_BUS_SOCKET):
+        super().__init__()
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_fd: Optional[int] = None
+        self._peers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def is_broker(self) -> bool:
+        return self._server is not None
+
+    async def _try_become_broker(self) -> bool:
+        if self._server is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            os.unlink(self.path)  # socket ค้างจาก broker ที่ตายไปแล้ว
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path, limit=_MAX_LINE_BYTES)
+        self._lock_fd = fd
+        log.info("[BUS] 📡 This worker is the event broker (%s)", self.path)
+        return True
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for peer in list(self._peers):
+                    if peer is writer:
+                        continue
+                    if peer.transport.get_write_buffer_size() > _PEER_BUFFER_MAX:
+                        # peer ไม่อ่าน - ตัดทิ้งแทนที่จะให้ buffer โตไม่จำกัด
+                        self._peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass  # peer หลุด หรือ broker กำลังปิด
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _run(self):
+        backoff = 0.2
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=_MAX_LINE_BYTES)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not await self._try_become_broker():
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 5.0)
+                continue
+            backoff = 0.2
+            self._writer = writer
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._receive(line)
+            except (ConnectionError, ValueError) as e:
+                log.warning("[BUS] ⚠️ Broker connection lost: %s", e)
+            finally:
+                self._writer = None
+                writer.close()
+
+    async def _send(self, payload: str):
+        writer = self._writer
+        if writer is None:
+            raise ConnectionError("not connected to broker")
+        writer.write(payload.encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def close(self):
+        await super().close()
+        for peer in list(self._peers):
+            peer.close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+class PostgresBus(EventBus):
+    """PostgreSQL LISTEN/NOTIFY (connection แยก 2 เส้น: listen และ notify)"""
+
+    max_payload = _PG_NOTIFY_MAX
+
+    def __init__(self, dsn: str, channel: str = EVENT_BUS_CHANNEL):
+        super().__init__()
+        self.dsn = dsn.replace("postgresql+psycopg://", "postgresql://", 1)
+        self.channel = channel
+        self._pub = None
+
+    async def _run(self):
+        import psycopg
+        from psycopg import sql
+
+        backoff = 0.5
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    backoff = 0.5
+                    async for notify in conn.notifies():
+                        self._receive(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("[BUS] ⚠️ LISTEN connection lost: %s, retrying in %.1fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+
+    async def _send(self, payload: str):
+        import psycopg
+
+        if self._pub is None or self._pub.closed:
+            self._pub = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        try:
+            await self._pub.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+        except Exception:
+            await self._pub.close()
+            self._pub = None
+            raise
+
+    async def close(self):
+        await super().close()
+        if self._pub is not None:
+            await self._pub.close()
+            self._pub = None
+
+class RedisBus(EventBus):
+    """Redis pub/sub"""
+
+    def __init__(self, url: str = EVENT_BUS_REDIS_URL, channel: str = EVENT_BUS_CHANNEL):
+        super().__init__()
+        import redis.asyncio as aioredis
+
+        self.channel = channel
+        self._redis = aioredis.from_url(url)
+
+    async def _run(self):
+        backoff = 0.5
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                backoff = 0.5
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "message":
+                        self._receive(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("[BUS] ⚠️ Redis subscription lost: %s, retrying in %.1fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+
+    async def _send(self, payload: str):
+        await self._redis.publish(self.channel, payload)
+
+    async def close(self):
+        await super().close()
+        await self._redis.aclose()
+
+def create_event_bus(backend: str = EVENT_BUS_BACKEND) -> EventBus:
+    if backend == "unix":
+        return UnixSocketBus()
+    if backend == "postgres":
+        from .database import DATABASE_URL
+        if not DATABASE_URL.startswith("postgresql"):
+            log.warning("[BUS] ⚠️ EVENT_BUS_BACKEND=postgres needs a PostgreSQL DATABASE_URL, using local")
+            return LocalBus()
+        return PostgresBus(DATABASE_URL)
+    if backend == "redis":
+        try:
+            return RedisBus()
+        except ImportError:
+            log.warning("[BUS] ⚠️ redis package not installed, using the Unix-socket broker as a local stand-in")
+            return UnixSocketBus()
+    if backend != "local":
+        log.warning("[BUS] ⚠️ Unknown EVENT_BUS_BACKEND=%s, using local", backend)
+    return LocalBus()
@@ -0,0 +1,281 @@
+# api/gate_decision.py
+"""
+ตัดสินใจเปิดไม้ (gate decision engine)
+- allowlist / denylist ของป้ายเต็ม: set ของป้ายที่ normalize แล้ว (lookup O(1))
+- prefix ที่อนุญาต: trie (เดินตามตัวอักษรของป้ายแค่ความยาว prefix)
+  รวมจาก ALLOWED_PREFIXES (env) + ตาราง gate_rules
+- cooldown ต่อป้าย: TTL map (dict + expiry heap) ใน process หรือใช้ตาราง gate_cooldowns ร่วมกันหลาย worker
+- rules ใน DB reload อัตโนมัติทุก GATE_RULES_RELOAD_SEC (ไม่ต้อง restart) - reload ทำใน background thread
+  แล้วสลับ snapshot ทั้งก้อน ตัว decide() ไม่ต้องล็อก
+  รู้ว่า rules เปลี่ยนจากตัวนับใน gate_rules_version (bump_rules_version ใน transaction เดียวกับการเพิ่ม/ลบ)
+"""
+import os
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal
+from .models import GateRule, GateRulesVersion, GateCooldown
+from .logger import get_logger
+
+log = get_logger("gate")
+
+FORCE_OPEN_ALWAYS = os.getenv("FORCE_OPEN_ALWAYS", "0") == "1"
+GATE_TRIGGER_MODE = os.getenv("GATE_TRIGGER_MODE", "every_record")  # every_record | per_plate_cooldown
+OPEN_COOLDOWN_SEC = int(os.getenv("OPEN_COOLDOWN_SEC", "10"))
+ALLOWED_PREFIXES  = os.getenv("ALLOWED_PREFIXES", "").strip()  # ex: "กร,กต,กว"
+PLATE_STRICT      = os.getenv("PLATE_STRICT", "0") == "1"
+GATE_COOLDOWN_BACKEND = os.getenv("GATE_COOLDOWN_BACKEND", "memory")  # memory | database
+GATE_RULES_RELOAD_SEC = float(os.getenv("GATE_RULES_RELOAD_SEC", "5"))
+
+RULE_KINDS = ("allow", "deny", "prefix")
+
+def normalize_plate(s: str) -> str:
+    # เอาเว้นวรรค/ขีด/แท่งที่อาจกวนออก เพื่อเทียบ prefix/cooldown ได้
+    return "".join(ch for ch in s if ch.isalnum())
+
+class PrefixTrie:
+    """trie ของ prefix ที่อนุญาต - has_prefix_of(plate) เดินแค่ความยาว prefix ที่ยาวที่สุด"""
+
+    _END = ""  # key พิเศษ: มี prefix จบที่ node นี้
+
+    def __init__(self, prefixes=()):
+        self._root: dict = {}
+        self.size = 0
+        for p in prefixes:
+            self.add(p)
+
+    def add(self, prefix: str):
+        prefix = normalize_plate(prefix)
+        if not prefix:
+            return
+        node = self._root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        if self._END not in node:
+            node[self._END] = True
+            self.size += 1
+
+    def has_prefix_of(self, plate_norm: str) -> bool:
+        node = self._root
+        for ch in plate_norm:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+class _Rules:
+    """snapshot ของ rules (สร้างใหม่ทั้งก้อนตอน reload)"""
+
+    __slots__ = ("allow", "deny", "prefixes", "version")
+
+    def __init__(self, allow=(), deny=(), prefixes=(), version=None):
+        self.allow = frozenset(allow)
+        self.deny = frozenset(deny)
+        self.prefixes = PrefixTrie(prefixes)
+        self.version = version
+
+def bump_rules_version(db):
+    """เพิ่มเวอร์ชันของ rules (เรียกก่อน commit ของการเพิ่ม/ลบ rule)"""
+    bumped = db.query(GateRulesVersion).filter(GateRulesVersion.id == 1).update(
+        {GateRulesVersion.version: GateRulesVersion.version + 1}, synchronize_session=False)
+    if bumped:
+        return
+    try:
+        with db.begin_nested():
+            db.add(GateRulesVersion(id=1, version=1))
+    except IntegrityError:
+        # worker อื่นเพิ่งสร้างแถวไป
+        db.query(GateRulesVersion).filter(GateRulesVersion.id == 1).update(
+            {GateRulesVersion.version: GateRulesVersion.version + 1}, synchronize_session=False)
+
+class MemoryCooldown:
+    """TTL map ต่อป้ายใน process (dict + heap ของเวลาหมดอายุ ไม่โตไม่จำกัด)"""
+
+    def __init__(self, ttl_sec: float):
+        self.ttl_sec = ttl_sec
+        self._until: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            until, plate = heapq.heappop(heap)
+            if self._until.get(plate) == until:
+                del self._until[plate]
+
+    def claim(self, plate_norm: str) -> Optional[float]:
+        """None = ผ่าน (และเริ่ม cooldown ใหม่), ตัวเลข = ยังติด cooldown อีกกี่วินาที"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            until = self._until.get(plate_norm)
+            if until is not None and until > now:
+                return until - now
+            until = now + self.ttl_sec
+            self._until[plate_norm] = until
+            heapq.heappush(self._heap, (until, plate_norm))
+            return None
+
+    def __len__(self) -> int:
+        return len(self._until)
+
+class DatabaseCooldown:
+    """cooldown ในตาราง gate_cooldowns ใช้ร่วมกันทุก worker (claim แบบ atomic ด้วย UPDATE ... WHERE)"""
+
+    def __init__(self, ttl_sec: float):
+        self.ttl_sec = ttl_sec
+        self._next_cleanup = 0.0
+
+    def claim(self, plate_norm: str) -> Optional[float]:
+        now = datetime.utcnow()
+        until = now + timedelta(seconds=self.ttl_sec)
+        db = SessionLocal()
+        try:
+            claimed = db.query(GateCooldown).filter(
+                GateCooldown.plate == plate_norm, GateCooldown.until <= now
+            ).update({GateCooldown.until: until}, synchronize_session=False)
+            if not claimed:
+                db.add(GateCooldown(plate=plate_norm, until=until))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # มีแถวอยู่แล้วและยังไม่หมดเวลา (หรือ worker อื่นเพิ่งได้ไป)
+                    db.rollback()
+                    row = db.get(GateCooldown, plate_norm)
+                    left = (row.until.replace(tzinfo=None) - now).total_seconds() if row else 0.0
+                    return max(left, 0.0)
+            else:
+                db.commit()
+            self._maybe_cleanup(db, now)
+            return None
+        finally:
+            db.close()
+
+    def _maybe_cleanup(self, db, now: datetime):
+        mono = time.monotonic()
+        if mono < self._next_cleanup:
+            return
+        self._next_cleanup = mono + max(self.ttl_sec, 60)
+        db.query(GateCooldown).filter(GateCooldown.until <= now).delete(synchronize_session=False)
+        db.commit()
+
+    def __len__(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.count(GateCooldown.plate)).scalar() or 0
+        finally:
+            db.close()
+
+class GateDecisionEngine:
+    def __init__(self, cooldown_backend: str = GATE_COOLDOWN_BACKEND,
+                 reload_sec: float = GATE_RULES_RELOAD_SEC):
+        self._rules = _Rules(prefixes=ALLOWED_PREFIXES.split(",") if ALLOWED_PREFIXES else ())
+        self.cooldown = DatabaseCooldown(OPEN_COOLDOWN_SEC) if cooldown_backend == "database" else MemoryCooldown(OPEN_COOLDOWN_SEC)
+        self.reload_sec = reload_sec
+        self._next_check = 0.0
+        self._reloading = threading.Lock()
+        self.reloads = 0
+
+    # ---------- rules ----------
+
+    @staticmethod
+    def _rules_version(db) -> tuple:
+        # ตัวนับจาก API + (count, max id) เผื่อแก้ตารางตรงๆ - query เบากว่าโหลดทั้งตาราง
+        # (count, max id) อย่างเดียวไม่พอ: ลบ rule id สูงสุดแล้วเพิ่มใหม่ SQLite ใช้ id เดิมซ้ำ
+        counter = db.query(GateRulesVersion.version).filter(GateRulesVersion.id == 1).scalar() or 0
+        return (counter,) + tuple(db.query(func.count(GateRule.id), func.max(GateRule.id)).one())
+
+    def reload(self, force: bool = False) -> bool:
+        """โหลด rules จาก DB ถ้าเปลี่ยน (force=True โหลดเสมอ) คืน True ถ้าสลับ snapshot"""
+        if not self._reloading.acquire(blocking=False):
+            return False
+        db = SessionLocal()
+        try:
+            version = self._rules_version(db)
+            if not force and version == self._rules.version:
+                return False
+            allow, deny = [], []
+            prefixes = ALLOWED_PREFIXES.split(",") if ALLOWED_PREFIXES else []
+            for kind, value in db.query(GateRule.kind, GateRule.value).all():
+                if kind == "allow":
+                    allow.append(normalize_plate(value))
+                elif kind == "deny":
+                    deny.append(normalize_plate(value))
+                elif kind == "prefix":
+                    prefixes.append(value)
+            self._rules = _Rules(allow, deny, prefixes, version)
+            self.reloads += 1
+            log.info("[GATE] 🔄 Rules loaded: %d allow, %d deny, %d prefixes", len(allow), len(deny), self._rules.prefixes.size)
+            return True
+        except Exception as e:
+            log.error("ERROR loading gate rules: %s", e)
+            return False
+        finally:
+            db.close()
+            self._reloading.release()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self.reload_sec <= 0 or now < self._next_check:
+            return
+        self._next_check = now + self.reload_sec
+        threading.Thread(target=self.reload, name="gate-rules-reload", daemon=True).start()
+
+    # ---------- decision ----------
+
+    def decide(self, plate_text: str, conf: float | None = None) -> Tuple[bool, str]:
+        """ตัดสินใจว่าจะเปิดไม้หรือไม่ (lookup ใน memory ทั้งหมด ยกเว้น cooldown แบบ database)"""
+        self._maybe_reload()
+        if FORCE_OPEN_ALWAYS:
+            return True, "force_open"
+
+        if not plate_text:
+            return False, "empty_plate"
+
+        plate_norm = normalize_plate(plate_text)
+        rules = self._rules
+
+        if plate_norm in rules.deny:
+            return False, f"denylisted plate={plate_norm}"
+
+        allowlisted = plate_norm in rules.allow
+        if PLATE_STRICT and not allowlisted and not rules.prefixes.has_prefix_of(plate_norm):
+            return False, f"prefix_blocked plate={plate_norm} allowed={ALLOWED_PREFIXES}"
+
+        if GATE_TRIGGER_MODE == "every_record":
+            return True, "allowlisted" if allowlisted else "every_record"
+
+        if GATE_TRIGGER_MODE == "per_plate_cooldown":
+            left = self.cooldown.claim(plate_norm)
+            if left is not None:
+                return False, f"cooldown({int(left) + 1}s) plate={plate_norm}"
+            return True, f"cooldown_ok plate={plate_norm}"
+
+        return False, f"unknown_mode({GATE_TRIGGER_MODE})"
+
+    def stats(self) -> dict:
+        rules = self._rules
+        return {
+            "mode": GATE_TRIGGER_MODE,
+            "strict": PLATE_STRICT,
+            "allow": len(rules.allow),
+            "deny": len(rules.deny),
+            "prefixes": rules.prefixes.size,
+            "reloads": self.reloads,
+            "cooldown_backend": type(self.cooldown).__name__,
+        }
+
+gate_engine = GateDecisionEngine()
+
+def should_open(plate_text: str, conf: float | None) -> Tuple[bool, str]:
+    """ตัดสินใจว่าจะเปิดไม้หรือไม่ ตาม ENV และ allow/deny/prefix rules"""
+    return gate_engine.decide(plate_text, conf)
@@ -0,0 +1,181 @@
+# api/gate_link.py
+"""
+เจ้าของ serial link ของไม้กั้นมีได้ process เดียว (หลาย uvicorn worker)
+- เปิด port = Arduino reset (DTR) และ reader thread ของแต่ละ worker จะแย่ง ACK/PONG กันเอง
+  จึงให้ worker เดียวเป็นเจ้าของ link: GATE_LINK_OWNER=auto ใช้ flock ของ GATE_LINK_LOCK (ได้ lock = เจ้าของ)
+  หรือกำหนดเองด้วย GATE_LINK_OWNER=true / false
+- worker อื่นใช้ RemoteGateController: ส่งคำสั่งเป็น {"type": "gate_command"} ทาง event bus
+  เจ้าของ link ส่งต่อให้ GateController ตัวจริงแล้วตอบ {"type": "gate_reply"} กลับมา
+  (ต้องตั้ง EVENT_BUS_BACKEND ที่ไม่ใช่ local ไม่งั้นคำสั่งจาก worker อื่นไปไม่ถึง)
+- worker เจ้าของตาย lock หลุดเอง worker ที่ uvicorn สร้างแทนจะได้เป็นเจ้าของต่อ
+"""
+import os
+import time
+import fcntl
+import asyncio
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .arduino import GateCommand, GateUnavailable, GATE_ACK_TIMEOUT_SEC, ARDUINO_RESET_DELAY_SEC, _end_command_span
+from .tracing import start_span
+from .logger import get_logger
+
+log = get_logger("gate")
+
+GATE_LINK_OWNER = os.getenv("GATE_LINK_OWNER", "auto").lower()  # auto | true | false
+GATE_LINK_LOCK = os.getenv("GATE_LINK_LOCK", "/tmp/thai_lpr_gate_link.lock")
+GATE_LINK_REPLY_GRACE_SEC = 2.0  # เผื่อเวลาส่งข้าม bus ไป-กลับ ก่อนถือว่าไม่มี ACK
+
+_lock_fh = None
+
+def claim_link_owner() -> bool:
+    """True = process นี้เป็นเจ้าของ serial link (ถือ flock ไว้ตลอดอายุ process)"""
+    global _lock_fh
+    if GATE_LINK_OWNER in ("true", "1", "yes"):
+        return True
+    if GATE_LINK_OWNER in ("false", "0", "no"):
+        return False
+    if _lock_fh is not None:
+        return True
+    fh = open(GATE_LINK_LOCK, "a")
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fh.close()
+        return False
+    _lock_fh = fh
+    return True
+
+class RemoteGateController:
+    """
+    แทน GateController ใน worker ที่ไม่ได้เป็นเจ้าของ link (API เดียวกันเท่าที่ lane / main ใช้)
+    คำสั่งไปทาง event bus ผลกลับมาใน future ของ GateCommand เหมือนเดิม ("" = ไม่มี ACK ภายในเวลา)
+    """
+
+    def __init__(self, url: str, baud: int, name: str, origin: str):
+        self.url = url
+        self.baud = baud
+        self.name = name
+        self._origin = origin
+        self._cids = itertools.count(1)
+        self._waiting: dict[str, GateCommand] = {}
+        self._waiting_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._send: Optional[Callable[[dict], None]] = None
+        self._connected = False
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.last_rtt_ms: Optional[float] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop, send: Optional[Callable[[dict], None]]):
+        """send = publish ของ event bus (None = ไม่มี bus ข้าม process ส่งคำสั่งไม่ได้)"""
+        self._loop = loop
+        self._send = send
+
+    def add_listener(self, callback: Callable[[str], None]):
+        pass  # บรรทัดจาก firmware อ่านได้เฉพาะเจ้าของ link (state มาทาง lane_state แทน)
+
+    def start(self, keepalive: bool = False):
+        pass
+
+    def submit(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> GateCommand:
+        command = GateCommand(next(self._cids), cmd, timeout)
+        command.span = start_span("gate.command", cmd=cmd, device=str(self.url), cid=command.cid, remote=True)
+        if command.span is not None:
+            command.future.add_done_callback(lambda _f, c=command: _end_command_span(c))
+        if self._send is None or self._loop is None or self._loop.is_closed():
+            command.fail(GateUnavailable(f"{self.name}: gate link is owned by another worker and no event bus is configured"))
+            return command
+        request_id = f"{self._origin}:{self.name}:{command.cid}"
+        with self._waiting_lock:
+            self._waiting[request_id] = command
+        self._loop.call_soon_threadsafe(self._dispatch, request_id, command)
+        return command
+
+    def _dispatch(self, request_id: str, command: GateCommand):
+        command.sent_at = time.monotonic()
+        self.sent += 1
+        self._send({"type": "gate_command", "id": request_id, "device": self.url,
+                    "cmd": command.cmd, "timeout": command.timeout})
+        self._loop.call_later(command.timeout + ARDUINO_RESET_DELAY_SEC + GATE_LINK_REPLY_GRACE_SEC,
+                              self._expire, request_id)
+
+    def _expire(self, request_id: str):
+        with self._waiting_lock:
+            command = self._waiting.pop(request_id, None)
+        if command is not None:
+            self.timeouts += 1
+            log.warning("[GATE] ⚠️ No reply from the gate link owner for command #%d: %s", command.cid, command.cmd)
+            command.resolve("")
+
+    def on_reply(self, message: dict) -> bool:
+        """(event loop) คำตอบจากเจ้าของ link - คืน True ถ้าเป็นของคำสั่งที่ worker นี้ส่ง"""
+        with self._waiting_lock:
+            command = self._waiting.pop(message.get("id"), None)
+        if command is None:
+            return False
+        if message.get("rtt_ms") is not None:
+            self.last_rtt_ms = message["rtt_ms"]
+        if message.get("error"):
+            command.fail(GateUnavailable(message["error"]))
+            return True
+        response = message.get("response") or ""
+        if response:
+            self.acked += 1
+        command.resolve(response)
+        return True
+
+    async def request(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> str:
+        return await asyncio.wrap_future(self.submit(cmd, timeout).future)
+
+    def request_sync(self, cmd: str, timeout: float = GATE_ACK_TIMEOUT_SEC) -> str:
+        """สำหรับโค้ดที่ไม่ใช่ async (ห้ามเรียกใน event loop)"""
+        return self.submit(cmd, timeout).future.result(timeout + ARDUINO_RESET_DELAY_SEC + GATE_LINK_REPLY_GRACE_SEC + 5)
+
+    def close(self):
+        with self._waiting_lock:
+            waiting, self._waiting = list(self._waiting.values()), {}
+        for command in waiting:
+            command.resolve("")
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def set_connected(self, connected: bool):
+        """ตาม lane_state ที่เจ้าของ link ส่งมา"""
+        self._connected = bool(connected)
+
+    def stats(self) -> dict:
+        return {
+            "device": self.url,
+            "connected": self._connected,
+            "keepalive": False,
+            "queued": len(self._waiting),
+            "awaiting_ack": len(self._waiting),
+            "sent": self.sent,
+            "acked": self.acked,
+            "timeouts": self.timeouts,
+            "rtt_ms_last": self.last_rtt_ms,
+        }
+
+def serve_command(controller, message: dict, loop: asyncio.AbstractEventLoop, send: Callable[[dict], None]):
+    """(เจ้าของ link, event loop) ส่งคำสั่งจาก worker อื่นเข้า GateController ตัวจริง แล้วตอบกลับทาง bus"""
+    request_id = message.get("id")
+    command = controller.submit(str(message.get("cmd") or ""), float(message.get("timeout") or GATE_ACK_TIMEOUT_SEC))
+
+    def reply(future: Future):
+        # เรียกจาก gate reader/writer thread
+        out = {"type": "gate_reply", "id": request_id, "rtt_ms": controller.last_rtt_ms}
+        exc = GateUnavailable("cancelled") if future.cancelled() else future.exception()
+        if exc is not None:
+            out["error"] = str(exc)
+        else:
+            out["response"] = future.result()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(send, out)
+
+    command.future.add_done_callback(reply)
@@ -0,0 +1,163 @@
+# api/gate_outbox.py
+"""
+Outbox ของ gate event - ไม่มีการเปิดไม้ครั้งไหนที่ไม่ถูกบันทึก
+- เขียน event ลงไฟล์ JSONL (append + flush) ก่อน/หลังส่งคำสั่ง gate ซึ่งเร็วกว่ารอ DB มาก
+- worker thread นำ event ลงตาราง gate_events (upsert ด้วย event_id - เขียนซ้ำได้ไม่ซ้ำซ้อน)
+- เมื่อทุกบรรทัดในไฟล์ลง DB แล้วจึงล้างไฟล์ ถ้า process ตายก่อนจะ replay ตอน startup
+"""
+import os
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+from typing import Optional
+
+from .database import SessionLocal
+from .models import GateEvent
+from .logger import get_logger
+
+log = get_logger("gate")
+
+GATE_OUTBOX_PATH = os.getenv("GATE_OUTBOX_PATH", "data/gate_outbox.jsonl")
+GATE_OUTBOX_FSYNC = os.getenv("GATE_OUTBOX_FSYNC", "0") == "1"
+
+_EVENT_FIELDS = (
+    "record_id", "plate_text", "source", "action", "reason", "response",
+    "success", "detect_to_gate_ms", "ack_ms",
+)
+
+class GateOutbox:
+    def __init__(self, path: str = GATE_OUTBOX_PATH, fsync: bool = GATE_OUTBOX_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._fh = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._written = 0    # บรรทัดที่อยู่ในไฟล์ตอนนี้
+        self._persisted = 0  # บรรทัดในไฟล์ที่ลง DB แล้ว
+        self.recorded = 0
+        self.persist_errors = 0
+
+    @staticmethod
+    def new_event(plate_text: str, source: Optional[str] = None, reason: str = "") -> dict:
+        return {
+            "event_id": uuid4().hex,
+            "record_id": None,
+            "plate_text": plate_text,
+            "source": source,
+            "action": "issued",
+            "reason": reason,
+            "response": None,
+            "success": None,
+            "detect_to_gate_ms": None,
+            "ack_ms": None,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+
+    def _open(self):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fh = open(self.path, "a", encoding="utf-8")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gate-outbox", daemon=True)
+            self._thread.start()
+
+    def record(self, event: dict):
+        """บันทึก snapshot ของ event (ทุกบรรทัดเป็น event ครบทุก field - บรรทัดหลังสุดชนะ)"""
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._open()
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            self._written += 1
+            self.recorded += 1
+        self._queue.put(dict(event))
+
+    def replay(self) -> int:
+        """เรียกตอน startup: event ที่ค้างในไฟล์ (process ก่อนตายก่อนลง DB) ส่งเข้า DB อีกครั้ง"""
+        if not os.path.exists(self.path):
+            return 0
+        events = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue  # บรรทัดสุดท้ายที่เขียนไม่ครบตอน crash
+        with self._lock:
+            self._open()
+            self._written += len(events)
+        for event in events:
+            self._queue.put(event)
+        if events:
+            log.info("[GATE] ♻️ Replaying %d gate event(s) from outbox", len(events))
+        return len(events)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # ให้รอบหน้าเลิก หลัง persist batch นี้
+                    break
+                batch.append(item)
+
+            while not self._persist(batch):
+                time.sleep(1.0)  # DB ล่ม - ลองใหม่ event ยังอยู่ในไฟล์
+
+            with self._lock:
+                self._persisted += len(batch)
+                if self._persisted >= self._written and self._fh is not None:
+                    # ทุกบรรทัดลง DB แล้ว ล้างไฟล์ได้
+                    self._fh.truncate(0)
+                    self._fh.seek(0)
+                    self._written = self._persisted = 0
+
+    def _persist(self, batch: list[dict]) -> bool:
+        merged: dict[str, dict] = {}
+        for event in batch:
+            merged[event["event_id"]] = event
+        db = SessionLocal()
+        try:
+            for event_id, event in merged.items():
+                row = db.get(GateEvent, event_id)
+                if row is None:
+                    row = GateEvent(event_id=event_id, created_at=datetime.fromisoformat(event["created_at"]))
+                    db.add(row)
+                for field in _EVENT_FIELDS:
+                    setattr(row, field, event.get(field))
+            db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            self.persist_errors += 1
+            log.error("ERROR persisting gate events: %s", e)
+            return False
+        finally:
+            db.close()
+
+    def pending(self) -> int:
+        return self._written - self._persisted
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+gate_outbox = GateOutbox()
@@ -0,0 +1,174 @@
+# api/image_decode.py
+"""
+Decode ภาพแบบย่อขนาดตั้งแต่ตอน decode (libjpeg scaled decoding)
+- อ่านขนาดภาพจาก header ก่อน แล้วเลือก IMREAD_REDUCED_COLOR_2/4/8 ให้ได้ความกว้างไม่ต่ำกว่า MAX_IMAGE_WIDTH
+  ขนาดคิดหลังหมุนตาม EXIF Orientation แบบที่ cv2.imdecode ทำ (ภาพแนวตั้งจากมือถือ SOF เป็นแนวนอน)
+- ภาพ 12MP จากมือถือไม่ต้อง decode เต็มแล้วค่อย resize
+- ถ้าป้ายในภาพย่อเล็กเกินไป ค่อย decode ใหม่ที่ความละเอียดสูงขึ้นเพื่อ crop ส่งให้ reader
+"""
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .logger import get_logger
+
+log = get_logger("decode")
+
+MAX_IMAGE_WIDTH = int(os.getenv("MAX_IMAGE_WIDTH", "1920"))
+ROI_REDECODE_MIN_WIDTH = int(os.getenv("ROI_REDECODE_MIN_WIDTH", "320"))
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# SOFn markers ที่มีขนาดภาพ (ไม่รวม DHT=C4, JPG=C8, DAC=CC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _exif_orientation(buf: np.ndarray, start: int, end: int) -> int:
+    """ค่า EXIF Orientation (1-8) จาก APP1 segment buf[start:end] ไม่พบ = 1"""
+    data = bytes(buf[start:end])
+    if not data.startswith(b"Exif\x00\x00") or len(data) < 14:
+        return 1
+    tiff = data[6:]
+    order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if order is None:
+        return 1
+    ifd = int.from_bytes(tiff[4:8], order)
+    if ifd + 2 > len(tiff):
+        return 1
+    for k in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+        entry = ifd + 2 + 12 * k
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+            value = int.from_bytes(tiff[entry + 8:entry + 10], order)
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+def _jpeg_size(buf: np.ndarray) -> Optional[tuple[int, int]]:
+    """(width, height) ของภาพหลังหมุนตาม EXIF (ขนาดที่ cv2.imdecode คืน)"""
+    n = len(buf)
+    orientation = 1
+    if n < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = int(buf[i + 1])
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # ไม่มี length
+            i += 2
+            continue
+        length = (int(buf[i + 2]) << 8) | int(buf[i + 3])
+        if marker == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(buf, i + 4, min(n, i + 2 + length))
+        if marker in _JPEG_SOF:
+            h = (int(buf[i + 5]) << 8) | int(buf[i + 6])
+            w = (int(buf[i + 7]) << 8) | int(buf[i + 8])
+            return (h, w) if orientation >= 5 else (w, h)  # 5-8 = หมุน 90/270
+        if marker == 0xDA or length < 2:  # เริ่ม scan data แล้วแต่ยังไม่เจอ SOF
+            return None
+        i += 2 + length
+    return None
+
+def _png_size(buf: np.ndarray) -> Optional[tuple[int, int]]:
+    if len(buf) < 24 or bytes(buf[:8]) != b"\x89PNG\r\n\x1a\n":
+        return None
+    w = int.from_bytes(bytes(buf[16:20]), "big")
+    h = int.from_bytes(bytes(buf[20:24]), "big")
+    return w, h
+
+def image_size(buf: np.ndarray) -> Optional[tuple[int, int]]:
+    """(width, height) จาก header ของไฟล์ (JPEG/PNG) โดยไม่ decode"""
+    return _jpeg_size(buf) or _png_size(buf)
+
+def pick_reduce_factor(width: int, target_width: int) -> int:
+    """factor ที่ใหญ่ที่สุด (8/4/2) ที่ยังได้ความกว้าง >= target_width"""
+    for factor in (8, 4, 2):
+        if width // factor >= target_width:
+            return factor
+    return 1
+
+class DecodedImage:
+    """ภาพสำหรับ detector + buffer เดิมไว้ decode ROI ความละเอียดสูงภายหลัง"""
+
+    def __init__(self, img: np.ndarray, buf: Optional[np.ndarray] = None, is_jpeg: bool = False, full_width: int = 0):
+        self.img = img
+        self.buf = buf
+        self.is_jpeg = is_jpeg
+        self.full_width = full_width or img.shape[1]
+
+    def release(self):
+        """ปล่อย buffer (เช่น spool ของ upload) เมื่อไม่ต้อง decode ซ้ำแล้ว"""
+        self.buf = None
+
+def resize_to_width(img: np.ndarray, max_width: int = MAX_IMAGE_WIDTH) -> np.ndarray:
+    H, W = img.shape[:2]
+    if W <= max_width:
+        return img
+    scale = max_width / W
+    return cv2.resize(img, (max_width, int(H * scale)), interpolation=cv2.INTER_AREA)
+
+def decode_for_detection(buf: np.ndarray, max_width: int = MAX_IMAGE_WIDTH) -> Optional[DecodedImage]:
+    """decode ภาพโดยย่อขนาดตั้งแต่ decode แล้ว resize ให้กว้างไม่เกิน max_width"""
+    jpeg_size = _jpeg_size(buf)
+    size = jpeg_size or _png_size(buf)
+    is_jpeg = jpeg_size is not None
+    factor = pick_reduce_factor(size[0], max_width) if (size and is_jpeg) else 1
+
+    img = cv2.imdecode(buf, _REDUCED_FLAGS[factor])
+    if img is None and factor > 1:
+        factor = 1
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    # กันกรณีอ่าน orientation ไม่ได้ (EXIF แปลก ๆ): ย่อแล้วแคบกว่าเป้า -> decode ใหม่ที่ factor ต่ำลง
+    while factor > 1 and img.shape[1] < max_width:
+        factor //= 2
+        retry = cv2.imdecode(buf, _REDUCED_FLAGS[factor])
+        if retry is None:
+            break
+        img = retry
+
+    decoded_w = img.shape[1]
+    img = resize_to_width(img, max_width)
+    if factor > 1 or decoded_w != img.shape[1]:
+        log.debug("Decoded %spx wide image at 1/%d, working size %dx%d",
+                  size[0] if size else "?", factor, img.shape[1], img.shape[0])
+    return DecodedImage(img, buf=buf, is_jpeg=is_jpeg, full_width=decoded_w * factor)
+
+def crop_roi(dec: DecodedImage, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+    """
+    crop ROI สำหรับ reader
+    ถ้า ROI ในภาพที่ใช้ detect แคบกว่า ROI_REDECODE_MIN_WIDTH และภาพต้นฉบับละเอียดกว่า
+    จะ decode ใหม่ที่ factor ต่ำพอให้ ROI กว้างถึงเกณฑ์ แล้ว crop จากภาพนั้นแทน
+    (OpenCV decode เฉพาะบางส่วนของ JPEG ไม่ได้ จึงใช้ scaled decode ที่หยาบที่สุดที่ยังพอ)
+    """
+    work = dec.img
+    roi_w = x2 - x1
+    if dec.buf is None or roi_w <= 0 or roi_w >= ROI_REDECODE_MIN_WIDTH or dec.full_width <= work.shape[1]:
+        return work[y1:y2, x1:x2]
+
+    full_roi_w = roi_w * dec.full_width / work.shape[1]
+    factor = pick_reduce_factor(int(full_roi_w), ROI_REDECODE_MIN_WIDTH) if dec.is_jpeg else 1
+    hi = cv2.imdecode(dec.buf, _REDUCED_FLAGS[factor])
+    if hi is None or hi.shape[1] <= work.shape[1]:
+        return work[y1:y2, x1:x2]
+
+    s = hi.shape[1] / work.shape[1]
+    Hh, Wh = hi.shape[:2]
+    hx1, hy1 = max(0, int(x1 * s)), max(0, int(y1 * s))
+    hx2, hy2 = min(Wh, int(round(x2 * s))), min(Hh, int(round(y2 * s)))
+    roi = hi[hy1:hy2, hx1:hx2]
+    if roi.size == 0:
+        return work[y1:y2, x1:x2]
+    return np.ascontiguousarray(roi)
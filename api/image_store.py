@@ -0,0 +1,138 @@
+# api/image_store.py
+"""
+บันทึกภาพป้ายที่ crop แล้วแบบ write-behind
+- encode (JPEG/WebP) + เขียนดิสก์ใน background thread ไม่ให้ดิสก์ช้า (SD card) ไปหน่วง gate
+- สร้าง thumbnail เล็กสำหรับหน้า dashboard
+- คืนชื่อไฟล์ทันที (path คงที่) ก่อนไฟล์จะถูกเขียนเสร็จ
+- URL ของภาพเป็น /uploads/plates/<ไฟล์> เสมอ ไม่ว่า PLATE_IMAGE_DIR จะชี้ไปที่ไหน (main.py mount PLATES_DIR ไว้ที่ PLATES_URL)
+"""
+import os
+import queue
+import threading
+from uuid import uuid4
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .segment_store import segment_store
+from .metrics import IMAGE_WRITE_SECONDS
+from .tracing import Span, current_span, span
+from .logger import get_logger
+
+log = get_logger("image_store")
+
+PLATES_DIR = os.getenv("PLATE_IMAGE_DIR", "uploads/plates")
+THUMBS_DIR = os.path.join(PLATES_DIR, "thumbs")
+PLATES_URL = "/uploads/plates"
+PLATE_IMAGE_FORMAT = os.getenv("PLATE_IMAGE_FORMAT", "jpg").lower()  # jpg | webp
+PLATE_IMAGE_QUALITY = int(os.getenv("PLATE_IMAGE_QUALITY", "90"))
+PLATE_THUMB_WIDTH = int(os.getenv("PLATE_THUMB_WIDTH", "160"))
+PLATE_THUMB_QUALITY = int(os.getenv("PLATE_THUMB_QUALITY", "70"))
+PLATE_IMAGE_QUEUE_MAX = int(os.getenv("PLATE_IMAGE_QUEUE_MAX", "256"))
+
+def _ext() -> str:
+    return "webp" if PLATE_IMAGE_FORMAT == "webp" else "jpg"
+
+def _encode_params(quality: int) -> list:
+    if _ext() == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+def _make_thumb(img: np.ndarray) -> np.ndarray:
+    h, w = img.shape[:2]
+    if w <= PLATE_THUMB_WIDTH:
+        return img
+    scale = PLATE_THUMB_WIDTH / w
+    return cv2.resize(img, (PLATE_THUMB_WIDTH, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+def _write_atomic(path: str, data: bytes):
+    """เขียนไฟล์ชั่วคราวแล้ว rename เพื่อไม่ให้ StaticFiles เสิร์ฟไฟล์ที่เขียนไม่ครบ"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def encode_plate_image(img: np.ndarray) -> tuple[bytes, bytes]:
+    """encode ภาพเต็ม + thumbnail คืนเป็น bytes"""
+    ok, full = cv2.imencode(f".{_ext()}", img, _encode_params(PLATE_IMAGE_QUALITY))
+    if not ok:
+        raise RuntimeError("cv2.imencode failed for plate image")
+    ok, thumb = cv2.imencode(f".{_ext()}", _make_thumb(img), _encode_params(PLATE_THUMB_QUALITY))
+    if not ok:
+        raise RuntimeError("cv2.imencode failed for plate thumbnail")
+    return full.tobytes(), thumb.tobytes()
+
+class ImageWriter:
+    """คิวงานเขียนภาพ + worker thread เดียว (cv2.imencode ปล่อย GIL อยู่แล้ว)"""
+
+    def __init__(self, max_queue: int = PLATE_IMAGE_QUEUE_MAX):
+        os.makedirs(PLATES_DIR, exist_ok=True)
+        os.makedirs(THUMBS_DIR, exist_ok=True)
+        self._queue: "queue.Queue[Optional[tuple[str, np.ndarray, Optional[Span]]]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="plate-image-writer", daemon=True)
+        self._thread.start()
+
+    def _write(self, filename: str, img: np.ndarray, parent: Optional[Span] = None):
+        try:
+            with IMAGE_WRITE_SECONDS.time(), span("image.write", parent=parent, filename=filename):
+                full, thumb = encode_plate_image(img)
+                if segment_store is not None:
+                    segment_store.put_many([(filename, full), (f"thumbs/{filename}", thumb)])
+                    return
+                _write_atomic(os.path.join(PLATES_DIR, filename), full)
+                _write_atomic(os.path.join(THUMBS_DIR, filename), thumb)
+        except Exception as e:
+            log.error("ERROR writing plate image %s: %s", filename, e)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, img: np.ndarray) -> Optional[str]:
+        """
+        ส่งภาพเข้าคิวแล้วคืนชื่อไฟล์ทันที
+        ถ้าคิวเต็มจะเขียนใน thread ปัจจุบันแทน (ไม่ทิ้งภาพ)
+        """
+        if img is None or img.size == 0:
+            return None
+        filename = f"plate_{uuid4().hex}.{_ext()}"
+        item = (filename, np.ascontiguousarray(img).copy(), current_span())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            log.warning("image writer queue full (%d), writing inline", self._queue.maxsize)
+            self._write(*item)
+        return filename
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 10.0):
+        """รอให้เขียนภาพที่ค้างในคิวเสร็จ (ใช้ตอน shutdown)"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+image_writer = ImageWriter()
+
+def plate_url(plate_image_path: Optional[str]) -> Optional[str]:
+    """URL ของภาพป้ายเต็ม"""
+    if not plate_image_path:
+        return None
+    return f"{PLATES_URL}/{plate_image_path}"
+
+def thumb_path(plate_image_path: Optional[str]) -> Optional[str]:
+    """URL ของ thumbnail (ไฟล์เก่าก่อนมี thumbnail จะใช้ภาพเต็มแทน)"""
+    if not plate_image_path:
+        return None
+    if segment_store is not None:
+        return f"{PLATES_URL}/thumbs/{plate_image_path}"
+    if os.path.exists(os.path.join(THUMBS_DIR, plate_image_path)):
+        return f"{PLATES_URL}/thumbs/{plate_image_path}"
+    return plate_url(plate_image_path)
@@ -0,0 +1,328 @@
+# api/lanes.py
+"""
+หลายช่องทาง (lanes): กล้องแต่ละตัวผูกกับไม้กั้นของ lane นั้น
+- config จาก GATE_LANES เป็น JSON หรือ path ไปไฟล์ .json เช่น
+    [{"id": "in",  "name": "ขาเข้า", "device": "/dev/ttyACM0",               "cameras": ["cam-in", "http://192.168.1.20:4747"],
+      "budget_ms": 300},
+     {"id": "out", "name": "ขาออก", "device": "socket://192.168.1.31:5000", "cameras": ["cam-out"]}]
+- GateController หนึ่งตัว (writer/reader thread ของตัวเอง) ต่อ device: คำสั่งของคนละ lane ไม่ต่อคิวกัน
+  lane ที่ใช้ device เดียวกันแชร์ controller ตัวเดียว (ลำดับคำสั่งบน port เดียวกันยังถูกต้อง)
+- ไม่ตั้ง GATE_LANES = lane เดียวชื่อ "default" ใช้ SERIAL_PORT / SERIAL_URL เหมือนเดิม
+- state ต่อ lane (เปิด/ปิด, ป้ายล่าสุด, ACK latency) อัปเดตจากบรรทัดที่ firmware ส่งมา
+  (รวม ACK:CLOSE ตอนปิดเองหลัง HOLD_MS) ดูได้ที่ GET /api/lanes และส่งทาง /ws เป็น {"type": "lane_state"}
+- หลาย uvicorn worker: worker เดียวเปิด serial (api/gate_link.py) worker อื่นส่งคำสั่งผ่าน event bus
+  และรับ lane_state ของ worker อื่นมาอัปเดต state ของตัวเอง
+"""
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+from .arduino import GateController, SERIAL_ENABLED, SERIAL_BAUD, gate_controller
+from .gate_link import RemoteGateController, claim_link_owner, serve_command
+from .metrics import GATE_FAILURES_TOTAL
+from .logger import get_logger
+
+log = get_logger("gate")
+
+GATE_LANES = os.getenv("GATE_LANES", "").strip()
+GATE_DEFAULT_LANE = os.getenv("GATE_DEFAULT_LANE", "").strip()  # ว่าง = lane แรกใน config
+
+class LaneConfigError(ValueError):
+    """GATE_LANES อ่านไม่ได้หรือไม่ครบ"""
+
+def load_lane_config(raw: str = GATE_LANES) -> list[dict]:
+    """อ่าน GATE_LANES (JSON ตรงๆ หรือ path ไฟล์) คืน list ของ lane ที่ตรวจแล้ว ([] = ไม่ได้ตั้ง)"""
+    if not raw:
+        return []
+    if not raw.lstrip().startswith(("[", "{")):
+        with open(raw, encoding="utf-8") as f:
+            raw = f.read()
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise LaneConfigError(f"GATE_LANES is not valid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("lanes", [])
+
+    lanes, seen = [], set()
+    for item in data:
+        lane_id = str(item.get("id") or "").strip()
+        device = str(item.get("device") or "").strip()
+        if not lane_id or not device:
+            raise LaneConfigError(f"lane needs 'id' and 'device': {item}")
+        if lane_id in seen:
+            raise LaneConfigError(f"duplicate lane id: {lane_id}")
+        seen.add(lane_id)
+        cameras = item.get("cameras") or []
+        if isinstance(cameras, str):
+            cameras = [cameras]
+        lanes.append({
+            "id": lane_id,
+            "name": item.get("name") or lane_id,
+            "device": device,
+            "baud": int(item.get("baud") or SERIAL_BAUD),
+            "cameras": [str(c).strip() for c in cameras if str(c).strip()],
+            "budget_ms": float(item["budget_ms"]) if item.get("budget_ms") else None,
+        })
+    return lanes
+
+class Lane:
+    """lane หนึ่งช่อง + state ล่าสุดของไม้กั้น"""
+
+    def __init__(self, lane_id: str, name: str, device: str, cameras: list[str], controller: GateController,
+                 budget_ms: Optional[float] = None):
+        self.id = lane_id
+        self.name = name
+        self.device = device
+        self.cameras = cameras
+        self.controller = controller
+        self.budget_ms = budget_ms  # งบเวลาของ /detect สำหรับกล้องของ lane นี้ (None = DETECT_BUDGET_MS)
+        self._lock = threading.Lock()
+        self.gate = "unknown"  # open | closed | unknown
+        self.last_plate: Optional[str] = None
+        self.last_plate_at: Optional[str] = None
+        self.last_action: Optional[str] = None
+        self.last_ack_ms: Optional[float] = None
+        self.opens = 0
+        self.updated_at: Optional[str] = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "type": "lane_state",
+                "lane": self.id,
+                "name": self.name,
+                "device": self.device,
+                "gate": self.gate,
+                "connected": self.controller.connected,
+                "last_plate": self.last_plate,
+                "last_plate_at": self.last_plate_at,
+                "last_action": self.last_action,
+                "last_ack_ms": self.last_ack_ms,
+                "opens": self.opens,
+                "updated_at": self.updated_at,
+            }
+
+class LaneRegistry:
+    def __init__(self, config: list[dict]):
+        self._controllers: dict[str, GateController] = {}
+        self.lanes: dict[str, Lane] = {}
+        # ตรงตัว: camera id / URL เต็ม, prefix: URL ของกล้อง (image_url ของ snapshot ขึ้นต้นด้วย base URL)
+        self._camera_exact: dict[str, Lane] = {}
+        self._camera_prefix: list[tuple[str, Lane]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._publish: Optional[Callable[[dict], None]] = None
+        self._bus_send: Optional[Callable[[dict], None]] = None  # ส่งถึง worker อื่นเท่านั้น (ไม่ออก /ws)
+        self.owner = False  # process นี้เปิด serial link เอง
+
+        if not config:
+            config = [{"id": "default", "name": "default", "device": gate_controller.url,
+                       "baud": gate_controller.baud, "cameras": []}]
+        for item in config:
+            controller = self._controller_for(item["device"], item["baud"], item["id"])
+            lane = Lane(item["id"], item["name"], item["device"], item["cameras"], controller, item.get("budget_ms"))
+            self.lanes[lane.id] = lane
+            for cam in lane.cameras:
+                self._camera_exact[cam] = lane
+                if "://" in cam:
+                    self._camera_prefix.append((cam, lane))
+        # prefix ที่ยาวกว่าชนะ (http://cam:4747/video ก่อน http://cam:4747)
+        self._camera_prefix.sort(key=lambda p: len(p[0]), reverse=True)
+
+        default_id = GATE_DEFAULT_LANE or next(iter(self.lanes))
+        if default_id not in self.lanes:
+            raise LaneConfigError(f"GATE_DEFAULT_LANE={default_id} is not a configured lane")
+        self.default = self.lanes[default_id]
+
+    def _controller_for(self, device: str, baud: int, lane_id: str) -> GateController:
+        controller = self._controllers.get(device)
+        if controller is None:
+            # device เดิมของ SERIAL_PORT/SERIAL_URL ใช้ controller ตัวเดิม (port หนึ่งมีเจ้าของคนเดียว)
+            if device == gate_controller.url:
+                controller = gate_controller
+            else:
+                controller = GateController(device, baud, name=f"gate-{lane_id}")
+            controller.add_listener(lambda line, device=device: self._on_line(device, line))
+            self._controllers[device] = controller
+        return controller
+
+    # ---------- lookup ----------
+
+    def get(self, lane_id: str) -> Optional[Lane]:
+        return self.lanes.get(lane_id)
+
+    def resolve(self, lane: Optional[str] = None, camera: Optional[str] = None,
+                source: Optional[str] = None) -> Optional[Lane]:
+        """
+        เลือก lane ของ request: lane id ตรงๆ > camera id > URL ของภาพ (prefix) > default lane
+        คืน None ถ้าระบุ lane ที่ไม่มีอยู่
+        """
+        if lane:
+            return self.lanes.get(lane)
+        for key in (camera, source):
+            if not key:
+                continue
+            found = self._camera_exact.get(key)
+            if found is not None:
+                return found
+            for prefix, found in self._camera_prefix:
+                if key.startswith(prefix):
+                    return found
+        return self.default
+
+    # ---------- lifecycle ----------
+
+    def start(self, publish: Callable[[dict], None], bus=None):
+        """
+        เรียกตอน startup (ใน event loop)
+        เจ้าของ link: เปิด link ของทุก device พร้อมกัน แล้วถาม STATUS เริ่มต้น
+        worker อื่น: เปลี่ยน controller เป็น RemoteGateController ที่ส่งคำสั่งผ่าน bus (EventBus ที่ไม่ใช่ local)
+        """
+        self._loop = asyncio.get_running_loop()
+        self._publish = publish
+        if not SERIAL_ENABLED:
+            # แจ้งครั้งเดียวตอน startup (ต่อคำสั่งเป็นแค่ DEBUG)
+            log.warning("[GATE] ⚠️ Serial disabled (SERIAL_ENABLED=false), gate commands will not be sent. "
+                        "To enable: Set SERIAL_ENABLED=true in environment or .env file")
+            return
+        if bus is not None and bus.name != "LocalBus":
+            self._bus_send = bus.publish
+        self.owner = claim_link_owner()
+        if not self.owner:
+            self._use_remote_link(bus.origin if bus is not None else str(os.getpid()))
+            return
+        log.info("[GATE] 🔌 This worker owns the gate link (%d device(s))", len(self._controllers))
+        for controller in self._controllers.values():
+            controller.start(keepalive=True)
+            controller.submit("STATUS")  # คำตอบเข้า _on_line -> รู้ว่าไม้เปิด/ปิดอยู่
+
+    def _use_remote_link(self, origin: str):
+        if self._bus_send is None:
+            log.warning("[GATE] ⚠️ Another worker owns the gate link but EVENT_BUS_BACKEND=local, "
+                        "gate commands from this worker will fail")
+        else:
+            log.info("[GATE] 📡 Gate link is owned by another worker, sending commands over the event bus")
+        for device, controller in list(self._controllers.items()):
+            remote = RemoteGateController(device, controller.baud, controller.name, origin)
+            remote.bind(self._loop, self._bus_send)
+            self._controllers[device] = remote
+            for lane in self.lanes.values():
+                if lane.device == device:
+                    lane.controller = remote
+
+    def request_state(self):
+        """(worker ที่ไม่ใช่เจ้าของ link) ขอ lane_state ปัจจุบันจากเจ้าของ - เรียกหลัง event bus เริ่มแล้ว"""
+        if SERIAL_ENABLED and not self.owner and self._bus_send is not None:
+            self._bus_send({"type": "lane_sync"})
+
+    def on_bus_message(self, message: dict) -> bool:
+        """
+        (event loop) message จาก worker อื่น: คำสั่ง/คำตอบของ gate link จัดการที่นี่ (คืน True = ไม่ต้องส่งต่อ /ws)
+        lane_state อัปเดต state ของ lane ในนี้ด้วยแล้วส่งต่อให้ client ตามปกติ
+        """
+        kind = message.get("type")
+        if kind == "gate_command":
+            controller = self._controllers.get(message.get("device"))
+            if self.owner and controller is not None and self._bus_send is not None:
+                serve_command(controller, message, self._loop, self._bus_send)
+            return True
+        if kind == "gate_reply":
+            for controller in self._controllers.values():
+                if isinstance(controller, RemoteGateController) and controller.on_reply(message):
+                    break
+            return True
+        if kind == "lane_sync":
+            if self.owner:
+                for lane in self.lanes.values():
+                    self._emit(lane)
+            return True
+        if kind == "lane_state":
+            self._apply_state(message)
+        return False
+
+    def _apply_state(self, message: dict):
+        lane = self.lanes.get(message.get("lane"))
+        if lane is None:
+            return
+        # ตำแหน่งไม้ของเจ้าของ link มาจาก firmware โดยตรง ไม่เอาค่าจาก worker อื่นมาทับ
+        keys = ("last_plate", "last_plate_at", "last_action", "last_ack_ms", "opens", "updated_at")
+        if not self.owner:
+            keys += ("gate",)
+        with lane._lock:
+            for key in keys:
+                if key in message:
+                    setattr(lane, key, message[key])
+        if isinstance(lane.controller, RemoteGateController) and "connected" in message:
+            lane.controller.set_connected(message["connected"])
+
+    def close(self):
+        for controller in self._controllers.values():
+            controller.close()
+
+    # ---------- state ----------
+
+    def _emit(self, lane: Lane):
+        # เรียกได้จากทั้ง event loop และ gate reader thread
+        if self._publish is None or self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._publish, lane.snapshot())
+
+    def _update(self, lane: Lane, **changes):
+        with lane._lock:
+            for key, value in changes.items():
+                setattr(lane, key, value)
+            lane.updated_at = datetime.utcnow().isoformat()
+        self._emit(lane)
+
+    def _on_line(self, device: str, line: str):
+        """(reader thread) ACK:OPEN / ACK:CLOSE / STATUS: จาก firmware -> state ของทุก lane บน device นี้"""
+        if line.startswith("ACK:OPEN") or line.startswith("STATUS:OPEN"):
+            gate = "open"
+        elif line.startswith("ACK:CLOSE") or line.startswith("STATUS:CLOSED"):
+            gate = "closed"
+        else:
+            return
+        for lane in self.lanes.values():
+            if lane.device == device and lane.gate != gate:
+                self._update(lane, gate=gate)
+
+    def note_plate(self, lane: Lane, plate_text: str):
+        self._update(lane, last_plate=plate_text, last_plate_at=datetime.utcnow().isoformat())
+
+    def note_gate(self, lane: Lane, action: str, ack_ms: Optional[float] = None):
+        changes = {"last_action": action}
+        if ack_ms is not None:
+            changes["last_ack_ms"] = ack_ms
+        if action == "opened":
+            changes["opens"] = lane.opens + 1
+        elif action in ("attempted", "error"):
+            GATE_FAILURES_TOTAL.labels(lane.id, action).inc()
+        self._update(lane, **changes)
+
+    def snapshot(self) -> list[dict]:
+        return [lane.snapshot() for lane in self.lanes.values()]
+
+    def link_stats(self) -> dict:
+        """สถานะ serial link ต่อ device (controller ละ port) พร้อม lane ที่ใช้ device นั้น"""
+        out = {}
+        for device, controller in self._controllers.items():
+            out[device] = {**controller.stats(), "owner": self.owner,
+                           "lanes": [lane.id for lane in self.lanes.values() if lane.controller is controller]}
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "lanes": [
+                {**lane.snapshot(), "cameras": lane.cameras, "budget_ms": lane.budget_ms,
+                 "link": lane.controller.stats()}
+                for lane in self.lanes.values()
+            ],
+            "default": self.default.id,
+            "devices": len(self._controllers),
+            "link_owner": self.owner,
+        }
+
+lane_registry = LaneRegistry(load_lane_config())
@@ -2,11 +2,15 @@
 import os
 from ultralytics import YOLO
 
+from .logger import get_logger
+
+log = get_logger("models")
+
 _DET_PATH = os.getenv("DETECTOR_WEIGHTS", "models/detector/best.pt")
 _READ_PATH = os.getenv("READER_WEIGHTS", "models/reader/best.pt")
 
-print(f"[INFO] 🟠 Using local YOLO DETECTOR from: {_DET_PATH}", flush=True)
-print(f"[INFO] 🔵 Using local YOLO READER   from: {_READ_PATH}", flush=True)
+log.info("🟠 Using local YOLO DETECTOR from: %s", _DET_PATH)
+log.info("🔵 Using local YOLO READER   from: %s", _READ_PATH)
 
 _det = YOLO(_DET_PATH)
 _reader = YOLO(_READ_PATH)
@@ -23,9 +27,10 @@ def infer_detector(img):
         out.append({"x1":x1,"y1":y1,"x2":x2,"y2":y2,"confidence":conf,"class":cls_name})
     return out
 
-def infer_reader(img):
+def infer_reader(img, conf=None):
     # คืนผลแบบ Roboflow-style {predictions:[{class/name, confidence, x,y,width,height,x1,y1,x2,y2}...]}
-    res = _reader(img)[0]
+    # conf: threshold ของ YOLO (None = ค่า default ของ ultralytics) ลดลงเพื่อเก็บตัวเลือกสำรองให้ plate_decoder
+    res = (_reader(img) if conf is None else _reader(img, conf=conf))[0]
     preds = []
     for b in res.boxes:
         x1, y1, x2, y2 = map(float, b.xyxy[0].tolist())
@@ -0,0 +1,189 @@
+# api/logger.py
+"""
+logging แบบไม่ block แทน print(..., flush=True) บน hot path
+- logger ทุกตัวอยู่ใต้ "lpr" (get_logger("video") -> lpr.video) ระดับตั้งด้วย LOG_LEVEL / LOG_LEVELS
+- caller แค่สร้าง LogRecord ใส่คิว (ไม่ format ไม่เขียน ไม่ flush) thread "log-writer" เป็นคน format + เขียน stdout / LOG_FILE
+  คิวเต็ม = ทิ้งบรรทัดนั้น (นับใน lpr_log_dropped_total) ไม่หน่วง request
+- ระดับต่ำกว่า LOG_LEVEL: logger.debug(...) คืนทันทีตั้งแต่เช็คระดับ ไม่สร้าง record
+- ใช้ %-style args เสมอ (log.debug("frame %d", i)) ไม่ใช้ f-string; ค่าที่คำนวณแพง (list ของ prediction) ห่อด้วย lazy(fn)
+  ให้คำนวณตอนเขียนใน writer thread เท่านั้น (fn ต้องไม่อ่านของที่ caller จะแก้ต่อ)
+- DEBUG ถี่ ๆ (ทุก frame) sample ได้ด้วย LOG_DEBUG_SAMPLE_RATE (WARNING/ERROR ไม่ถูก sample)
+- LOG_FORMAT=json: หนึ่งบรรทัดต่อ record พร้อม field จาก extra={...} และ trace_id ของ trace ปัจจุบัน (api/tracing.py)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import threading
+import logging
+import logging.handlers
+from typing import Callable
+
+from .metrics import Counter
+from .tracing import current_trace_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")                # เช่น "arduino=DEBUG,video=WARNING"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()    # text | json
+LOG_FILE = os.getenv("LOG_FILE", "")                    # เขียนเพิ่มอีกไฟล์ (ว่าง = stdout อย่างเดียว)
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+ROOT_NAME = "lpr"
+
+LOG_DROPPED_TOTAL = Counter("lpr_log_dropped", "Log records dropped (queue_full) or sampled out (sampled)", ("reason",))
+
+# attribute มาตรฐานของ LogRecord - ที่เหลือคือ field จาก extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+class lazy:
+    """ค่าที่คำนวณตอน format (ใน writer thread) เท่านั้น: log.debug("preds: %s", lazy(lambda: [...]))"""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+
+    def __str__(self) -> str:
+        try:
+            return str(self.fn())
+        except Exception as e:
+            return f"<lazy error: {e}>"
+
+    __repr__ = __str__
+
+class StructuredFormatter(logging.Formatter):
+    """text: "เวลา LEVEL ข้อความ key=value ..." / json: หนึ่ง object ต่อบรรทัด"""
+
+    def __init__(self, fmt: str = LOG_FORMAT):
+        super().__init__()
+        self.json = fmt == "json"
+
+    def _fields(self, record: logging.LogRecord) -> dict:
+        return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith("_")}
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        fields = self._fields(record)
+        trace_id = getattr(record, "trace_id", None)
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if self.json:
+            out = {
+                "ts": round(record.created, 6),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+                "thread": record.threadName,
+            }
+            if trace_id:
+                out["trace_id"] = trace_id
+            out.update(fields)
+            if exc:
+                out["exc"] = exc
+            return json.dumps(out, ensure_ascii=False, default=str)
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{ts}.{int(record.msecs):03d} {record.levelname:<7} {message}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if trace_id:
+            line += f" trace_id={trace_id}"
+        if exc:
+            line += "\n" + exc
+        return line
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ใส่ record ลงคิวแบบ put_nowait ไม่ format ใน thread ของ caller
+    (QueueHandler เดิม format ข้อความใน prepare() ซึ่งคือต้นทุนที่ต้องการย้ายออก)
+    """
+
+    def __init__(self, q: queue.Queue, debug_sample_rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__(q)
+        self.debug_sample_rate = debug_sample_rate
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED_TOTAL.labels("queue_full").inc()
+
+    def emit(self, record: logging.LogRecord):
+        if record.levelno < logging.INFO and self.debug_sample_rate < 1.0 \
+                and random.random() >= self.debug_sample_rate:
+            LOG_DROPPED_TOTAL.labels("sampled").inc()
+            return
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+class _Listener(logging.handlers.QueueListener):
+    def prepare(self, record):
+        return record
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # รอได้ถ้าคิวเต็ม (ตอน stop เท่านั้น)
+
+def _parse_level(name: str) -> int:
+    level = logging.getLevelName(name.strip().upper())
+    return level if isinstance(level, int) else logging.INFO
+
+_listener = None
+
+def setup_logging():
+    """ติดตั้ง handler ของ logger "lpr" ครั้งเดียว (เรียกตอน import โมดูลนี้)"""
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger(ROOT_NAME)
+    root.setLevel(_parse_level(LOG_LEVEL))
+    root.propagate = False  # ไม่ส่งต่อให้ root logger ของ uvicorn (กันพิมพ์ซ้ำ)
+    for item in filter(None, (s.strip() for s in LOG_LEVELS.split(","))):
+        name, _, level = item.partition("=")
+        name = name.strip()
+        logging.getLogger(name if name.startswith(ROOT_NAME) else f"{ROOT_NAME}.{name}").setLevel(_parse_level(level))
+
+    formatter = StructuredFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        directory = os.path.dirname(LOG_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+    root.addHandler(NonBlockingQueueHandler(q))
+    _listener = _Listener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """เขียนที่ค้างในคิวให้หมดแล้วหยุด writer thread (shutdown ของแอป / atexit)"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        # log หลังจากนี้ (ช่วงปิดโปรแกรม) เขียนตรงแบบ sync
+        root = logging.getLogger(ROOT_NAME)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in listener.handlers:
+            root.addHandler(handler)
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_NAME}.{name}")
+
+setup_logging()
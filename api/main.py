@@ -1,30 +1,58 @@
 # api/main.py
-import os, json, cv2, uvicorn, numpy as np
+import os, json, time, cv2, uvicorn
 from uuid import uuid4
 from datetime import datetime, timedelta
-from typing import List, Set, Tuple
+from typing import List, Set
 import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Depends
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, WebSocket, WebSocketDisconnect, Depends, Request
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import func, desc, select
 
 from .local_models import infer_detector, infer_reader
 from .database import engine, SessionLocal
-from .models import Base, PlateRecord, User
+from .models import Base, PlateRecord, PlateDetection, User, GateRule
 from .schemas import PlateCreateResponse
 from .ocr import run_ocr_on_bbox
 from .utils import extract_bboxes, merge_boxes
-from .arduino import send_open_gate
-from .auth import create_user, authenticate_user, generate_session_token
+from .arduino import (
+    send_open_gate, send_close_gate, open_gate, submit_open_gate, open_ack_ok,
+    gate_controller,
+)
+from .lanes import lane_registry
+from .gate_outbox import gate_outbox
+from .gate_decision import bump_rules_version, should_open, gate_engine, normalize_plate as _normalize_plate, RULE_KINDS
+from .auth import create_user_async, authenticate_user_async, generate_session_token, KDFPoolBusy
+from .session_store import create_session_store
+from .ws_manager import ConnectionManager
+from .event_bus import create_event_bus
 from .province_parser import parse_plate
+from .plate_decoder import decode_plate, READER_ALT_MIN_CONF, READER_MIN_CONF
+from .cascade import Cascade, resolve_budget_ms
+from .recognition import recognize_plate, clean_text
+from .admission import admission, AdmissionRejected, classify_priority
+from .metrics import Gauge, render as render_metrics, STAGE_SECONDS, DB_COMMIT_SECONDS, FALLBACK_TOTAL, PLATES_TOTAL
+from .tracing import TraceMiddleware, instrument_engine, exporter as trace_exporter, span, start_trace, finish_trace, current_span
+from .logger import get_logger, shutdown_logging
+from .detections_store import make_detection_row, load_detections
+from .image_store import image_writer, thumb_path, plate_url, PLATES_DIR, PLATES_URL
+from .segment_store import segment_store
+from .image_decode import DecodedImage, decode_for_detection, resize_to_width
+from .uploads import (
+    ScratchFile, UploadTooLarge, ScratchQuotaExceeded,
+    read_image_upload, read_image_url, purge_scratch, IMAGE_FETCH_TIMEOUT_SEC,
+)
+
+log = get_logger("api")
+video_log = get_logger("video")
+gate_log = get_logger("gate")
 
 # =============================
 # DB + APP bootstrap
@@ -34,33 +62,86 @@ Base.metadata.create_all(bind=engine)
 app = FastAPI(title="Thai Motorcycle License Plate API")
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
+    allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+# trace ต่อ request ของ /detect (X-Trace-Id) + span ของทุก DB query ระหว่างมี trace
+app.add_middleware(TraceMiddleware, paths=("/detect",))
+instrument_engine(engine)
 
 # Serve static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# ภาพป้าย: PLATES_URL -> PLATE_IMAGE_DIR (หรือ segment files) ต้องลงก่อน mount /uploads
+if segment_store is not None:
+    @app.get(PLATES_URL + "/{key:path}")
+    def serve_plate_image(key: str, request: Request):
+        return segment_store.response(key, request.headers.get("range"), request.headers.get("if-none-match"))
+else:
+    app.mount(PLATES_URL, StaticFiles(directory=PLATES_DIR), name="plates")
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-manager = ConnectionManager()
+# WebSocket connection manager (คิวขาออกแยกต่อ client, broadcast ไม่ block)
+# event bus ส่ง broadcast ข้าม uvicorn worker ตาม EVENT_BUS_BACKEND
+event_bus = create_event_bus()
+manager = ConnectionManager(bus=event_bus)
+
+@app.on_event("startup")
+def _purge_upload_scratch():
+    purge_scratch()
+
+@app.on_event("startup")
+def _start_gate_link():
+    # เปิด link ของทุก lane (controller ละ device) + ส่ง lane_state ทาง /ws เมื่อไม้เปิด/ปิด
+    lane_registry.start(manager.publish, event_bus)
+    gate_outbox.replay()
+    gate_engine.reload(force=True)
+
+def _deliver_bus_event(message: dict):
+    # คำสั่ง/คำตอบของ gate link ระหว่าง worker ไม่ออก /ws
+    if lane_registry.on_bus_message(message):
+        return
+    manager.publish_local(message)
+
+@app.on_event("startup")
+async def _start_event_bus():
+    await event_bus.start(_deliver_bus_event)
+    lane_registry.request_state()
+
+@app.on_event("shutdown")
+def _flush_image_writer():
+    image_writer.close()
+
+@app.on_event("shutdown")
+async def _stop_event_bus():
+    await event_bus.close()
+
+@app.on_event("shutdown")
+def _close_gate_controller():
+    lane_registry.close()
+    gate_controller.close()
+    gate_outbox.close()
+
+@app.on_event("shutdown")
+def _stop_recognition_executor():
+    admission.close()
+
+@app.on_event("shutdown")
+def _flush_trace_exporter():
+    trace_exporter.close()
+
+@app.on_event("shutdown")
+def _flush_logs():
+    # ลงทะเบียนท้ายสุด: เขียน log ที่ค้างในคิวให้หมด (log หลังจากนี้เขียนตรงแบบ sync)
+    shutdown_logging()
+
+# คอลัมน์ที่หน้า list ใช้จริง (ไม่ดึงผล detection ดิบ)
+RECORD_LIST_COLUMNS = (
+    PlateRecord.id, PlateRecord.plate_text, PlateRecord.province_text,
+    PlateRecord.confidence, PlateRecord.plate_image_path, PlateRecord.created_at,
+    PlateRecord.is_new_plate, PlateRecord.seen_count,
+)
 
 def get_db():
     db = SessionLocal()
@@ -77,29 +158,22 @@ async def root():
 def health():
     return {"status": "ok"}
 
+@app.get("/api/ws/stats")
+def ws_stats():
+    """สถิติ WebSocket: คิวของ client, event bus และ fan-out lag"""
+    return manager.stats()
+
 # =============================
 # User Authentication
 # =============================
-# In-memory session storage (use Redis in production)
-sessions = {}
-SESSION_EXPIRY_HOURS = 24  # Session expires after 24 hours
-
-def cleanup_expired_sessions():
-    """Remove expired sessions"""
-    now = datetime.utcnow()
-    expired_tokens = [
-        token for token, session_data in sessions.items()
-        if (now - session_data.get("created_at", now)).total_seconds() > SESSION_EXPIRY_HOURS * 3600
-    ]
-    for token in expired_tokens:
-        del sessions[token]
+# Session storage: memory (worker เดียว) หรือ database (ใช้ร่วมกันหลาย worker) ตาม SESSION_BACKEND
+session_store = create_session_store()
 
 def get_session_user(session_token: str):
     """Get user from session token"""
-    cleanup_expired_sessions()
-    if session_token not in sessions:
+    if not session_token:
         return None
-    return sessions[session_token]
+    return session_store.get(session_token)
 
 @app.post("/api/auth/register")
 async def register(
@@ -136,8 +210,15 @@ async def register(
                 content={"success": False, "message": "Passwords do not match"}
             )
         
-        # Create user
-        user = create_user(db, username, email, password)
+        # Create user (hash password ใน KDF pool ไม่บล็อก event loop)
+        try:
+            user = await create_user_async(db, username, email, password)
+        except KDFPoolBusy:
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "1"},
+                content={"success": False, "message": "Server busy, please try again"}
+            )
         
         if not user:
             return JSONResponse(
@@ -167,7 +248,14 @@ async def login(
     """Login user"""
     db = SessionLocal()
     try:
-        user = authenticate_user(db, username, password)
+        try:
+            user = await authenticate_user_async(db, username, password)
+        except KDFPoolBusy:
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "1"},
+                content={"success": False, "message": "Server busy, please try again"}
+            )
         
         if not user:
             return JSONResponse(
@@ -177,13 +265,13 @@ async def login(
         
         # Create session
         session_token = generate_session_token()
-        sessions[session_token] = {
+        session_store.set(session_token, {
             "user_id": user.id,
             "username": user.username,
             "email": user.email,
             "role": user.role,
             "created_at": datetime.utcnow()
-        }
+        })
         
         return {
             "success": True,
@@ -203,15 +291,13 @@ async def login(
 @app.post("/api/auth/logout")
 async def logout(session_token: str = Form(...)):
     """Logout user"""
-    if session_token in sessions:
-        del sessions[session_token]
+    session_store.delete(session_token)
     
     return {"success": True, "message": "Logged out successfully"}
 
 @app.get("/api/auth/me")
 async def get_current_user(session_token: str):
     """Get current user info"""
-    cleanup_expired_sessions()
     user_data = get_session_user(session_token)
     
     if not user_data:
@@ -228,290 +314,192 @@ async def get_current_user(session_token: str):
 # =============================
 # Gate decision configs (ENV)
 # =============================
-FORCE_OPEN_ALWAYS = os.getenv("FORCE_OPEN_ALWAYS", "0") == "1"
-GATE_TRIGGER_MODE = os.getenv("GATE_TRIGGER_MODE", "every_record")  # every_record | per_plate_cooldown
-OPEN_COOLDOWN_SEC = int(os.getenv("OPEN_COOLDOWN_SEC", "10"))
-ALLOWED_PREFIXES  = os.getenv("ALLOWED_PREFIXES", "").strip()  # ex: "กร,กต,กว"
-PLATE_STRICT      = os.getenv("PLATE_STRICT", "0") == "1"
-
-_recent_open_by_plate: dict[str, datetime] = {}  # {"plate_norm": datetime}
-
-def _clean_text(s: str) -> str:
-    return "".join(ch for ch in (s or "").strip() if ch not in "\r\n\t").strip()
-
-def _normalize_plate(s: str) -> str:
-    # เอาเว้นวรรค/ขีด/แท่งที่อาจกวนออก เพื่อเทียบ prefix/cooldown ได้
-    return "".join(ch for ch in s if ch.isalnum())
-
-def _allowed_by_prefix(plate_norm: str) -> bool:
-    if not ALLOWED_PREFIXES:
-        return True
-    return any(plate_norm.startswith(p) for p in ALLOWED_PREFIXES.split(","))
-
-def should_open(plate_text: str, conf: float | None) -> Tuple[bool, str]:
-    """ตัดสินใจว่าจะเปิดไม้หรือไม่ ตาม ENV ที่ตั้งไว้"""
-    if FORCE_OPEN_ALWAYS:
-        return True, "force_open"
-
-    if not plate_text:
-        return False, "empty_plate"
-
-    plate_norm = _normalize_plate(plate_text)
+# FORCE_OPEN_ALWAYS / GATE_TRIGGER_MODE / OPEN_COOLDOWN_SEC / ALLOWED_PREFIXES / PLATE_STRICT
+# อยู่ใน gate_decision.py (allow/deny lists + prefix trie + cooldown)
+GATE_FAST_PATH    = os.getenv("GATE_FAST_PATH", "0") == "1"  # สั่งเปิดไม้ทันทีที่อ่านป้ายได้ แล้วค่อยบันทึกภาพ/DB/แจ้ง ws
+
+_gate_tasks: Set[asyncio.Task] = set()
+
+def _issue_gate_fast(plate_text: str, conf: float | None, source: str | None, t_request: float,
+                     lane, reason: str = "gate-first fast path") -> dict:
+    """
+    gate-first fast path: ส่ง OPEN เข้าคิวของ gate controller ทันทีที่ได้ plate_text
+    event ถูกบันทึกลง outbox ก่อนรู้ผล แล้ว task แยกรอ ACK -> บันทึกผล -> แจ้ง WebSocket
+    """
+    event = gate_outbox.new_event(plate_text, source=source, reason=reason)
+    event["lane"] = lane.id
+    command = submit_open_gate(plate_text, lane.controller)
+    event["detect_to_gate_ms"] = round((time.perf_counter() - t_request) * 1000, 2)
+    gate_log.info("[GATE] ⚡ Fast path: OPEN:%s (lane %s) queued %s ms after request start",
+                  plate_text, lane.id, event["detect_to_gate_ms"])
+    gate_outbox.record(event)
+
+    task = asyncio.create_task(_finish_gate_event(event, command, conf, lane))
+    _gate_tasks.add(task)
+    task.add_done_callback(_gate_tasks.discard)
+    return event
+
+async def _finish_gate_event(event: dict, command, conf: float | None, lane):
+    action = "attempted"
+    try:
+        if command is not None:
+            response = await asyncio.wrap_future(command.future)
+            event["response"] = response[:128]
+            if command.sent_at:
+                event["ack_ms"] = round((time.monotonic() - command.sent_at) * 1000, 2)
+            if open_ack_ok(response):
+                action = "opened"
+    except Exception as e:
+        gate_log.error("[GATE] ❌ ERROR in gate control: %s", e)
+        action = "error"
+        event["response"] = str(e)[:128]
+    event["action"] = action
+    event["success"] = action == "opened"
+    gate_outbox.record(event)
+    lane_registry.note_gate(lane, action, event["ack_ms"])
+
+    manager.publish({
+        "type": "gate",
+        "lane": lane.id,
+        "action": action,
+        "plate_text": event["plate_text"],
+        "reason": event["reason"],
+        "confidence": float(conf) if conf is not None else None,
+        "gate_success": event["success"],
+        "event_id": event["event_id"],
+        "detect_to_gate_ms": event["detect_to_gate_ms"],
+        "ack_ms": event["ack_ms"],
+    })
 
-    if PLATE_STRICT and not _allowed_by_prefix(plate_norm):
-        return False, f"prefix_blocked plate={plate_norm} allowed={ALLOWED_PREFIXES}"
+def _record_gate_result(plate_text: str, gate_success: bool, reason: str, source: str | None,
+                        record_id: int | None = None, action: str | None = None):
+    """บันทึก gate event ของ path ปกติ (เปิดไม้หลังบันทึก DB) ลง outbox"""
+    event = gate_outbox.new_event(plate_text, source=source, reason=reason)
+    event["record_id"] = record_id
+    event["action"] = action or ("opened" if gate_success else "attempted")
+    event["success"] = gate_success
+    gate_outbox.record(event)
+
+def _fetch_image(file: UploadFile | None, image_url: str | None, cascade: Cascade):
+    """
+    อ่านภาพของ /detect (I/O ล้วน รันนอก recognition slot ผ่าน asyncio.to_thread)
+    กล้องที่ช้า/ตายจึงไม่กินช่องของ recognition executor
+    คืน (image_source, buf, frame) - buf = ไฟล์ภาพที่ยังไม่ decode, frame = ภาพจาก MJPEG stream
+    หรือ JSONResponse ถ้าอ่านภาพไม่ได้
+    """
+    with cascade.stage("fetch", cancellable=False):
+        if file:
+            # อ่านตรงจาก spooled buffer ของ upload (ไม่เขียน /tmp)
+            try:
+                return f"upload:{file.filename or 'upload'}", read_image_upload(file), None
+            except UploadTooLarge as e:
+                return JSONResponse(status_code=413, content={"detail": str(e)})
 
-    if GATE_TRIGGER_MODE == "every_record":
-        return True, "every_record"
+        # Support both regular image URLs and MJPEG streams (like DroidCam)
+        if "mjpegfeed" in image_url.lower() or "mjpeg" in image_url.lower():
+            # MJPEG stream - use VideoCapture to get a frame (จำกัดเวลาเปิด/อ่าน stream)
+            timeout_ms = int(IMAGE_FETCH_TIMEOUT_SEC * 1000)
+            cap = cv2.VideoCapture(image_url, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
+            if not cap.isOpened():
+                return JSONResponse(status_code=400, content={"detail": "Cannot connect to MJPEG stream. Check IP and Port."})
+            ret, img = cap.read()
+            cap.release()
+            if not ret or img is None:
+                return JSONResponse(status_code=400, content={"detail": "Cannot read frame from MJPEG stream"})
+            return image_url, None, img
 
-    if GATE_TRIGGER_MODE == "per_plate_cooldown":
-        now = datetime.utcnow()
-        last = _recent_open_by_plate.get(plate_norm)
-        if last and (now - last) < timedelta(seconds=OPEN_COOLDOWN_SEC):
-            left = OPEN_COOLDOWN_SEC - int((now - last).total_seconds())
-            return False, f"cooldown({left}s) plate={plate_norm}"
-        _recent_open_by_plate[plate_norm] = now
-        return True, f"cooldown_ok plate={plate_norm}"
+        # Regular image URL
+        try:
+            return image_url, read_image_url(image_url, timeout=IMAGE_FETCH_TIMEOUT_SEC), None
+        except UploadTooLarge as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+        except Exception as e:
+            return JSONResponse(status_code=400, content={"detail": f"Cannot fetch image from URL: {str(e)}"})
+
+def _recognize_image(image_source: str, buf, frame, cascade: Cascade):
+    """
+    งานอ่านป้ายของ /detect (รันบน recognition executor): decode -> detector -> reader -> fallback -> parse
+    คืน dict ของผล หรือ JSONResponse ถ้า decode ภาพไม่ได้
+    """
+    if frame is not None:
+        dec = DecodedImage(resize_to_width(frame))
+    else:
+        # decode แบบย่อขนาดตั้งแต่ decode
+        with cascade.stage("decode", cancellable=False):
+            dec = decode_for_detection(buf)
+    if dec is None:
+        return JSONResponse(status_code=400, content={"detail": "Cannot read image"})
 
-    return False, f"unknown_mode({GATE_TRIGGER_MODE})"
+    # --- 1) Detector -> reader -> fallback -> parse (api/recognition.py) ---
+    result = recognize_plate(dec, cascade)
+    result["image_source"] = image_source
+    return result
 
 # =============================
 # /detect: detector -> reader (+fallback OCR), save DB, THEN gate decision -> Arduino
+# (GATE_FAST_PATH=1: gate ก่อน แล้วค่อย save ภาพ/DB/broadcast)
 # =============================
 @app.post("/detect", response_model=PlateCreateResponse)
 async def detect(
     file: UploadFile | None = File(default=None),
-    image_url: str | None = Form(default=None)
+    image_url: str | None = Form(default=None),
+    lane: str | None = Form(default=None),    # lane id ตรงๆ
+    camera: str | None = Form(default=None),  # หรือ camera id / URL ตาม GATE_LANES
+    priority: str | None = Form(default=None),  # gate | upload | batch (ไม่ระบุ = เดาจาก source)
+    latency_budget_ms: str | None = Header(default=None, alias="X-Latency-Budget-Ms"),
 ):
+    t_request = time.perf_counter()
     if not file and not image_url:
         return JSONResponse(status_code=400, content={"detail": "Provide file or image_url"})
-
-    # --- Prepare image source ---
-    used_crop = False
-    image_source = None
-    if file:
-        data = await file.read()  # async read OK
-        tmp_path = f"/tmp/{uuid4().hex}_{file.filename or 'upload'}"
-        with open(tmp_path, "wb") as f:
-            f.write(data)
-        image_source = tmp_path
-        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    else:
-        image_source = image_url
-        # Support both regular image URLs and MJPEG streams (like DroidCam)
-        if "mjpegfeed" in image_url.lower() or "mjpeg" in image_url.lower():
-            # MJPEG stream - use VideoCapture to get a frame
-            cap = cv2.VideoCapture(image_url)
-            if cap.isOpened():
-                ret, img = cap.read()
-                cap.release()
-                if not ret or img is None:
-                    return JSONResponse(status_code=400, content={"detail": "Cannot read frame from MJPEG stream"})
-            else:
-                return JSONResponse(status_code=400, content={"detail": "Cannot connect to MJPEG stream. Check IP and Port."})
-        else:
-            # Regular image URL
-            try:
-                import urllib.request
-                resp = urllib.request.urlopen(image_url, timeout=5)
-                arr = np.asarray(bytearray(resp.read()), dtype=np.uint8)
-                img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            except Exception as e:
-                return JSONResponse(status_code=400, content={"detail": f"Cannot fetch image from URL: {str(e)}"})
-
-    if img is None:
-        return JSONResponse(status_code=400, content={"detail": "Cannot read image"})
-
-    H, W = img.shape[:2]
-    
-    # Resize image if too large to speed up processing (max 1920px width)
-    MAX_WIDTH = 1920
-    if W > MAX_WIDTH:
-        scale = MAX_WIDTH / W
-        new_h = int(H * scale)
-        new_w = MAX_WIDTH
-        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        H, W = img.shape[:2]
-        print(f"DEBUG: Resized image from {W}x{H} to {new_w}x{new_h} for faster processing", flush=True)
-
-    # --- 1) Detector ---
-    det_preds = infer_detector(img)
-    try:
-        print("DEBUG detector:",
-              [(p.get("class"), round(float(p.get("confidence", 0)), 3)) for p in det_preds][:8],
-              flush=True)
-    except Exception as e:
-        print("DEBUG detector print error:", e, flush=True)
-
-    # --- Choose ROI for reader/OCR ---
-    if det_preds:
-        best_det = max(det_preds, key=lambda x: float(x.get("confidence", 0)))
-        x1, y1, x2, y2 = int(best_det["x1"]), int(best_det["y1"]), int(best_det["x2"]), int(best_det["y2"])
-        # sanitize
-        x1, y1 = max(0, min(x1, x2)), max(0, min(y1, y2))
-        x2, y2 = max(0, max(x1, x2)), max(0, max(y1, y2))
-        x1, y1, x2, y2 = min(x1, W-1), min(y1, H-1), min(x2, W), min(y2, H)
-        # 5% padding helps OCR
-        pad = int(0.05 * max(x2 - x1, y2 - y1))
-        x1p, y1p = max(0, x1 - pad), max(0, y1 - pad)
-        x2p, y2p = min(W, x2 + pad), min(H, y2 + pad)
-        crop = img[y1p:y2p, x1p:x2p]
-        img_for_ocr = crop
-        used_crop = True
-    else:
-        best_det = None
-        img_for_ocr = img
-
-    # DEBUG save crop (disabled for performance - enable only when debugging)
-    # try:
-    #     debug_path = f"/tmp/ocr_crop_{uuid4().hex}.png"
-    #     cv2.imwrite(debug_path, img_for_ocr)
-    #     print("DEBUG saved crop:", debug_path, flush=True)
-    # except Exception as e:
-    #     print("DEBUG save crop error:", e, flush=True)
-
-    # --- 2) Reader on ROI ---
-    rf = infer_reader(img_for_ocr)
+    gate_lane = lane_registry.resolve(lane, camera, image_url)
+    if gate_lane is None:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown lane: {lane}"})
+    # งบเวลาของ cascade: header > budget_ms ของ lane > DETECT_BUDGET_MS
+    cascade = Cascade(resolve_budget_ms(latency_budget_ms, gate_lane), t0=t_request)
+
+    priority = classify_priority(priority, image_url=image_url, lane=lane, camera=camera)
+    root_span = current_span()  # root ของ trace จาก TraceMiddleware (None = ไม่ trace)
+    if root_span is not None:
+        root_span.set(priority=priority, lane=gate_lane.id, budget_ms=cascade.budget_ms)
+    # อ่านภาพก่อน (นอก slot) แล้วค่อยขอช่องเฉพาะงาน decode / detector / reader / OCR
+    fetched = await asyncio.to_thread(_fetch_image, file, image_url, cascade)
+    if isinstance(fetched, JSONResponse):
+        return fetched
     try:
-        print("DEBUG reader preds:",
-              [(p.get("class") or p.get("name"),
-                round(float(p.get("confidence", p.get("conf", 0))), 3))
-               for p in rf.get("predictions", [])][:12],
-              flush=True)
-    except Exception as e:
-        print("DEBUG reader print error:", e, flush=True)
-
-    preds = rf.get("predictions", [])
-    
-    # --- Reader-first pipeline: ใช้ผลจาก Reader Model เรียงตัวอักษรทีละตัว ---
-    plate_text = ""
-    province_text = ""
-    conf = None
-    character_details = []
-    
-    def _build_plate_from_reader(preds_list):
-        """เรียงตัวอักษรตามตำแหน่งและรวมเป็นข้อความแบบเป็นแถว"""
-        if not preds_list:
-            return "", [], None
-        
-        try:
-            filtered = [p for p in preds_list if float(p.get("confidence", 0)) >= 0.35]
-            if not filtered:
-                return "", [], None
-            
-            # ประเมินความสูงเฉลี่ยเพื่อใช้ threshold แยกแถว
-            heights = []
-            for p in filtered:
-                y1, y2 = p.get("y1"), p.get("y2")
-                if y1 is not None and y2 is not None:
-                    heights.append(abs(float(y2) - float(y1)))
-            avg_h = sum(heights) / len(heights) if heights else 40.0
-            row_thresh = max(20.0, avg_h * 0.6)  # ยืดหยุ่นตามขนาดตัวอักษร
-            
-            # จัดกลุ่มตามแถว (y)
-            rows: dict[float, list] = {}
-            for p in filtered:
-                y = float(p.get("y", 0))
-                found = False
-                for row_y in sorted(rows.keys()):
-                    if abs(y - row_y) < row_thresh:
-                        rows[row_y].append(p)
-                        found = True
-                        break
-                if not found:
-                    rows[y] = [p]
-            
-            # เรียงแถวบนลงล่าง และซ้ายไปขวา
-            character_details_local = []
-            row_texts = []
-            for row_y in sorted(rows.keys()):
-                row = rows[row_y]
-                row.sort(key=lambda p: float(p.get("x", 0)))
-                row_chars = []
-                for p in row:
-                    char_cls = (p.get("class") or p.get("name") or "").strip()
-                    c_conf = float(p.get("confidence", p.get("conf", 0)) or 0)
-                    if not char_cls:
-                        continue
-                    row_chars.append(char_cls)
-                    character_details_local.append({
-                        "character": char_cls,
-                        "confidence": c_conf,
-                        "bbox": {
-                            "x1": p.get("x1"), "y1": p.get("y1"),
-                            "x2": p.get("x2"), "y2": p.get("y2"),
-                        },
-                        "method": "reader_model"
-                    })
-                if row_chars:
-                    row_texts.append("".join(row_chars))
-            
-            full_text = " ".join(row_texts).strip()
-            # ทำความสะอาดช่องว่างซ้ำ
-            full_text = " ".join(full_text.split())
-            
-            avg_conf = None
-            try:
-                avg_conf = sum(d["confidence"] for d in character_details_local) / len(character_details_local) if character_details_local else None
-            except Exception:
-                avg_conf = None
-            
-            return full_text, character_details_local, avg_conf
-        except Exception as e:
-            print(f"DEBUG _build_plate_from_reader error: {e}", flush=True)
-            return "", [], None
-    
-    # 1) ใช้ Reader Model ตรง
-    if preds:
-        plate_text, character_details, conf_reader = _build_plate_from_reader(preds)
-        if conf is None and conf_reader is not None:
-            conf = conf_reader
-    
-    # 2) Fallback Character Segmentation + OCR ถ้า reader ไม่ได้ผล
-    if not plate_text or len(plate_text) < 2:
-        try:
-            from .character_segmentation import read_plate_by_characters
-            segmented_text, character_details = read_plate_by_characters(img_for_ocr)
-            if segmented_text and len(segmented_text) >= 2:
-                plate_text = segmented_text
-                print(f"DEBUG Character Segmentation result: {plate_text} ({len(character_details)} chars)", flush=True)
-        except Exception as e:
-            print(f"DEBUG Character segmentation error: {e}", flush=True)
-    
-    # 3) Fallback OCR เต็มป้าย ถ้ายังว่าง
-    if not plate_text or len(plate_text) < 2:
-        try:
-            h_, w_ = img_for_ocr.shape[:2]
-            plate_text = _clean_text(run_ocr_on_bbox(img_for_ocr, 0, 0, w_, h_))
-            print(f"DEBUG OCR fallback result: {plate_text}", flush=True)
-        except Exception as ocr_error:
-            print(f"DEBUG OCR fallback error: {ocr_error}", flush=True)
-
-    # --- Parse province from plate_text ---
-    if plate_text and not province_text:
-        parsed = parse_plate(plate_text)
-        if parsed["province_code"]:
-            province_text = parsed["province_name"]
-            plate_text = parsed["formatted_text"]  # จัดรูปแบบให้สวย
-        print(f"DEBUG parsed plate: {parsed}", flush=True)
-
-    # --- Backfill conf from detector if missing ---
-    if conf is None and best_det is not None:
-        try:
-            conf = float(best_det.get("confidence", 0.0))
-        except Exception:
-            conf = None
-
-    # --- Save cropped plate image ---
+        # รอช่องของ recognition executor ตาม priority (คิวเต็ม 429 / รอนานเกิน 503)
+        async with admission.slot(priority, deadline=cascade.deadline):
+            result = await admission.run(_recognize_image, *fetched, cascade)
+    except AdmissionRejected as e:
+        log.warning("[ADMISSION] 🚫 %s %s: %s", e.status_code, priority, e.detail)
+        return e.response()
+    if isinstance(result, JSONResponse):
+        return result
+    image_source, used_crop, img_for_ocr = result["image_source"], result["used_crop"], result["img_for_ocr"]
+    det_preds, rf, character_details = result["det_preds"], result["rf"], result["character_details"]
+    plate_text, province_text, conf = result["plate_text"], result["province_text"], result["conf"]
+    if root_span is not None:
+        root_span.set(plate_text=plate_text or "", degraded=cascade.degraded, reader_method=result["reader_method"])
+
+    # --- Gate decision (allow/deny/prefix/cooldown) ---
+    gate_event = None
+    gate_open, gate_reason = False, "empty_plate"
+    if plate_text and plate_text.strip():
+        gate_open, gate_reason = should_open(plate_text, conf)
+        # Gate-first: สั่งเปิดไม้ก่อนงานบันทึกทั้งหมด
+        if GATE_FAST_PATH and gate_open:
+            gate_event = _issue_gate_fast(plate_text, conf, image_source, t_request, gate_lane, reason=gate_reason)
+        lane_registry.note_plate(gate_lane, plate_text)
+
+    # --- Save cropped plate image (write-behind: ได้ชื่อไฟล์ทันที เขียนดิสก์ใน background) ---
     plate_img_filename = None
     if img_for_ocr is not None and img_for_ocr.size > 0:
-        plate_img_filename = f"plate_{uuid4().hex}.jpg"
-        plate_img_path = f"uploads/plates/{plate_img_filename}"
-        cv2.imwrite(plate_img_path, img_for_ocr)
+        plate_img_filename = image_writer.submit(img_for_ocr)
     
     # --- Check if plate has been seen before ---
     db = SessionLocal()
     existing_plate = None
+    first_seen_info = None
     rec_id = None
     is_new_plate = True
     seen_count = 1
@@ -522,13 +510,21 @@ async def detect(
         
         if normalized_plate:
             # Check if this plate (normalized) was seen before
-            existing_plate = db.query(PlateRecord).filter(
+            existing_plate = db.query(PlateRecord).options(
+                load_only(PlateRecord.id, PlateRecord.confidence, PlateRecord.first_seen_at, PlateRecord.created_at)
+            ).filter(
                 func.replace(func.replace(PlateRecord.plate_text, " ", ""), "-", "") == normalized_plate
             ).order_by(PlateRecord.created_at.asc()).first()
             
             if existing_plate:
                 is_new_plate = False
                 first_seen_at = existing_plate.first_seen_at or existing_plate.created_at
+                # อ่านค่าก่อน commit (commit จะ expire object และ session ถูกปิดหลังจากนี้)
+                first_seen_info = {
+                    "id": existing_plate.id,
+                    "first_seen_at": first_seen_at.isoformat() if first_seen_at else None,
+                    "first_seen_confidence": float(existing_plate.confidence) if existing_plate.confidence is not None else None
+                }
                 # Count all records with same normalized plate
                 seen_count = db.query(func.count(PlateRecord.id)).filter(
                     func.replace(func.replace(PlateRecord.plate_text, " ", ""), "-", "") == normalized_plate
@@ -541,23 +537,24 @@ async def detect(
             confidence=conf,
             image_path=(image_source if not used_crop else f"{image_source}#crop"),
             plate_image_path=plate_img_filename,
-            detections_json=json.dumps({
-                "reader": rf, 
+            detections=make_detection_row({
+                "reader": rf,
                 "detector": det_preds[:5],
-                "character_details": character_details
-            }, ensure_ascii=False),
+                "character_details": character_details,
+                "cascade": cascade.summary(),
+            }),
             is_new_plate=is_new_plate,
             seen_count=seen_count,
             first_seen_at=first_seen_at
         )
         db.add(rec)
-        db.commit()
+        with DB_COMMIT_SECONDS.labels("detect").time(), span("db.commit"):
+            db.commit()
         db.refresh(rec)
         rec_id = rec.id
+        PLATES_TOTAL.labels("new" if is_new_plate else "duplicate").inc()
     except Exception as e:
-        print(f"ERROR saving to database: {e}", flush=True)
-        import traceback
-        print(traceback.format_exc(), flush=True)
+        log.exception("ERROR saving to database: %s", e)
         db.rollback()
     finally:
         db.close()
@@ -568,27 +565,10 @@ async def detect(
             content={"detail": "Failed to save record to database"}
         )
     
-    # --- Get first seen record info if duplicate (for WebSocket) ---
-    first_seen_info_ws = None
-    if not is_new_plate and existing_plate:
-        try:
-            first_seen_at_str = None
-            if existing_plate.first_seen_at:
-                first_seen_at_str = existing_plate.first_seen_at.isoformat()
-            elif existing_plate.created_at:
-                first_seen_at_str = existing_plate.created_at.isoformat()
-            
-            first_seen_info_ws = {
-                "id": existing_plate.id,
-                "first_seen_at": first_seen_at_str,
-                "first_seen_confidence": float(existing_plate.confidence) if existing_plate.confidence is not None else None
-            }
-        except Exception as e:
-            print(f"ERROR creating first_seen_info_ws: {e}", flush=True)
-    
     # --- Broadcast via WebSocket (with full detection info) ---
     await manager.broadcast({
         "type": "detection",
+        "lane": gate_lane.id,
         "id": rec_id,
         "plate_text": plate_text or "",
         "province_text": province_text or "",
@@ -596,25 +576,48 @@ async def detect(
         "is_new_plate": is_new_plate,
         "seen_count": seen_count,
         "first_seen_at": first_seen_at.isoformat() if isinstance(first_seen_at, datetime) else None,
-        "first_seen_info": first_seen_info_ws,
+        "first_seen_info": first_seen_info,
+        "degraded": cascade.degraded,
         "timestamp": datetime.utcnow().isoformat()
     })
 
-    # --- เปิด gate ทุกครั้งที่บันทึกข้อมูลสำเร็จ (ไม่ต้องเช็คเงื่อนไข) ---
-    if plate_text and len(plate_text.strip()) > 0:
-        print(f"[GATE] 🚀 Starting gate open process...", flush=True)
-        print(f"[GATE] 🚀 Plate: '{plate_text}', Confidence: {conf}, New: {is_new_plate}, Seen: {seen_count}", flush=True)
+    if gate_event is not None:
+        # fast path: ส่งคำสั่งไปแล้ว แค่ผูก gate event กับ record ที่เพิ่งบันทึก
+        gate_event["record_id"] = rec_id
+        gate_outbox.record(gate_event)
+    elif plate_text and len(plate_text.strip()) > 0 and not gate_open:
+        gate_log.info("[GATE] ⛔ Not opening for '%s': %s", plate_text, gate_reason)
+        _record_gate_result(plate_text, False, gate_reason, image_source, rec_id, action="denied")
+        lane_registry.note_gate(gate_lane, "denied")
+        await manager.broadcast({
+            "type": "gate",
+            "lane": gate_lane.id,
+            "action": "denied",
+            "plate_text": plate_text,
+            "reason": gate_reason,
+            "is_new_plate": is_new_plate,
+            "seen_count": seen_count,
+            "confidence": float(conf) if conf is not None else None,
+            "gate_success": False
+        })
+    # --- บันทึกข้อมูลสำเร็จ และ decision engine อนุญาต -> เปิด gate ---
+    elif plate_text and len(plate_text.strip()) > 0:
+        gate_log.info("[GATE] 🚀 Starting gate open process (%s) plate='%s' confidence=%s new=%s seen=%s",
+                      gate_reason, plate_text, conf, is_new_plate, seen_count)
         
         try:
-            gate_success = send_open_gate(plate_text or "")
-            print(f"[GATE] 🚀 Gate command result: {gate_success}", flush=True)
+            gate_success = await open_gate(plate_text or "", gate_lane.controller)
+            gate_log.debug("[GATE] 🚀 Gate command result: %s", gate_success)
+            _record_gate_result(plate_text, gate_success, gate_reason, image_source, rec_id)
+            lane_registry.note_gate(gate_lane, "opened" if gate_success else "attempted", gate_lane.controller.last_rtt_ms)
             
             # Broadcast gate event (always broadcast, even if gate failed)
             await manager.broadcast({
                 "type": "gate",
+                "lane": gate_lane.id,
                 "action": "opened" if gate_success else "attempted",
                 "plate_text": plate_text or "",
-                "reason": "บันทึกข้อมูลสำเร็จ - เปิด gate ทุกครั้ง",
+                "reason": gate_reason,
                 "is_new_plate": is_new_plate,
                 "seen_count": seen_count,
                 "confidence": float(conf) if conf is not None else None,
@@ -622,43 +625,25 @@ async def detect(
             })
             
             if gate_success:
-                print(f"[GATE] ✅ Gate opened successfully for plate: '{plate_text}'", flush=True)
+                gate_log.info("[GATE] ✅ Gate opened successfully for plate: '%s'", plate_text)
             else:
-                print(f"[GATE] ⚠️ Gate command sent but may not have opened. Check Arduino connection.", flush=True)
+                gate_log.warning("[GATE] ⚠️ Gate command sent but may not have opened. Check Arduino connection.")
                 
         except Exception as e:
             # อย่าให้ API พังถ้า serial ล้มเหลว
-            print(f"[GATE] ❌ ERROR in gate control: {e}", flush=True)
-            import traceback
-            print(f"[GATE] Traceback: {traceback.format_exc()}", flush=True)
+            gate_log.exception("[GATE] ❌ ERROR in gate control: %s", e)
+            _record_gate_result(plate_text, False, str(e), image_source, rec_id, action="error")
+            lane_registry.note_gate(gate_lane, "error")
             await manager.broadcast({
                 "type": "gate",
+                "lane": gate_lane.id,
                 "action": "error",
                 "plate_text": plate_text or "",
                 "error": str(e)
             })
     else:
-        print(f"[GATE] ⚠️ Skipping gate open - no plate text detected", flush=True)
+        gate_log.debug("[GATE] Skipping gate open - no plate text detected")
 
-    # --- Get first seen record info if duplicate ---
-    first_seen_info = None
-    if not is_new_plate and existing_plate:
-        try:
-            first_seen_at_str = None
-            if existing_plate.first_seen_at:
-                first_seen_at_str = existing_plate.first_seen_at.isoformat()
-            elif existing_plate.created_at:
-                first_seen_at_str = existing_plate.created_at.isoformat()
-            
-            first_seen_info = {
-                "id": existing_plate.id,
-                "first_seen_at": first_seen_at_str,
-                "first_seen_confidence": float(existing_plate.confidence) if existing_plate.confidence is not None else None
-            }
-        except Exception as e:
-            print(f"ERROR creating first_seen_info: {e}", flush=True)
-            first_seen_info = None
-    
     # Format first_seen_at for response
     first_seen_at_str = None
     try:
@@ -667,7 +652,7 @@ async def detect(
         elif isinstance(first_seen_at, str):
             first_seen_at_str = first_seen_at
     except Exception as e:
-        print(f"ERROR formatting first_seen_at: {e}", flush=True)
+        log.error("ERROR formatting first_seen_at: %s", e)
     
     response_data = {
         "id": rec_id,
@@ -677,15 +662,15 @@ async def detect(
         "is_new_plate": is_new_plate,
         "seen_count": seen_count,
         "first_seen_at": first_seen_at_str,
-        "first_seen_info": first_seen_info
+        "first_seen_info": first_seen_info,
+        "plate_image": plate_url(plate_img_filename),
+        "degraded": cascade.degraded,
     }
     
     try:
         return PlateCreateResponse(**response_data)
     except Exception as e:
-        print(f"ERROR creating response: {e}", flush=True)
-        import traceback
-        print(traceback.format_exc(), flush=True)
+        log.exception("ERROR creating response: %s", e)
         return JSONResponse(
             status_code=500,
             content={"detail": f"Error creating response: {str(e)}"}
@@ -698,14 +683,26 @@ async def detect(
 async def detect_video(
     file: UploadFile | None = File(default=None),
     video_url: str | None = Form(default=None),
+    lane: str | None = Form(default=None),
+    camera: str | None = Form(default=None),
     frame_stride: int = int(os.getenv("VIDEO_FRAME_STRIDE", "10")),
     max_frames: int = int(os.getenv("VIDEO_MAX_FRAMES", "600")),
     open_gate_first: bool = os.getenv("VIDEO_OPEN_GATE_FIRST", "true").lower() == "true"
 ):
     if not file and not video_url:
         return JSONResponse(status_code=400, content={"detail": "Provide video file or video_url"})
+    gate_lane = lane_registry.resolve(lane, camera, video_url)
+    if gate_lane is None:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown lane: {lane}"})
+    # รับงานวิดีโอพร้อมกันไม่เกิน ADMISSION_BATCH_JOBS (ปฏิเสธก่อนรับไฟล์)
+    try:
+        admission.open_job()
+    except AdmissionRejected as e:
+        log.warning("[ADMISSION] 🚫 %s batch: %s", e.status_code, e.detail)
+        return e.response()
 
-    local_video_path = None
+    scratch = None
+    cap = None
     cap_source = None
     
     try:
@@ -716,20 +713,19 @@ async def detect_video(
             if ext not in [".mp4", ".avi", ".mov", ".mkv", ".webm", ".flv"]:
                 ext = ".mp4"  # Default to mp4
             
-            data = await file.read()
-            if not data or len(data) == 0:
+            # stream ลง scratch ทีละ chunk (ไม่ buffer ทั้งไฟล์ใน RAM)
+            scratch = ScratchFile(ext)
+            size = await scratch.save_upload(file)
+            if size == 0:
                 return JSONResponse(status_code=400, content={"detail": "Empty video file"})
             
-            local_video_path = f"/tmp/{uuid4().hex}{ext}"
-            with open(local_video_path, "wb") as f:
-                f.write(data)
-            cap_source = local_video_path
-            image_path_for_db = local_video_path
-            print(f"DEBUG: Saved video file to {local_video_path} ({len(data)} bytes)", flush=True)
+            cap_source = scratch.path
+            image_path_for_db = f"upload:{filename}"
+            video_log.debug("Spooled video upload to %s (%d bytes)", scratch.path, size)
         else:
             cap_source = video_url
             image_path_for_db = video_url
-            print(f"DEBUG: Using video URL: {video_url}", flush=True)
+            video_log.debug("Using video URL: %s", video_url)
 
         # Try to open video
         cap = cv2.VideoCapture(cap_source)
@@ -738,30 +734,21 @@ async def detect_video(
             # If URL, try downloading first
             if video_url:
                 try:
-                    import urllib.request
-                    tmpv = f"/tmp/{uuid4().hex}.mp4"
-                    print(f"DEBUG: Downloading video from URL...", flush=True)
-                    urllib.request.urlretrieve(video_url, tmpv)
-                    cap = cv2.VideoCapture(tmpv)
+                    video_log.debug("Downloading video from URL...")
+                    scratch = ScratchFile(".mp4")
+                    await asyncio.to_thread(scratch.download, video_url)
+                    cap = cv2.VideoCapture(scratch.path)
                     if cap.isOpened():
-                        local_video_path = tmpv
-                        cap_source = tmpv
-                        print(f"DEBUG: Successfully downloaded and opened video", flush=True)
+                        cap_source = scratch.path
+                        video_log.debug("Successfully downloaded and opened video")
                     else:
-                        if local_video_path and os.path.exists(local_video_path):
-                            try: os.remove(local_video_path)
-                            except: pass
                         return JSONResponse(status_code=400, content={"detail": "Cannot open video file. Please check if the video format is supported (MP4, AVI, MOV, etc.)"})
+                except (UploadTooLarge, ScratchQuotaExceeded):
+                    raise
                 except Exception as e:
-                    print(f"DEBUG: Error downloading video: {e}", flush=True)
-                    if local_video_path and os.path.exists(local_video_path):
-                        try: os.remove(local_video_path)
-                        except: pass
+                    video_log.warning("Error downloading video: %s", e)
                     return JSONResponse(status_code=400, content={"detail": f"Cannot fetch video: {str(e)}"})
             else:
-                if local_video_path and os.path.exists(local_video_path):
-                    try: os.remove(local_video_path)
-                    except: pass
                 return JSONResponse(status_code=400, content={"detail": "Cannot open video file. Please check if the video format is supported (MP4, AVI, MOV, etc.)"})
         
         # Verify video properties
@@ -770,24 +757,153 @@ async def detect_video(
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
-        print(f"DEBUG: Video opened successfully - FPS: {fps}, Frames: {frame_count}, Size: {width}x{height}", flush=True)
+        video_log.info("Video opened - FPS: %s, Frames: %d, Size: %dx%d", fps, frame_count, width, height)
         
         if frame_count == 0:
-            cap.release()
-            if local_video_path and os.path.exists(local_video_path):
-                try: os.remove(local_video_path)
-                except: pass
             return JSONResponse(status_code=400, content={"detail": "Video file appears to be empty or corrupted"})
-            
+
+        return await _process_video_frames(cap, image_path_for_db, frame_stride, max_frames, gate_lane)
+
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    except ScratchQuotaExceeded as e:
+        return JSONResponse(status_code=503, headers={"Retry-After": "30"}, content={"detail": str(e)})
     except Exception as e:
-        print(f"DEBUG: Error preparing video: {e}", flush=True)
-        import traceback
-        print(traceback.format_exc(), flush=True)
-        if local_video_path and os.path.exists(local_video_path):
-            try: os.remove(local_video_path)
-            except: pass
+        video_log.exception("Error processing video: %s", e)
         return JSONResponse(status_code=500, content={"detail": f"Error processing video: {str(e)}"})
+    finally:
+        admission.close_job()
+        # Cleanup (ลบไฟล์ scratch เสมอ ไม่ว่าจะสำเร็จหรือ error)
+        if cap is not None:
+            try:
+                cap.release()
+            except Exception as e:
+                video_log.warning("Error releasing video capture: %s", e)
+        if scratch is not None:
+            scratch.cleanup()
+
+def _recognize_frame(frame, i: int):
+    """งานอ่านป้ายของ frame วิดีโอ (รันบน recognition executor) คืน None ถ้า frame นี้ไม่มีป้าย"""
+    try:
+        frame_img = frame
+        video_log.debug("Processing frame %d (%dx%d)", i, frame_img.shape[1], frame_img.shape[0])
+        
+        # 1) Detector
+        try:
+            with STAGE_SECONDS.labels("video", "detector").time(), span("detector"):
+                det_preds = infer_detector(frame_img)
+        except Exception as det_error:
+            video_log.warning("Detector error on frame %d: %s", i, det_error)
+            return None
+        
+        if not det_preds or len(det_preds) == 0:
+            video_log.debug("No detections in frame %d, skipping", i)
+            return None
+        
+        video_log.debug("Found %d detections in frame %d", len(det_preds), i)
+        
+        # 2) Reader - get best detection
+        try:
+            best_det = max(det_preds, key=lambda x: float(x.get("confidence", 0)))
+            x1, y1, x2, y2 = int(best_det["x1"]), int(best_det["y1"]), int(best_det["x2"]), int(best_det["y2"])
+        except Exception as det_parse_error:
+            video_log.debug("Error parsing detection bbox: %s", det_parse_error)
+            return None
+        
+        # Sanitize and add padding
+        H, W = frame_img.shape[:2]
+        x1, y1 = max(0, min(x1, x2)), max(0, min(y1, y2))
+        x2, y2 = max(0, max(x1, x2)), max(0, max(y1, y2))
+        x1, y1, x2, y2 = min(x1, W-1), min(y1, H-1), min(x2, W), min(y2, H)
+        
+        # Validate bbox
+        if x2 <= x1 or y2 <= y1:
+            video_log.debug("Invalid bbox in frame %d: (%d,%d,%d,%d)", i, x1, y1, x2, y2)
+            return None
+        
+        pad = int(0.05 * max(x2 - x1, y2 - y1))
+        x1p, y1p = max(0, x1 - pad), max(0, y1 - pad)
+        x2p, y2p = min(W, x2 + pad), min(H, y2 + pad)
+        crop = frame_img[y1p:y2p, x1p:x2p]
+        
+        # Validate crop
+        if crop is None or crop.size == 0:
+            video_log.debug("Invalid crop in frame %d", i)
+            return None
+        
+        # 3) Reader
+        try:
+            with STAGE_SECONDS.labels("video", "reader").time(), span("reader"):
+                rf = infer_reader(crop, conf=READER_ALT_MIN_CONF)
+        except Exception as reader_error:
+            video_log.warning("Reader error on frame %d: %s", i, reader_error)
+            return None
+            
+    except Exception as e:
+        video_log.exception("Video processing error on frame %d: %s", i, e)
+        return None
+
+    # --- 3) Character Segmentation + OCR ---
+    preds = rf.get("predictions", [])
+    plate_text, province_text = "", ""
+    conf = None
+    character_details = []
+    
+    # Get confidence from reader model (ไม่นับตัวเลือกสำรองที่ต่ำกว่า READER_MIN_CONF)
+    strong = [float(p.get("confidence", 0)) for p in preds if float(p.get("confidence", 0)) >= READER_MIN_CONF]
+    if strong:
+        conf = sum(strong) / len(strong)
+    
+    # Reader อ่านได้ตามรูปแบบป้ายแล้ว ไม่ต้องแยกตัวอักษร/OCR ซ้ำ
+    with STAGE_SECONDS.labels("video", "reader_decode").time(), span("reader_decode"):
+        reading = decode_plate(preds) if preds else None
+    if reading is not None:
+        plate_text = reading["text"]
+        province_text = reading["province"]
+        character_details = reading["characters"]
+        conf = reading["confidence"]
+        if not province_text:
+            parsed = parse_plate(plate_text)
+            if parsed["province_code"]:
+                province_text = parsed["province_name"]
+                plate_text = parsed["formatted_text"]
+        video_log.debug("reader beam: %s, Province: %s", plate_text, province_text, extra={"frame": i})
+
+    # Use Character Segmentation (แยกตัวอักษรทีละตัว)
+    elif crop.size > 0:
+        try:
+            from .character_segmentation import read_plate_by_characters
+            FALLBACK_TOTAL.labels("video", "segmentation").inc()
+            with STAGE_SECONDS.labels("video", "segmentation").time(), span("segmentation"):
+                segmented_text, character_details = read_plate_by_characters(crop)
+            
+            if segmented_text and len(segmented_text) >= 2:
+                plate_text = segmented_text
+                video_log.debug("Character Segmentation: %s (%d chars)", plate_text, len(character_details), extra={"frame": i})
+            else:
+                # Fallback to full OCR
+                FALLBACK_TOTAL.labels("video", "ocr").inc()
+                with STAGE_SECONDS.labels("video", "ocr").time(), span("ocr"):
+                    plate_text = clean_text(run_ocr_on_bbox(crop, 0, 0, crop.shape[1], crop.shape[0]))
+                video_log.debug("Fallback OCR: %s", plate_text, extra={"frame": i})
+            
+            # Parse province from plate text
+            if plate_text:
+                parsed = parse_plate(plate_text)
+                if parsed["province_code"]:
+                    province_text = parsed["province_name"]
+                    plate_text = parsed["formatted_text"]
+                video_log.debug("parsed: %s, Province: %s", plate_text, province_text, extra={"frame": i})
+        except Exception as e:
+            video_log.warning("OCR error on frame %d: %s, trying fallback", i, e)
+            try:
+                plate_text = clean_text(run_ocr_on_bbox(crop, 0, 0, crop.shape[1], crop.shape[0]))
+            except Exception as e2:
+                video_log.warning("Fallback OCR also failed on frame %d: %s", i, e2)
+
+    return {"crop": crop, "rf": rf, "plate_text": plate_text, "province_text": province_text, "conf": conf}
 
+async def _process_video_frames(cap, image_path_for_db: str, frame_stride: int, max_frames: int, gate_lane):
     seen_plates: Set[str] = set()
     saved_ids: List[int] = []
     session_id = uuid4().hex
@@ -797,12 +913,16 @@ async def detect_video(
     errors_count = 0
     max_errors = 10  # Stop if too many consecutive errors
     
-    print(f"DEBUG: Starting video processing - stride: {frame_stride}, max_frames: {max_frames}", flush=True)
+    video_log.info("Starting video processing - stride: %d, max_frames: %d", frame_stride, max_frames, extra={"session_id": session_id})
     
+    frame_trace = None
     while True:
+        # trace ของ frame ก่อนหน้าจบตรงนี้ (ทุกทางที่ continue ออกมา)
+        finish_trace(frame_trace)
+        frame_trace = None
         ok, frame = cap.read()
         if not ok:
-            print(f"DEBUG: Reached end of video or failed to read frame at index {i}", flush=True)
+            video_log.debug("Reached end of video or failed to read frame at index %d", i)
             break
         
         i += 1
@@ -815,164 +935,39 @@ async def detect_video(
         
         # Check max frames limit
         if processed > max_frames:
-            print(f"DEBUG: Reached max_frames limit ({max_frames})", flush=True)
+            video_log.info("Reached max_frames limit (%d)", max_frames)
             break
         
         # Validate frame
         if frame is None or frame.size == 0:
-            print(f"DEBUG: Invalid frame at index {i}, skipping", flush=True)
+            video_log.debug("Invalid frame at index %d, skipping", i)
             errors_count += 1
             if errors_count >= max_errors:
-                print(f"DEBUG: Too many errors ({errors_count}), stopping video processing", flush=True)
+                video_log.warning("Too many errors (%d), stopping video processing", errors_count)
                 break
             continue
         
         errors_count = 0  # Reset error count on successful frame read
-        
-        # Save frame to temporary file
-        tmp_img_path = f"/tmp/frame_{session_id}_{i}.jpg"
-        try:
-            success = cv2.imwrite(tmp_img_path, frame)
-            if not success:
-                print(f"DEBUG: Failed to save frame {i} to {tmp_img_path}", flush=True)
-                continue
-        except Exception as e:
-            print(f"DEBUG: Error saving frame {i}: {e}", flush=True)
-            continue
+        frame_trace = start_trace("video.frame", frame=i, session_id=session_id, lane=gate_lane.id)
 
-        try:
-            # Read frame image from file
-            frame_img = cv2.imread(tmp_img_path)
-            if frame_img is None or frame_img.size == 0:
-                print(f"DEBUG: Failed to read frame image from {tmp_img_path}", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            print(f"DEBUG: Processing frame {i} ({frame_img.shape[1]}x{frame_img.shape[0]})", flush=True)
-            
-            # 1) Detector
-            try:
-                det_preds = infer_detector(frame_img)
-            except Exception as det_error:
-                print(f"DEBUG: Detector error on frame {i}: {det_error}", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            if not det_preds or len(det_preds) == 0:
-                print(f"DEBUG: No detections in frame {i}, skipping", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            print(f"DEBUG: Found {len(det_preds)} detections in frame {i}", flush=True)
-            
-            # 2) Reader - get best detection
-            try:
-                best_det = max(det_preds, key=lambda x: float(x.get("confidence", 0)))
-                x1, y1, x2, y2 = int(best_det["x1"]), int(best_det["y1"]), int(best_det["x2"]), int(best_det["y2"])
-            except Exception as det_parse_error:
-                print(f"DEBUG: Error parsing detection bbox: {det_parse_error}", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            # Sanitize and add padding
-            H, W = frame_img.shape[:2]
-            x1, y1 = max(0, min(x1, x2)), max(0, min(y1, y2))
-            x2, y2 = max(0, max(x1, x2)), max(0, max(y1, y2))
-            x1, y1, x2, y2 = min(x1, W-1), min(y1, H-1), min(x2, W), min(y2, H)
-            
-            # Validate bbox
-            if x2 <= x1 or y2 <= y1:
-                print(f"DEBUG: Invalid bbox in frame {i}: ({x1},{y1},{x2},{y2})", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            pad = int(0.05 * max(x2 - x1, y2 - y1))
-            x1p, y1p = max(0, x1 - pad), max(0, y1 - pad)
-            x2p, y2p = min(W, x2 + pad), min(H, y2 + pad)
-            crop = frame_img[y1p:y2p, x1p:x2p]
-            
-            # Validate crop
-            if crop is None or crop.size == 0:
-                print(f"DEBUG: Invalid crop in frame {i}", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-            
-            # 3) Reader
-            try:
-                rf = infer_reader(crop)
-            except Exception as reader_error:
-                print(f"DEBUG: Reader error on frame {i}: {reader_error}", flush=True)
-                try: os.remove(tmp_img_path)
-                except: pass
-                continue
-                
-        except Exception as e:
-            print(f"DEBUG video processing error on frame {i}: {e}", flush=True)
-            import traceback
-            print(traceback.format_exc(), flush=True)
-            try: os.remove(tmp_img_path)
-            except: pass
+        # งานอ่านป้ายของ frame รันบน recognition executor ในคิว batch (priority ต่ำสุด)
+        async with admission.slot("batch", bounded=False):
+            result = await admission.run(_recognize_frame, frame, i)
+        if result is None:
             continue
+        crop, rf = result["crop"], result["rf"]
+        plate_text, province_text, conf = result["plate_text"], result["province_text"], result["conf"]
+        if frame_trace is not None:
+            frame_trace.set(plate_text=plate_text or "")
 
-        # --- 3) Character Segmentation + OCR ---
-        preds = rf.get("predictions", [])
-        plate_text, province_text = "", ""
-        conf = None
-        character_details = []
-        
-        # Get confidence from reader model
-        if preds:
-            try:
-                conf = float(sum([float(p.get("confidence", 0)) for p in preds]) / len(preds))
-            except Exception:
-                conf = None
-        
-        # Use Character Segmentation (แยกตัวอักษรทีละตัว)
-        if crop.size > 0:
-            try:
-                from .character_segmentation import read_plate_by_characters
-                segmented_text, character_details = read_plate_by_characters(crop)
-                
-                if segmented_text and len(segmented_text) >= 2:
-                    plate_text = segmented_text
-                    print(f"DEBUG video Character Segmentation: {plate_text} ({len(character_details)} chars)", flush=True)
-                else:
-                    # Fallback to full OCR
-                    plate_text = _clean_text(run_ocr_on_bbox(crop, 0, 0, crop.shape[1], crop.shape[0]))
-                    print(f"DEBUG video Fallback OCR: {plate_text}", flush=True)
-                
-                # Parse province from plate text
-                if plate_text:
-                    parsed = parse_plate(plate_text)
-                    if parsed["province_code"]:
-                        province_text = parsed["province_name"]
-                        plate_text = parsed["formatted_text"]
-                    print(f"DEBUG video parsed: {plate_text}, Province: {province_text}", flush=True)
-            except Exception as e:
-                print(f"DEBUG video OCR error: {e}, trying fallback", flush=True)
-                try:
-                    plate_text = _clean_text(run_ocr_on_bbox(crop, 0, 0, crop.shape[1], crop.shape[0]))
-                except Exception as e2:
-                    print(f"DEBUG video fallback OCR also failed: {e2}", flush=True)
-        
         # Skip if no text detected
         if not plate_text or len(plate_text) < 2:
-            try: os.remove(tmp_img_path)
-            except: pass
             continue
 
         # --- Save cropped plate image from video ---
         plate_img_filename = None
         if crop is not None and crop.size > 0:
-            plate_img_filename = f"plate_{uuid4().hex}.jpg"
-            plate_img_path = f"uploads/plates/{plate_img_filename}"
-            cv2.imwrite(plate_img_path, crop)
+            plate_img_filename = image_writer.submit(crop)
         
         db = SessionLocal()
         try:
@@ -982,10 +977,11 @@ async def detect_video(
                 confidence=conf,
                 image_path=f"{image_path_for_db}#frame={i}",
                 plate_image_path=plate_img_filename,
-                detections_json=json.dumps({"frame_index": i, "rf": rf}, ensure_ascii=False)
+                detections=make_detection_row({"frame_index": i, "rf": rf})
             )
             db.add(rec)
-            db.commit()
+            with DB_COMMIT_SECONDS.labels("video").time(), span("db.commit"):
+                db.commit()
             db.refresh(rec)
             saved_ids.append(rec.id)
         finally:
@@ -998,17 +994,36 @@ async def detect_video(
             "province_text": province_text,
             "confidence": conf,
             "timestamp": datetime.utcnow().isoformat(),
-            "source": "video"
+            "source": "video",
+            "lane": gate_lane.id
         })
 
-        # --- เปิด gate ทุกครั้งที่บันทึกข้อมูลสำเร็จ (ไม่ต้องเช็คเงื่อนไข) ---
-        if plate_text and len(plate_text.strip()) > 0:
-            print(f"[GATE(video)] 🚀 Starting gate open process for video frame {i}...", flush=True)
-            print(f"[GATE(video)] 🚀 Plate: '{plate_text}', Confidence: {conf}, Frame: {i}", flush=True)
+        # --- บันทึกข้อมูลสำเร็จ -> ถาม decision engine ก่อนเปิด gate ---
+        gate_open, gate_reason = should_open(plate_text, conf) if plate_text and plate_text.strip() else (False, "empty_plate")
+        if plate_text and len(plate_text.strip()) > 0 and not gate_open:
+            gate_log.info("[GATE(video)] ⛔ Not opening for '%s' (frame %d): %s", plate_text, i, gate_reason)
+            seen_plates.add(plate_text)
+            _record_gate_result(plate_text, False, gate_reason, image_path_for_db, saved_ids[-1], action="denied")
+            lane_registry.note_gate(gate_lane, "denied")
+            await manager.broadcast({
+                "type": "gate",
+                "action": "denied",
+                "plate_text": plate_text,
+                "reason": gate_reason,
+                "source": "video",
+                "lane": gate_lane.id,
+                "frame": i,
+                "gate_success": False
+            })
+        elif plate_text and len(plate_text.strip()) > 0:
+            gate_log.info("[GATE(video)] 🚀 Starting gate open process for video frame %d plate='%s' confidence=%s",
+                          i, plate_text, conf)
             
             try:
-                gate_success = send_open_gate(plate_text)
-                print(f"[GATE(video)] 🚀 Gate command result: {gate_success}", flush=True)
+                gate_success = await open_gate(plate_text, gate_lane.controller)
+                gate_log.debug("[GATE(video)] 🚀 Gate command result: %s", gate_success)
+                _record_gate_result(plate_text, gate_success, f"{gate_reason} (video frame {i})", image_path_for_db, saved_ids[-1])
+                lane_registry.note_gate(gate_lane, "opened" if gate_success else "attempted", gate_lane.controller.last_rtt_ms)
                 
                 seen_plates.add(plate_text)
                 
@@ -1017,50 +1032,34 @@ async def detect_video(
                     "type": "gate",
                     "action": "opened" if gate_success else "attempted",
                     "plate_text": plate_text,
-                    "reason": "บันทึกข้อมูลสำเร็จจากวิดีโอ - เปิด gate ทุกครั้ง",
+                    "reason": gate_reason,
                     "source": "video",
+                    "lane": gate_lane.id,
                     "frame": i,
                     "gate_success": gate_success
                 })
                 
                 if gate_success:
-                    print(f"[GATE(video)] ✅ Gate opened successfully for plate: '{plate_text}' (frame {i})", flush=True)
+                    gate_log.info("[GATE(video)] ✅ Gate opened successfully for plate: '%s' (frame %d)", plate_text, i)
                 else:
-                    print(f"[GATE(video)] ⚠️ Gate command sent but may not have opened. Check Arduino connection.", flush=True)
+                    gate_log.warning("[GATE(video)] ⚠️ Gate command sent but may not have opened. Check Arduino connection.")
                     
             except Exception as e:
-                print(f"[GATE(video)] ❌ ERROR in gate control: {e}", flush=True)
-                import traceback
-                print(f"[GATE(video)] Traceback: {traceback.format_exc()}", flush=True)
+                gate_log.exception("[GATE(video)] ❌ ERROR in gate control: %s", e)
+                _record_gate_result(plate_text, False, str(e), image_path_for_db, saved_ids[-1], action="error")
+                lane_registry.note_gate(gate_lane, "error", gate_lane.controller.last_rtt_ms)
                 await manager.broadcast({
                     "type": "gate",
                     "action": "error",
                     "plate_text": plate_text,
                     "error": str(e),
-                    "source": "video"
+                    "source": "video",
+                    "lane": gate_lane.id
                 })
 
-        try: 
-            os.remove(tmp_img_path)
-        except Exception as cleanup_error:
-            print(f"DEBUG: Error cleaning up frame file {tmp_img_path}: {cleanup_error}", flush=True)
-            pass
-
-    # Cleanup
-    try:
-        cap.release()
-        print(f"DEBUG: Video capture released", flush=True)
-    except Exception as e:
-        print(f"DEBUG: Error releasing video capture: {e}", flush=True)
-    
-    if local_video_path and os.path.exists(local_video_path):
-        try: 
-            os.remove(local_video_path)
-            print(f"DEBUG: Cleaned up video file: {local_video_path}", flush=True)
-        except Exception as e:
-            print(f"DEBUG: Error cleaning up video file: {e}", flush=True)
-
-    print(f"DEBUG: Video processing complete - Processed: {processed}, Saved: {len(saved_ids)}, Unique plates: {len(seen_plates)}", flush=True)
+    finish_trace(frame_trace)
+    video_log.info("Video processing complete - Processed: %d, Saved: %d, Unique plates: %d",
+                   processed, len(saved_ids), len(seen_plates), extra={"session_id": session_id})
     
     return {
         "session_id": session_id,
@@ -1076,12 +1075,17 @@ async def detect_video(
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    # state ปัจจุบันของทุก lane ให้ client ใหม่ (หลังจากนี้ได้ lane_state เมื่อมีการเปลี่ยน)
+    for lane_state in lane_registry.snapshot():
+        manager.send_to(websocket, lane_state)
     try:
         while True:
             data = await websocket.receive_text()
-            # Echo back or handle commands
-            await websocket.send_json({"type": "pong", "message": "Connected"})
-    except WebSocketDisconnect:
+            # subscribe/unsubscribe หรือ ping -> pong (ตอบผ่านคิวของ client เพื่อไม่ให้ส่งซ้อนกับ broadcast)
+            manager.handle_client_message(websocket, data)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
         manager.disconnect(websocket)
 
 # =============================
@@ -1098,7 +1102,9 @@ async def serve_index():
 async def get_records(page: int = 1, limit: int = 20, db: Session = Depends(get_db)):
     """Get paginated records"""
     offset = (page - 1) * limit
-    records = db.query(PlateRecord).order_by(desc(PlateRecord.created_at)).offset(offset).limit(limit).all()
+    records = db.query(PlateRecord).options(load_only(*RECORD_LIST_COLUMNS)).order_by(
+        desc(PlateRecord.created_at)
+    ).offset(offset).limit(limit).all()
     total = db.query(func.count(PlateRecord.id)).scalar()
     
     return {
@@ -1108,7 +1114,8 @@ async def get_records(page: int = 1, limit: int = 20, db: Session = Depends(get_
                 "plate_text": r.plate_text,
                 "province_text": r.province_text,
                 "confidence": r.confidence,
-                "plate_image": f"/uploads/plates/{r.plate_image_path}" if r.plate_image_path else None,
+                "plate_image": plate_url(r.plate_image_path),
+                "plate_thumb": thumb_path(r.plate_image_path),
                 "created_at": r.created_at.isoformat() if r.created_at else None,
                 "is_new_plate": getattr(r, 'is_new_plate', True),
                 "seen_count": getattr(r, 'seen_count', 1)
@@ -1128,13 +1135,17 @@ async def get_record(record_id: int, db: Session = Depends(get_db)):
     if not record:
         return JSONResponse(status_code=404, content={"detail": "Record not found"})
     
+    detections = load_detections(record)
     return {
         "id": record.id,
         "plate_text": record.plate_text,
         "province_text": record.province_text,
         "confidence": record.confidence,
         "image_path": record.image_path,
-        "detections_json": record.detections_json,
+        "detections": detections,
+        # key เดิม (JSON string) สำหรับ client ที่ยังอ่าน detections_json
+        "detections_json": detections if detections is None or isinstance(detections, str)
+                           else json.dumps(detections, ensure_ascii=False),
         "created_at": record.created_at.isoformat() if record.created_at else None
     }
 
@@ -1159,12 +1170,16 @@ async def get_stats(db: Session = Depends(get_db)):
     }
 
 @app.post("/api/gate/test")
-async def test_gate():
-    """Test gate open command"""
+async def test_gate(lane: str | None = None):
+    """Test gate open command (?lane=<id> เลือก lane, ไม่ระบุ = default lane)"""
+    gate_lane = lane_registry.resolve(lane)
+    if gate_lane is None:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown lane: {lane}"})
     try:
-        send_open_gate("TEST")
+        send_open_gate("TEST", gate_lane.controller)
         await manager.broadcast({
             "type": "gate",
+            "lane": gate_lane.id,
             "action": "opened",
             "plate_text": "TEST"
         })
@@ -1172,15 +1187,118 @@ async def test_gate():
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.get("/api/gate/link")
+def gate_link():
+    """สถานะ serial link ของทุก device (ทุก lane): เชื่อมต่ออยู่ไหม, RTT, จำนวน reconnect, ACK ล่าสุดนานแค่ไหนแล้ว"""
+    return {"default_lane": lane_registry.default.id, "devices": lane_registry.link_stats()}
+
+@app.get("/api/admission")
+def admission_stats():
+    """คิวของงานอ่านป้ายต่อ priority (gate / upload / batch)"""
+    return admission.stats()
+
+@app.get("/api/tracing")
+def tracing_stats():
+    """สถานะ trace exporter (จำนวน span ที่ส่งออก / ทิ้ง / error)"""
+    return trace_exporter.stats()
+
+# =============================
+# Metrics (Prometheus text format) - gauge อ่านค่าตอน scrape เท่านั้น
+# =============================
+def _queue_depths() -> dict:
+    ws = manager.stats()
+    return {
+        **{f"admission_{p}": n for p, n in admission.queue_depths().items()},
+        "image_writer": image_writer.pending(),
+        "ws_outbox": ws["outbox_pending"],
+        "ws_clients": ws["client_queue_pending"],
+    }
+
+Gauge("lpr_queue_depth", "Items waiting per internal queue", _queue_depths, ("queue",))
+Gauge("lpr_gate_queue_depth", "Gate commands waiting per serial device",
+      lambda: {str(lane.controller.url): lane.controller.stats()["queued"] for lane in lane_registry.lanes.values()},
+      ("device",))
+Gauge("lpr_recognition_in_flight", "Recognition jobs running on the executor", lambda: admission.stats()["in_flight"])
+Gauge("lpr_websocket_clients", "Connected WebSocket clients in this worker", lambda: len(manager.clients))
+Gauge("lpr_db_pool_checked_out", "DB connections currently checked out of the pool",
+      lambda: engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else None)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/lanes")
+def list_lanes():
+    """ทุก lane: ไม้เปิด/ปิด, ป้ายล่าสุด, ACK latency และสถานะ link ของ device"""
+    return lane_registry.stats()
+
+@app.get("/api/lanes/{lane_id}")
+def get_lane(lane_id: str):
+    gate_lane = lane_registry.get(lane_id)
+    if gate_lane is None:
+        return JSONResponse(status_code=404, content={"detail": "Lane not found"})
+    return {**gate_lane.snapshot(), "cameras": gate_lane.cameras, "link": gate_lane.controller.stats()}
+
+@app.get("/api/gate/rules")
+def list_gate_rules(db: Session = Depends(get_db)):
+    """allow / deny / prefix rules ที่ decision engine ใช้"""
+    rules = db.query(GateRule).order_by(GateRule.kind, GateRule.value).all()
+    return {
+        "rules": [
+            {"id": r.id, "kind": r.kind, "value": r.value, "note": r.note,
+             "created_at": r.created_at.isoformat() if r.created_at else None}
+            for r in rules
+        ],
+        "engine": gate_engine.stats(),
+    }
+
+@app.post("/api/gate/rules")
+async def add_gate_rule(kind: str = Form(...), value: str = Form(...), note: str | None = Form(default=None)):
+    """เพิ่ม rule (kind = allow | deny | prefix) - worker นี้ reload ทันที worker อื่นภายใน GATE_RULES_RELOAD_SEC"""
+    if kind not in RULE_KINDS:
+        return JSONResponse(status_code=400, content={"detail": f"kind must be one of {', '.join(RULE_KINDS)}"})
+    value = _normalize_plate(value)
+    if not value:
+        return JSONResponse(status_code=400, content={"detail": "value is empty"})
+    db = SessionLocal()
+    try:
+        rule = GateRule(kind=kind, value=value, note=note)
+        db.add(rule)
+        bump_rules_version(db)
+        db.commit()
+        rule_id = rule.id
+    finally:
+        db.close()
+    await asyncio.to_thread(gate_engine.reload, True)
+    return {"id": rule_id, "kind": kind, "value": value, "engine": gate_engine.stats()}
+
+@app.delete("/api/gate/rules/{rule_id}")
+async def delete_gate_rule(rule_id: int):
+    db = SessionLocal()
+    try:
+        deleted = db.query(GateRule).filter(GateRule.id == rule_id).delete(synchronize_session=False)
+        if deleted:
+            bump_rules_version(db)
+        db.commit()
+    finally:
+        db.close()
+    if not deleted:
+        return JSONResponse(status_code=404, content={"detail": "Rule not found"})
+    await asyncio.to_thread(gate_engine.reload, True)
+    return {"deleted": rule_id, "engine": gate_engine.stats()}
+
 @app.post("/api/gate/close")
-async def close_gate():
-    """Force close gate"""
+async def close_gate(lane: str | None = None):
+    """Force close gate (?lane=<id> เลือก lane, ไม่ระบุ = default lane)"""
+    gate_lane = lane_registry.resolve(lane)
+    if gate_lane is None:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown lane: {lane}"})
     try:
-        # Send close command to Arduino
-        from .arduino import send_command
-        send_command("CLOSE")
+        # Send close command to Arduino (เข้าคิวของ gate controller แล้วคืนทันที)
+        send_close_gate(gate_lane.controller)
         await manager.broadcast({
             "type": "gate",
+            "lane": gate_lane.id,
             "action": "closed",
             "plate_text": ""
         })
@@ -1207,12 +1325,12 @@ async def get_plate_status(db: Session = Depends(get_db)):
     ).scalar() or 0
     
     # Get new plates (first occurrence only)
-    new_plates = db.query(PlateRecord).filter(
+    new_plates = db.query(PlateRecord).options(load_only(*RECORD_LIST_COLUMNS)).filter(
         PlateRecord.is_new_plate == True
     ).order_by(desc(PlateRecord.created_at)).limit(50).all()
     
     # Get duplicate plates (recent duplicates)
-    duplicate_plates = db.query(PlateRecord).filter(
+    duplicate_plates = db.query(PlateRecord).options(load_only(*RECORD_LIST_COLUMNS)).filter(
         PlateRecord.is_new_plate == False
     ).order_by(desc(PlateRecord.created_at)).limit(50).all()
     
@@ -1226,7 +1344,8 @@ async def get_plate_status(db: Session = Depends(get_db)):
                 "plate_text": r.plate_text,
                 "province_text": r.province_text,
                 "confidence": r.confidence,
-                "plate_image": f"/uploads/plates/{r.plate_image_path}" if r.plate_image_path else None,
+                "plate_image": plate_url(r.plate_image_path),
+                "plate_thumb": thumb_path(r.plate_image_path),
                 "created_at": r.created_at.isoformat() if r.created_at else None,
                 "seen_count": getattr(r, 'seen_count', 1)
             }
@@ -1238,7 +1357,8 @@ async def get_plate_status(db: Session = Depends(get_db)):
                 "plate_text": r.plate_text,
                 "province_text": r.province_text,
                 "confidence": r.confidence,
-                "plate_image": f"/uploads/plates/{r.plate_image_path}" if r.plate_image_path else None,
+                "plate_image": plate_url(r.plate_image_path),
+                "plate_thumb": thumb_path(r.plate_image_path),
                 "created_at": r.created_at.isoformat() if r.created_at else None,
                 "seen_count": getattr(r, 'seen_count', 1)
             }
@@ -1259,7 +1379,9 @@ async def export_csv(db: Session = Depends(get_db)):
     import io
     import csv
     
-    records = db.query(PlateRecord).order_by(desc(PlateRecord.created_at)).limit(1000).all()
+    records = db.query(PlateRecord).options(load_only(*RECORD_LIST_COLUMNS)).order_by(
+        desc(PlateRecord.created_at)
+    ).limit(1000).all()
     
     output = io.StringIO()
     writer = csv.writer(output)
@@ -1286,10 +1408,24 @@ async def clear_old_records(days: int = 30, db: Session = Depends(get_db)):
     """Clear records older than specified days"""
     cutoff_date = datetime.utcnow() - timedelta(days=days)
     
-    deleted = db.query(PlateRecord).filter(PlateRecord.created_at < cutoff_date).delete()
+    old_ids = select(PlateRecord.id).where(PlateRecord.created_at < cutoff_date)
+    old_images = []
+    if segment_store is not None:
+        old_images = [
+            p for (p,) in db.query(PlateRecord.plate_image_path).filter(
+                PlateRecord.created_at < cutoff_date, PlateRecord.plate_image_path.isnot(None)
+            )
+        ]
+    db.query(PlateDetection).filter(PlateDetection.record_id.in_(old_ids)).delete(synchronize_session=False)
+    deleted = db.query(PlateRecord).filter(PlateRecord.created_at < cutoff_date).delete(synchronize_session=False)
     db.commit()
-    
-    return {"deleted_count": deleted}
+
+    result = {"deleted_count": deleted}
+    if segment_store is not None:
+        # retention + compaction ของ segment store ทำไปพร้อมกัน
+        segment_store.delete(old_images + [f"thumbs/{p}" for p in old_images])
+        result["compaction"] = await asyncio.to_thread(segment_store.compact)
+    return result
 
 # =============================
 # Modified detect endpoint to broadcast via WebSocket
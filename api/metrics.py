@@ -0,0 +1,245 @@
+# api/metrics.py
+"""
+metrics แบบ Prometheus (text format 0.0.4) ที่ GET /metrics โดยไม่ต้องพึ่ง prometheus_client
+- Counter / Histogram: แต่ละ thread เขียนลง shard ของตัวเอง (threading.local) ไม่มี lock บน hot path
+  lock ใช้แค่ตอน thread ใหม่เขียนครั้งแรก (ลงทะเบียน shard) และรวมทุก shard ตอน scrape
+- Gauge: ค่าจาก callback ที่เรียกตอน scrape เท่านั้น (queue depth, websocket, DB pool) ไม่มีต้นทุนตอนรันงาน
+- ค่าเป็นของ process นี้ (หลาย uvicorn worker = Prometheus รวมจากแต่ละ worker เอง)
+METRICS_ENABLED=0: observe / inc คืนทันที (/metrics ยังตอบ gauge ได้)
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+# api/logger.py import โมดูลนี้ จึงใช้ logging ตรง ๆ (ได้ logger "lpr.metrics" ตัวเดียวกับ get_logger)
+log = logging.getLogger("lpr.metrics")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# วินาที: ครอบตั้งแต่ parse (~ไมโครวินาที) จนถึง Tesseract / detector บน CPU (หลายวินาที)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+_registry_lock = threading.Lock()
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class _Shards:
+    """list ของตัวเลขขนาดคงที่ต่อ thread; อ่านรวมตอน scrape (ค่าอาจช้ากว่าจริงเล็กน้อย ไม่เป็นไร)"""
+
+    __slots__ = ("size", "_local", "_all", "_lock")
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._all: list[list] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> list:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0] * self.size
+            with self._lock:
+                self._all.append(shard)  # thread จบไปแล้ว shard ยังอยู่ (ค่าสะสมไม่หาย)
+            self._local.shard = shard
+        return shard
+
+    def total(self) -> list:
+        with self._lock:
+            shards = list(self._all)
+        out = [0] * self.size
+        for shard in shards:
+            for i, v in enumerate(shard):
+                out[i] += v
+        return out
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, n: float = 1):
+        if METRICS_ENABLED:
+            self._shards.get()[0] += n
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+class _HistogramChild:
+    __slots__ = ("bounds", "_shards")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # [bucket 0..n-1, +Inf, sum]
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, seconds: float):
+        if METRICS_ENABLED:
+            shard = self._shards.get()
+            shard[bisect_left(self.bounds, seconds)] += 1
+            shard[-1] += seconds
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """child ของชุด label (string เรียงตาม labelnames) สร้างครั้งแรกครั้งเดียว"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self) -> list:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.sample_name} {self.help}", f"# TYPE {self.sample_name} {self.kind}"]
+
+    @property
+    def sample_name(self) -> str:
+        return self.name
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1):
+        self.labels().inc(n)
+
+    @property
+    def sample_name(self) -> str:
+        return f"{self.name}_total"
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for values, child in self._items():
+            lines.append(f"{self.sample_name}{_labels(self.labelnames, values)} {_fmt(child.value())}")
+        return lines
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, seconds: float):
+        self.labels().observe(seconds)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for values, child in self._items():
+            totals = child._shards.total()
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), totals[:-1]):
+                cumulative += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_fmt(totals[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+class Gauge(_Family):
+    """
+    ค่าอ่านจาก fn ตอน scrape: fn() คืนตัวเลข (ไม่มี label)
+    หรือ dict {ค่า label (str หรือ tuple): ตัวเลข}
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable, labelnames: tuple = ()):
+        self.fn = fn
+        super().__init__(name, help_text, labelnames)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        try:
+            value = self.fn()
+        except Exception as e:
+            log.warning("[METRICS] ⚠️ gauge %s failed: %s", self.name, e)
+            return lines
+        if isinstance(value, dict):
+            for key, v in value.items():
+                if v is None:
+                    continue
+                values = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {_fmt(v)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_fmt(value)}")
+        return lines
+
+def render() -> str:
+    with _registry_lock:
+        families = list(_registry)
+    lines = []
+    for family in families:
+        lines += family.render()
+    return "\n".join(lines) + "\n"
+
+# ---------- metrics ของระบบ (gauge ลงทะเบียนใน main.py) ----------
+
+STAGE_SECONDS = Histogram(
+    "lpr_stage_seconds",
+    "Recognition stage latency (decode, detector, crop, reader, reader_decode, segmentation, ocr, parse)",
+    ("path", "stage"),
+)
+TESSERACT_SECONDS = Histogram("lpr_tesseract_call_seconds", "Latency of a single Tesseract call", ("psm",))
+DB_COMMIT_SECONDS = Histogram("lpr_db_commit_seconds", "Latency of DB commits on the detection paths", ("path",))
+IMAGE_WRITE_SECONDS = Histogram("lpr_image_write_seconds", "Plate image encode + write (image + thumbnail)")
+BROADCAST_SECONDS = Histogram("lpr_broadcast_seconds", "WebSocket fan-out of one event to all local clients")
+GATE_RTT_SECONDS = Histogram("lpr_gate_rtt_seconds", "Serial write -> ACK round-trip per gate command", ("device",))
+
+FALLBACK_TOTAL = Counter(
+    "lpr_fallback", "Recognition fallbacks used (reader_greedy, segmentation, ocr)", ("path", "stage"),
+)
+PLATES_TOTAL = Counter("lpr_plates", "Saved detections by whether the plate was new or seen before", ("kind",))
+GATE_FAILURES_TOTAL = Counter(
+    "lpr_gate_failures", "Gate open attempts without ACK:OPEN (attempted) or with an error", ("lane", "action"),
+)
+GATE_ACK_TIMEOUTS_TOTAL = Counter("lpr_gate_ack_timeouts", "Gate commands that got no reply in time", ("device",))
@@ -1,5 +1,5 @@
-from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, func
+from sqlalchemy.orm import declarative_base, relationship, deferred
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text, Boolean, LargeBinary, ForeignKey, func
 Base = declarative_base()
 
 class User(Base):
@@ -14,6 +14,16 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     last_login = Column(DateTime(timezone=True), nullable=True)
 
+class UserSession(Base):
+    __tablename__ = "user_sessions"
+    token = Column(String(64), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    username = Column(String(50), nullable=False)
+    email = Column(String(100), nullable=True)
+    role = Column(String(20), nullable=False, default="user")
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
 class PlateRecord(Base):
     __tablename__ = "plate_records"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -23,8 +33,57 @@ class PlateRecord(Base):
     confidence = Column(Float, nullable=True)
     image_path = Column(Text, nullable=True)  # Original uploaded image
     plate_image_path = Column(Text, nullable=True)  # Cropped plate image
-    detections_json = Column(Text, nullable=True)
+    # Legacy: raw detections used to live here. New rows store them in plate_detections.
+    detections_json = deferred(Column(Text, nullable=True))
     is_new_plate = Column(Boolean, default=True)  # True if first time seeing this plate, False if duplicate
     seen_count = Column(Integer, default=1)  # Number of times this plate has been seen
     first_seen_at = Column(DateTime(timezone=True), nullable=True)  # First time this plate was detected
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    detections = relationship("PlateDetection", uselist=False, lazy="select")
+
+class PlateDetection(Base):
+    __tablename__ = "plate_detections"
+    record_id = Column(Integer, ForeignKey("plate_records.id", ondelete="CASCADE"), primary_key=True)
+    encoding = Column(String(16), nullable=False)  # msgpack+z | json+z
+    payload = Column(LargeBinary, nullable=False)  # Compressed raw reader/detector predictions
+
+class PlateImageBlob(Base):
+    __tablename__ = "plate_image_blobs"
+    key = Column(String(128), primary_key=True)  # "plate_<id>.jpg" or "thumbs/plate_<id>.jpg"
+    segment = Column(Integer, nullable=False, index=True)
+    offset = Column(BigInteger, nullable=False)
+    length = Column(Integer, nullable=False)
+    crc32 = Column(BigInteger, nullable=False)  # Used as ETag
+
+class GateEvent(Base):
+    __tablename__ = "gate_events"
+    event_id = Column(String(32), primary_key=True)  # สร้างก่อนส่งคำสั่ง (outbox ใช้ upsert ซ้ำได้)
+    record_id = Column(Integer, nullable=True, index=True)  # plate_records.id (เติมทีหลังใน fast path)
+    plate_text = Column(String(64), index=True)
+    source = Column(Text, nullable=True)
+    action = Column(String(16), nullable=False)  # issued | opened | attempted | denied | error
+    reason = Column(Text, nullable=True)
+    response = Column(String(128), nullable=True)  # บรรทัด ACK จาก Arduino
+    success = Column(Boolean, nullable=True)
+    detect_to_gate_ms = Column(Float, nullable=True)  # รับ request -> ส่งคำสั่ง gate
+    ack_ms = Column(Float, nullable=True)  # ส่งคำสั่ง -> ได้ ACK
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+class GateRule(Base):
+    __tablename__ = "gate_rules"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False, index=True)  # allow | deny | prefix
+    value = Column(String(64), nullable=False)  # ป้ายเต็ม (allow/deny) หรือ prefix
+    note = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class GateRulesVersion(Base):
+    """แถวเดียว (id=1): เลขเวอร์ชันของ gate_rules เพิ่มทุกครั้งที่เพิ่ม/ลบ rule ให้ worker อื่นรู้ว่าต้อง reload"""
+    __tablename__ = "gate_rules_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class GateCooldown(Base):
+    __tablename__ = "gate_cooldowns"
+    plate = Column(String(64), primary_key=True)  # ป้ายที่ normalize แล้ว
+    until = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,8 +1,13 @@
 import os
+import time
 import cv2
 import numpy as np
 import pytesseract
-from typing import Tuple, List
+from typing import Tuple, List, Optional
+
+from .province_parser import score_plate
+from .metrics import TESSERACT_SECONDS
+from .tracing import span
 
 # ใช้จาก .env ถ้าเซ็ตไว้
 TESS_LANG = os.getenv("TESSERACT_LANG", "tha+eng")
@@ -13,12 +18,14 @@ TESS_LANG = os.getenv("TESSERACT_LANG", "tha+eng")
 # - เครื่องหมายคั่นที่บางที OCR เห็นเป็น | หรือ /
 THAI_BLOCK = "กขฃคฅฆงจฉชซฌญฎฏฐฑฒณดตถทธนบปผฝพฟภมยรฤลฦวศษสหฬอฮะาิีึืุูเแโใไ์่้๊๋็ๅๆฯ"
 WHITE_LIST = f"0123456789{THAI_BLOCK} ์่้๊๋็์|/-"
+_WHITE_SET = frozenset(WHITE_LIST)
 
 # ---------- ตัวช่วย ----------
 def _tess(img: np.ndarray, psm: int) -> str:
     cfg = f'--oem 3 --psm {psm} -l {TESS_LANG} -c tessedit_char_whitelist="{WHITE_LIST}"'
     try:
-        s = pytesseract.image_to_string(img, config=cfg)
+        with TESSERACT_SECONDS.labels(str(psm)).time(), span("tesseract", psm=psm):
+            s = pytesseract.image_to_string(img, config=cfg)
     except Exception:
         s = ""
     return s or ""
@@ -52,57 +59,21 @@ def _clean(s: str) -> str:
 
 def _score_plate(s: str) -> int:
     """
-    ให้คะแนนสตริง: เน้นรูปแบบป้ายทะเบียนไทย
+    ให้คะแนนสตริง: เน้นรูปแบบป้ายทะเบียนไทย (grammar compile ไว้แล้วใน province_parser)
     รูปแบบที่ดี:
     - กร 1234 (รหัส 2 ตัว + เลข 4 ตัว)
     - 1กร 1234 (เลข + รหัส 2 ตัว + เลข)
     - กก 123 (รหัส 2 ตัว + เลข 3 ตัว)
     """
-    import re
-    s0 = s
-    s = s.replace("|", "").replace("/", "").replace("-", "").strip()
-    
-    score = 0
-    
-    # Pattern 1: รหัสจังหวัด 2 ตัว + เลข 3-4 ตัว
-    pattern1 = re.compile(r'^([ก-ฮ]{2})\s*([0-9]{3,4})$')
-    m1 = pattern1.match(s)
-    if m1:
-        score += 100  # คะแนนสูงสุด
-        score += len(m1.group(2)) * 10
-        return score
-    
-    # Pattern 2: เลข 1 ตัว + รหัสจังหวัด 2 ตัว + เลข 4-5 ตัว
-    pattern2 = re.compile(r'^([0-9]{1})([ก-ฮ]{2})\s*([0-9]{4,5})$')
-    m2 = pattern2.match(s)
-    if m2:
-        score += 95
-        score += len(m2.group(3)) * 8
-        return score
-    
-    # Pattern 3: รหัสจังหวัด + เลข (ไม่จำกัดจำนวน)
-    pattern3 = re.compile(r'([ก-ฮ]{1,2})\s*([0-9]+)')
-    m3 = pattern3.search(s)
-    if m3:
-        score += 50
-        score += len(m3.group(2)) * 5
-        score += len(m3.group(1)) * 3
-    
-    # ลบตัวอักษรที่ไม่อยู่ใน whitelist
-    kept = [ch for ch in s0 if ch in WHITE_LIST]
-    score += len(kept)
-    
-    # ลดคะแนนถ้ามี noise มาก
-    noise_chars = [ch for ch in s0 if ch not in WHITE_LIST]
-    score -= len(noise_chars) * 5
-    
-    return max(0, score)
+    return score_plate(s, _WHITE_SET)
 
 # ---------- ฟังก์ชันหลัก ----------
-def run_ocr_on_bbox(img: np.ndarray, x: int, y: int, w: int, h: int) -> str:
+def run_ocr_on_bbox(img: np.ndarray, x: int, y: int, w: int, h: int,
+                    deadline: Optional[float] = None) -> str:
     """
     รับภาพเต็ม + กรอบ (ซ้ายบน + กว้างสูง) -> คืนข้อความป้ายที่ดีที่สุด
     ลองหลายพรีโปรเซส/ค่า psm แล้วเลือกสตริงที่ได้คะแนนดีที่สุด
+    deadline (time.perf_counter): เลยเวลาแล้วไม่เรียก Tesseract ต่อ คืนผลดีที่สุดเท่าที่ได้
     """
     H, W = img.shape[:2]
     x = max(0, min(x, W - 1))
@@ -138,6 +109,8 @@ def run_ocr_on_bbox(img: np.ndarray, x: int, y: int, w: int, h: int) -> str:
     cands: List[str] = []
     for v in variants:
         for p in psms:
+            if deadline is not None and cands and time.perf_counter() >= deadline:
+                break
             cands.append(_clean(_tess(v, p)))
 
     # เลือกสตริงที่คะแนนดีที่สุด
@@ -0,0 +1,175 @@
+# api/plate_decoder.py
+"""
+ถอดข้อความป้ายจากผลของ reader model แบบมีข้อจำกัด (grammar + ตารางจังหวัด)
+- กล่องที่ซ้อนกันตำแหน่งเดียวกัน = ตัวเลือกของตัวอักษรช่องนั้น (NMS ของ YOLO แยกตาม class
+  จึงเหลือหลาย class ที่ตำแหน่งเดียวกันได้) เก็บ top-k ต่อช่อง
+- beam search เลือก class ละหนึ่งตัวต่อช่อง หรือข้ามกล่องที่เป็น noise ให้ได้ข้อความตามรูปแบบป้ายไทย
+    [เลขนำ 1 ตัว] พยัญชนะ 1-3 ตัว [จังหวัด] เลข 1-5 ตัว [จังหวัด]
+  token จังหวัด (รหัสหรือชื่อเต็ม) ต้องอยู่ใน THAI_PROVINCES และมีได้ครั้งเดียว
+- คืน reading ที่ความน่าจะเป็นร่วมสูงสุด: confidence = geometric mean ต่อช่อง (เทียบกับค่าเฉลี่ยเดิมได้)
+ไม่มี reading ที่ถูกรูปแบบ -> None ให้ผู้เรียกใช้การต่อ top-1 แบบเดิม
+"""
+import os
+import math
+from typing import Optional
+
+from .province_parser import THAI_PROVINCES
+
+READER_TOPK = int(os.getenv("READER_TOPK", "3"))                        # ตัวเลือกต่อช่อง
+READER_BEAM_WIDTH = int(os.getenv("READER_BEAM_WIDTH", "8"))
+READER_MIN_CONF = float(os.getenv("READER_MIN_CONF", "0.35"))            # ช่องต้องมีตัวเลือกที่ดีที่สุดอย่างน้อยเท่านี้
+# ตัวเลือกสำรองในช่อง (ส่งเป็น conf ของ reader) ต้องต่ำกว่า default ของ ultralytics (0.25) ไม่งั้นไม่มีตัวเลือกเพิ่ม
+READER_ALT_MIN_CONF = float(os.getenv("READER_ALT_MIN_CONF", "0.08"))
+_SLOT_IOU = 0.5
+_MIN_SKIP_P = 1e-3  # กันไม่ให้ข้ามกล่องที่มั่นใจมากได้ฟรี (log 0)
+
+# token ที่เป็นจังหวัด: รหัส -> ชื่อ, ชื่อเต็ม -> ตัวเอง
+_PROVINCE_TOKENS = {**{name: name for name in THAI_PROVINCES.values()}, **THAI_PROVINCES}
+
+def _token_kind(token: str) -> Optional[str]:
+    """D = เลข, C = พยัญชนะ, P = จังหวัด, None = ใช้ในป้ายไม่ได้"""
+    if len(token) == 1:
+        if "0" <= token <= "9":
+            return "D"
+        if "ก" <= token <= "ฮ":
+            return "C"
+    if token in _PROVINCE_TOKENS:
+        return "P"
+    return None
+
+# state ของ grammar: (phase, count, has_province)
+_START, _LEAD, _SERIES, _NUMBER = 0, 1, 2, 3
+
+def _advance(state: tuple, kind: Optional[str]) -> Optional[tuple]:
+    phase, count, has_province = state
+    if kind == "D":
+        if phase == _START:
+            return _LEAD, 1, has_province
+        if phase == _SERIES:
+            return _NUMBER, 1, has_province
+        if phase == _NUMBER and count < 5:
+            return _NUMBER, count + 1, has_province
+    elif kind == "C":
+        if phase in (_START, _LEAD):
+            return _SERIES, 1, has_province
+        if phase == _SERIES and count < 3:
+            return _SERIES, count + 1, has_province
+    elif kind == "P":
+        if not has_province and phase in (_SERIES, _NUMBER):
+            return phase, count, True
+    return None
+
+def _accepts(state: tuple) -> bool:
+    return state[0] == _NUMBER
+
+def _conf(p: dict) -> float:
+    return float(p.get("confidence", p.get("conf", 0)) or 0)
+
+def _box(p: dict) -> tuple:
+    return float(p.get("x1", 0)), float(p.get("y1", 0)), float(p.get("x2", 0)), float(p.get("y2", 0))
+
+def _iou(a: tuple, b: tuple) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def group_slots(preds: list, top_k: int = READER_TOPK) -> list[list[dict]]:
+    """
+    รวมกล่องที่ซ้อนกันเป็นช่องตัวอักษร แล้วเรียงเป็นแถว (บนลงล่าง) และซ้ายไปขวา
+    คืน list ของแถว แต่ละแถวเป็น list ของช่อง {"box", "options": [(class, conf), ...]}
+    """
+    boxes = sorted(
+        (p for p in preds if _conf(p) >= READER_ALT_MIN_CONF and (p.get("class") or p.get("name") or "").strip()),
+        key=_conf, reverse=True,
+    )
+    slots: list[dict] = []
+    for p in boxes:
+        box, conf = _box(p), _conf(p)
+        cls = (p.get("class") or p.get("name")).strip()
+        slot = next((s for s in slots if _iou(s["box"], box) >= _SLOT_IOU), None)
+        if slot is None:
+            if conf < READER_MIN_CONF:
+                continue  # กล่องอ่อนที่ไม่ได้ซ้อนช่องไหน = noise
+            slot = {"box": box, "pred": p, "options": {}}
+            slots.append(slot)
+        if conf > slot["options"].get(cls, 0.0):
+            slot["options"][cls] = conf
+    if not slots:
+        return []
+
+    # แยกแถวแบบเดียวกับการต่อ top-1 เดิม (threshold ตามความสูงเฉลี่ย)
+    heights = [s["box"][3] - s["box"][1] for s in slots]
+    row_thresh = max(20.0, sum(heights) / len(heights) * 0.6)
+    rows: dict[float, list] = {}
+    for s in slots:
+        y = (s["box"][1] + s["box"][3]) / 2
+        row_y = next((ry for ry in sorted(rows) if abs(y - ry) < row_thresh), None)
+        rows.setdefault(y if row_y is None else row_y, []).append(s)
+
+    ordered = []
+    for row_y in sorted(rows):
+        row = sorted(rows[row_y], key=lambda s: s["box"][0])
+        for s in row:
+            s["options"] = sorted(s["options"].items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        ordered.append(row)
+    return ordered
+
+def decode_plate(preds: list, top_k: int = READER_TOPK, beam_width: int = READER_BEAM_WIDTH) -> Optional[dict]:
+    """
+    beam search บนช่องตัวอักษร คืน
+      {"text", "province", "confidence", "characters", "skipped", "changed"}
+    หรือ None ถ้าไม่มีการอ่านไหนถูกรูปแบบป้าย
+    """
+    rows = group_slots(preds, top_k)
+    slots = [(r, s) for r, row in enumerate(rows) for s in row]
+    if not slots:
+        return None
+
+    # beam: (log p, state, choices) - choices เป็น tuple ของ (slot index, token, conf) ที่เลือก
+    beam = [(0.0, (_START, 0, False), ())]
+    for i, (_, slot) in enumerate(slots):
+        top_conf = slot["options"][0][1]
+        skip_logp = math.log(max(_MIN_SKIP_P, 1.0 - top_conf))
+        expanded = []
+        for logp, state, choices in beam:
+            expanded.append((logp + skip_logp, state, choices))
+            for token, conf in slot["options"]:
+                nxt = _advance(state, _token_kind(token))
+                if nxt is not None:
+                    expanded.append((logp + math.log(max(conf, 1e-6)), nxt, choices + ((i, token, conf),)))
+        expanded.sort(key=lambda b: b[0], reverse=True)
+        beam = expanded[:beam_width]
+
+    valid = [b for b in beam if _accepts(b[1])]
+    if not valid:
+        return None
+    logp, _, choices = valid[0]
+
+    row_tokens: dict[int, list[str]] = {}
+    province = ""
+    characters = []
+    for i, token, conf in choices:
+        row, slot = slots[i]
+        if _token_kind(token) == "P":
+            province = _PROVINCE_TOKENS[token]
+        else:
+            row_tokens.setdefault(row, []).append(token)
+        p = slot["pred"]
+        characters.append({
+            "character": token,
+            "confidence": conf,
+            "bbox": {"x1": p.get("x1"), "y1": p.get("y1"), "x2": p.get("x2"), "y2": p.get("y2")},
+            "method": "reader_beam",
+        })
+    text = " ".join("".join(row_tokens[r]) for r in sorted(row_tokens))
+    greedy = [slot["options"][0][0] for _, slot in slots]
+    return {
+        "text": text,
+        "province": province,
+        "confidence": math.exp(logp / len(slots)),
+        "characters": characters,
+        "skipped": len(slots) - len(choices),
+        "changed": [token for _, token, _ in choices] != greedy,
+    }
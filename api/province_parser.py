@@ -1,8 +1,13 @@
 # api/province_parser.py
 """
 แยกจังหวัดจากข้อความป้ายทะเบียน
+- รหัสจังหวัดเก็บใน character trie (สร้างครั้งเดียวตอน import) จับคู่รหัสที่ยาวที่สุด
+  รหัสหลายตัวอักษร/มีสระ เช่น "หนอ", "สิง", "ระยอง", "กระบี่", "แพ" จึงใช้ได้
+- รูปแบบป้าย (grammar) เป็น regex ที่ compile ไว้แล้ว ใช้ให้คะแนนผล OCR (score_plate)
+- parse_plate แยกเลขป้าย / จังหวัด / คะแนนในการเรียกครั้งเดียว
 """
 import re
+from typing import Optional
 
 # รายการอักษรย่อจังหวัดทั้งหมด (2 ตัวอักษรไทย)
 THAI_PROVINCES = {
@@ -98,44 +103,118 @@ THAI_PROVINCES = {
     "นก": "นครปฐม",
 }
 
-def extract_province(text: str) -> tuple[str, str]:
+_END = ""  # key พิเศษใน node ของ trie: รหัสจังหวัดที่จบที่ node นี้
+
+def _build_trie(codes) -> dict:
+    root: dict = {}
+    for code in codes:
+        node = root
+        for ch in code:
+            node = node.setdefault(ch, {})
+        node[_END] = code
+    return root
+
+_PROVINCE_TRIE = _build_trie(THAI_PROVINCES)
+_MAX_CODE_LEN = max(map(len, THAI_PROVINCES))
+
+def _match_province(text: str, start: int) -> int:
+    """ความยาวของรหัสจังหวัดที่ยาวที่สุดที่เริ่มที่ text[start] (0 = ไม่มี)"""
+    node = _PROVINCE_TRIE
+    best = 0
+    for depth, ch in enumerate(text[start:start + _MAX_CODE_LEN], 1):
+        node = node.get(ch)
+        if node is None:
+            break
+        if _END in node:
+            best = depth
+    return best
+
+def _is_consonant(ch: str) -> bool:
+    return "ก" <= ch <= "ฮ"
+
+# จุดเริ่มที่เป็นไปได้ของรหัส: พยัญชนะ หรือสระนำที่เป็นต้นรหัส (แ ของ "แพ")
+_CODE_START = re.compile("[ก-ฮ" + "".join(ch for ch in _PROVINCE_TRIE if not _is_consonant(ch)) + "]")
+_CONSONANT = re.compile("[ก-ฮ]")
+
+# ---------- grammar ของป้าย (compile ครั้งเดียว) ----------
+# รูปแบบเต็ม: กร 1234 (รหัส 2 ตัว + เลข 3-4 ตัว) หรือ 1กร 1234 (เลข 1 ตัว + รหัส 2 ตัว + เลข 4-5 ตัว)
+_PLATE_FORMAT = re.compile(
+    r"^(?:(?P<code>[ก-ฮ]{2})\s*(?P<number>[0-9]{3,4})"
+    r"|[0-9](?P<series_code>[ก-ฮ]{2})\s*(?P<series_number>[0-9]{4,5}))$"
+)
+# รูปแบบหลวม: มีรหัส + เลขอยู่ที่ไหนก็ได้ในสตริง
+_PLATE_LOOSE = re.compile(r"([ก-ฮ]{1,2})\s*([0-9]+)")
+# อักขระที่ถือว่าเป็นของป้าย (ที่เหลือนับเป็น noise)
+PLATE_CHARS = frozenset("0123456789 |/-" + "".join(chr(c) for c in range(0x0E01, 0x0E5C)))
+
+_NOISE_PATTERNS: dict[frozenset, re.Pattern] = {}
+
+def _noise_pattern(allowed: frozenset) -> re.Pattern:
+    """regex ของอักขระที่ไม่อยู่ใน allowed - compile ครั้งเดียวต่อชุดอักขระ"""
+    pattern = _NOISE_PATTERNS.get(allowed)
+    if pattern is None:
+        pattern = _NOISE_PATTERNS[allowed] = re.compile("[^" + re.escape("".join(sorted(allowed))) + "]")
+    return pattern
+
+def score_plate(text: str, allowed: frozenset = PLATE_CHARS) -> int:
     """
-    แยกจังหวัดจากข้อความป้ายทะเบียน
-    
-    Returns:
-        (plate_number, province_code): เช่น ("1234", "กก")
+    ให้คะแนนสตริงตามรูปแบบป้ายทะเบียนไทย (ใช้เลือกผล OCR ที่ดีที่สุด)
+    - กร 1234: 100 + 10 ต่อหลัก
+    - 1กร 1234: 95 + 8 ต่อหลัก
+    - อื่นๆ: มีรหัส + เลข ได้ 50 + 5 ต่อหลัก + 3 ต่อตัวอักษร, +1 ต่ออักขระใน allowed, -5 ต่อ noise
+    """
+    s = text.replace("|", "").replace("/", "").replace("-", "").strip()
+    m = _PLATE_FORMAT.match(s)
+    if m:
+        if m.group("number") is not None:
+            return 100 + len(m.group("number")) * 10
+        return 95 + len(m.group("series_number")) * 8
+
+    score = 0
+    m = _PLATE_LOOSE.search(s)
+    if m:
+        score += 50 + len(m.group(2)) * 5 + len(m.group(1)) * 3
+    noise = len(_noise_pattern(allowed).findall(text))
+    score += (len(text) - noise) - noise * 5
+    return max(0, score)
+
+def _split_plate(text: str) -> tuple[str, str]:
+    """
+    (plate_number, province_code) ในรอบเดียว: หาอักษรไทยตัวแรก แล้วเดิน trie หารหัสที่ยาวที่สุดตรงนั้น
+    - ขึ้นต้นด้วยรหัส: ที่เหลือคือเลขป้าย (ต้องไม่ว่าง)
+    - ขึ้นต้นด้วยเลข (1กร 1234): ตัดรหัสออกจากกลางสตริง
     """
     if not text or len(text) < 2:
         return text, ""
-    
-    # ลบช่องว่างและอักขระพิเศษ
     text = text.strip()
-    
-    # รูปแบบป้ายทะเบียนไทย: [รหัสจังหวัด 1-2 ตัว] [ตัวเลข] หรือ [ตัวเลข][รหัสจังหวัด][ตัวเลข]
-    
-    # ลองหา 2 ตัวอักษรไทยที่ขึ้นต้น
-    match = re.match(r'^([ก-ฮ]{1,2})\s*(.+)$', text)
-    if match:
-        province_code = match.group(1)
-        plate_number = match.group(2).strip()
-        
-        # ตรวจสอบว่าเป็นรหัสจังหวัดจริงหรือไม่
-        if province_code in THAI_PROVINCES:
-            return plate_number, province_code
-        # ถ้าไม่ใช่ อาจเป็นส่วนหนึ่งของเลขป้าย
+    m = _CODE_START.search(text)
+    if m is None:
         return text, ""
+    start = m.start()
+    n = _match_province(text, start)
+    if not n and not _is_consonant(text[start]):
+        # สระนำที่ไม่ได้เป็นรหัส - ลองที่พยัญชนะตัวถัดไป
+        m = _CONSONANT.search(text, start + 1)
+        if m is None:
+            return text, ""
+        start = m.start()
+        n = _match_province(text, start)
+    if not n:
+        return text, ""
+    code = text[start:start + n]
+    if start == 0:
+        number = text[n:].strip()
+        return (number, code) if number else (text, "")
+    return (text[:start] + text[start + n:]).strip(), code
+
+def extract_province(text: str) -> tuple[str, str]:
+    """
+    แยกจังหวัดจากข้อความป้ายทะเบียน
     
-    # ลองหา pattern: ตัวเลข + ตัวอักษรไทย + ตัวเลข
-    match = re.search(r'([ก-ฮ]{1,2})', text)
-    if match:
-        province_code = match.group(1)
-        if province_code in THAI_PROVINCES:
-            # ลบรหัสจังหวัดออก
-            plate_number = text.replace(province_code, '').strip()
-            return plate_number, province_code
-    
-    # ไม่พบจังหวัด
-    return text, ""
+    Returns:
+        (plate_number, province_code): เช่น ("1234", "กก")
+    """
+    return _split_plate(text)
 
 def get_province_name(province_code: str) -> str:
     """
@@ -149,6 +228,12 @@ def get_province_name(province_code: str) -> str:
     """
     return THAI_PROVINCES.get(province_code, province_code)
 
+def _format(text: str, plate_number: str, province_code: str) -> str:
+    if province_code:
+        # มี province code - จัดรูปแบบให้มีช่องว่าง
+        return f"{province_code} {plate_number}".strip()
+    return text
+
 def format_plate_text(text: str) -> str:
     """
     จัดรูปแบบข้อความป้ายให้สวยงาม
@@ -156,19 +241,11 @@ def format_plate_text(text: str) -> str:
     """
     if not text:
         return text
-    
-    # ลองแยก province
-    plate_number, province_code = extract_province(text)
-    
-    if province_code:
-        # มี province code - จัดรูปแบบให้มีช่องว่าง
-        return f"{province_code} {plate_number}".strip()
-    
-    return text
+    return _format(text, *_split_plate(text))
 
-def parse_plate(text: str) -> dict:
+def parse_plate(text: str, allowed: Optional[frozenset] = None) -> dict:
     """
-    แยกวิเคราะห์ข้อความป้ายทะเบียนให้สมบูรณ์
+    แยกวิเคราะห์ข้อความป้ายทะเบียนให้สมบูรณ์ (แยกจังหวัดครั้งเดียว)
     
     Returns:
         {
@@ -176,18 +253,16 @@ def parse_plate(text: str) -> dict:
             "province_code": "กก", 
             "province_name": "กรุงเทพมหานคร",
             "full_text": "กก 1234",
-            "formatted_text": "กก 1234"
+            "formatted_text": "กก 1234",
+            "score": 140
         }
     """
-    plate_number, province_code = extract_province(text)
-    province_name = get_province_name(province_code) if province_code else ""
-    formatted_text = format_plate_text(text)
-    
+    plate_number, province_code = _split_plate(text)
     return {
         "plate_number": plate_number,
         "province_code": province_code,
-        "province_name": province_name,
+        "province_name": get_province_name(province_code) if province_code else "",
         "full_text": text,
-        "formatted_text": formatted_text
+        "formatted_text": _format(text, plate_number, province_code) if text else text,
+        "score": score_plate(text or "", allowed or PLATE_CHARS),
     }
-
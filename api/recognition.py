@@ -0,0 +1,228 @@
+# api/recognition.py
+"""
+pipeline อ่านป้ายของภาพหนึ่งภาพ (ใช้ร่วมกันระหว่าง /detect กับ benchmarks/bench_pipeline.py)
+detector -> crop ROI -> reader (beam / top-1) -> character segmentation -> OCR เต็มป้าย -> parse จังหวัด
+ทุก stage จับเวลาผ่าน Cascade (stage ที่ไม่ได้รันจะไม่มีใน cascade.stages)
+"""
+from typing import Optional
+
+from .local_models import infer_detector, infer_reader
+from .ocr import run_ocr_on_bbox
+from .province_parser import parse_plate
+from .plate_decoder import decode_plate, READER_ALT_MIN_CONF
+from .image_decode import DecodedImage, crop_roi
+from .cascade import Cascade
+from .metrics import FALLBACK_TOTAL
+from .logger import get_logger, lazy
+
+log = get_logger("recognition")
+
+def clean_text(s: str) -> str:
+    return "".join(ch for ch in (s or "").strip() if ch not in "\r\n\t").strip()
+
+def build_plate_from_reader(preds_list: list) -> tuple[str, list, Optional[float]]:
+    """เรียงตัวอักษรตามตำแหน่งและรวมเป็นข้อความแบบเป็นแถว"""
+    if not preds_list:
+        return "", [], None
+
+    try:
+        filtered = [p for p in preds_list if float(p.get("confidence", 0)) >= 0.35]
+        if not filtered:
+            return "", [], None
+
+        # ประเมินความสูงเฉลี่ยเพื่อใช้ threshold แยกแถว
+        heights = []
+        for p in filtered:
+            y1, y2 = p.get("y1"), p.get("y2")
+            if y1 is not None and y2 is not None:
+                heights.append(abs(float(y2) - float(y1)))
+        avg_h = sum(heights) / len(heights) if heights else 40.0
+        row_thresh = max(20.0, avg_h * 0.6)  # ยืดหยุ่นตามขนาดตัวอักษร
+
+        # จัดกลุ่มตามแถว (y)
+        rows: dict[float, list] = {}
+        for p in filtered:
+            y = float(p.get("y", 0))
+            found = False
+            for row_y in sorted(rows.keys()):
+                if abs(y - row_y) < row_thresh:
+                    rows[row_y].append(p)
+                    found = True
+                    break
+            if not found:
+                rows[y] = [p]
+
+        # เรียงแถวบนลงล่าง และซ้ายไปขวา
+        character_details_local = []
+        row_texts = []
+        for row_y in sorted(rows.keys()):
+            row = rows[row_y]
+            row.sort(key=lambda p: float(p.get("x", 0)))
+            row_chars = []
+            for p in row:
+                char_cls = (p.get("class") or p.get("name") or "").strip()
+                c_conf = float(p.get("confidence", p.get("conf", 0)) or 0)
+                if not char_cls:
+                    continue
+                row_chars.append(char_cls)
+                character_details_local.append({
+                    "character": char_cls,
+                    "confidence": c_conf,
+                    "bbox": {
+                        "x1": p.get("x1"), "y1": p.get("y1"),
+                        "x2": p.get("x2"), "y2": p.get("y2"),
+                    },
+                    "method": "reader_model"
+                })
+            if row_chars:
+                row_texts.append("".join(row_chars))
+
+        full_text = " ".join(row_texts).strip()
+        # ทำความสะอาดช่องว่างซ้ำ
+        full_text = " ".join(full_text.split())
+
+        avg_conf = None
+        try:
+            avg_conf = sum(d["confidence"] for d in character_details_local) / len(character_details_local) if character_details_local else None
+        except Exception:
+            avg_conf = None
+
+        return full_text, character_details_local, avg_conf
+    except Exception as e:
+        log.debug("build_plate_from_reader error: %s", e)
+        return "", [], None
+
+def recognize_plate(dec: DecodedImage, cascade: Cascade) -> dict:
+    """
+    อ่านป้ายจากภาพที่ decode แล้ว คืน plate_text / province_text / conf / character_details
+    พร้อมผลดิบของ detector / reader และ reader_method ("beam" / "greedy" / None)
+    """
+    # ภาพถูกย่อให้กว้างไม่เกิน MAX_IMAGE_WIDTH ตั้งแต่ตอน decode แล้ว
+    img = dec.img
+    H, W = img.shape[:2]
+
+    used_crop = False
+
+    # --- 1) Detector ---
+    with cascade.stage("detector", cancellable=False):
+        det_preds = infer_detector(img)
+    # list ของ prediction สร้างตอนเขียน log เท่านั้น (DEBUG ปิด = ไม่สร้างเลย)
+    log.debug("detector: %s", lazy(lambda: [(p.get("class"), round(float(p.get("confidence", 0)), 3))
+                                            for p in det_preds][:8]))
+
+    # --- Choose ROI for reader/OCR ---
+    if det_preds:
+        best_det = max(det_preds, key=lambda x: float(x.get("confidence", 0)))
+        x1, y1, x2, y2 = int(best_det["x1"]), int(best_det["y1"]), int(best_det["x2"]), int(best_det["y2"])
+        # sanitize
+        x1, y1 = max(0, min(x1, x2)), max(0, min(y1, y2))
+        x2, y2 = max(0, max(x1, x2)), max(0, max(y1, y2))
+        x1, y1, x2, y2 = min(x1, W-1), min(y1, H-1), min(x2, W), min(y2, H)
+        # 5% padding helps OCR
+        pad = int(0.05 * max(x2 - x1, y2 - y1))
+        x1p, y1p = max(0, x1 - pad), max(0, y1 - pad)
+        x2p, y2p = min(W, x2 + pad), min(H, y2 + pad)
+        # ป้ายเล็กในภาพย่อ -> crop จากการ decode ความละเอียดสูงขึ้น
+        with cascade.stage("crop", cancellable=False):
+            crop = crop_roi(dec, x1p, y1p, x2p, y2p)
+        img_for_ocr = crop
+        used_crop = True
+    else:
+        best_det = None
+        img_for_ocr = img
+    dec.release()  # ไม่ต้องใช้ buffer ต้นฉบับแล้ว
+
+    # DEBUG save crop (disabled for performance - enable only when debugging)
+    # try:
+    #     debug_path = f"/tmp/ocr_crop_{uuid4().hex}.png"
+    #     cv2.imwrite(debug_path, img_for_ocr)
+    #     log.debug("saved crop: %s", debug_path)
+    # except Exception as e:
+    #     log.debug("save crop error: %s", e)
+
+    # --- 2) Reader on ROI ---
+    with cascade.stage("reader", cancellable=False):
+        rf = infer_reader(img_for_ocr, conf=READER_ALT_MIN_CONF)
+    log.debug("reader preds: %s", lazy(lambda: [(p.get("class") or p.get("name"),
+                                                  round(float(p.get("confidence", p.get("conf", 0))), 3))
+                                                 for p in rf.get("predictions", [])][:12]))
+
+    preds = rf.get("predictions", [])
+    
+    # --- Reader-first pipeline: ใช้ผลจาก Reader Model เรียงตัวอักษรทีละตัว ---
+    plate_text = ""
+    province_text = ""
+    conf = None
+    character_details = []
+    
+    # 1) ใช้ Reader Model: beam search ตามรูปแบบป้าย/ตารางจังหวัดก่อน ไม่ได้ค่อยต่อ top-1 แบบเดิม
+    reader_method = None
+    if preds:
+        with cascade.stage("reader_decode", cancellable=False):
+            reading = decode_plate(preds)
+        if reading is not None:
+            reader_method = "beam"
+            plate_text = reading["text"]
+            province_text = reading["province"]
+            character_details = reading["characters"]
+            conf = reading["confidence"]
+            log.debug("reader beam: %s %s conf=%.3f changed=%s skipped=%s",
+                      plate_text, province_text, conf, reading["changed"], reading["skipped"])
+        else:
+            reader_method = "greedy"
+            FALLBACK_TOTAL.labels(cascade.path, "reader_greedy").inc()
+            with cascade.stage("reader_greedy", cancellable=False):
+                plate_text, character_details, conf_reader = build_plate_from_reader(preds)
+            if conf is None and conf_reader is not None:
+                conf = conf_reader
+    
+    # 2) Fallback Character Segmentation + OCR ถ้า reader ไม่ได้ผล (ถ้ายังมีเวลาในงบ)
+    if (not plate_text or len(plate_text) < 2) and cascade.should_run("segmentation"):
+        FALLBACK_TOTAL.labels(cascade.path, "segmentation").inc()
+        try:
+            from .character_segmentation import read_plate_by_characters
+            with cascade.stage("segmentation") as deadline:
+                segmented_text, segmented_details = read_plate_by_characters(img_for_ocr, deadline=deadline)
+            if segmented_text and len(segmented_text) >= 2:
+                plate_text, character_details = segmented_text, segmented_details
+                log.debug("Character Segmentation result: %s (%d chars)", plate_text, len(character_details))
+        except Exception as e:
+            log.warning("Character segmentation error: %s", e)
+    
+    # 3) Fallback OCR เต็มป้าย ถ้ายังว่าง (เลยเวลาระหว่างทาง = ใช้ผลดีที่สุดที่ได้)
+    if (not plate_text or len(plate_text) < 2) and cascade.should_run("ocr"):
+        FALLBACK_TOTAL.labels(cascade.path, "ocr").inc()
+        try:
+            h_, w_ = img_for_ocr.shape[:2]
+            with cascade.stage("ocr") as deadline:
+                ocr_text = clean_text(run_ocr_on_bbox(img_for_ocr, 0, 0, w_, h_, deadline=deadline))
+            if ocr_text or not plate_text:
+                plate_text = ocr_text
+            log.debug("OCR fallback result: %s", plate_text)
+        except Exception as ocr_error:
+            log.warning("OCR fallback error: %s", ocr_error)
+    if cascade.degraded:
+        log.info("[CASCADE] ⚠️ degraded result '%s': %s", plate_text, cascade.summary())
+
+    # --- Parse province from plate_text ---
+    if plate_text and not province_text:
+        with cascade.stage("parse", cancellable=False):
+            parsed = parse_plate(plate_text)
+        if parsed["province_code"]:
+            province_text = parsed["province_name"]
+            plate_text = parsed["formatted_text"]  # จัดรูปแบบให้สวย
+        log.debug("parsed plate: %s", parsed)
+
+    # --- Backfill conf from detector if missing ---
+    if conf is None and best_det is not None:
+        try:
+            conf = float(best_det.get("confidence", 0.0))
+        except Exception:
+            conf = None
+
+    return {
+        "used_crop": used_crop, "img_for_ocr": img_for_ocr,
+        "det_preds": det_preds, "rf": rf, "character_details": character_details,
+        "plate_text": plate_text, "province_text": province_text, "conf": conf,
+        "reader_method": reader_method,
+    }
@@ -11,6 +11,7 @@ class PlateCreateResponse(BaseModel):
     first_seen_info: Optional[dict] = None  # Info about the first detection record
     duplicate_records: Optional[list] = None  # List of duplicate record IDs and info
     plate_image: Optional[str] = None  # Path to cropped plate image
+    degraded: Optional[bool] = False  # fallback ถูกข้าม/ตัดเพราะหมดงบเวลา (X-Latency-Budget-Ms)
 class PlateRecordOut(BaseModel):
     id: int
     plate_text: str
@@ -0,0 +1,278 @@
+# api/segment_store.py
+"""
+ที่เก็บภาพป้ายแบบ packed segment (เปิดใช้ด้วย PLATE_STORE=segments)
+- ต่อท้ายภาพลงไฟล์ segment ขนาดใหญ่แทนการสร้างไฟล์เล็กนับล้านไฟล์ (inode หมด / backup ช้า)
+- index (segment, offset, length, crc32) เก็บในตาราง plate_image_blobs
+- เสิร์ฟ /uploads/plates/<key> ด้วย mmap พร้อม ETag และ Range
+- compaction ทำพร้อมกับ retention (/api/records/clear-old)
+- หลาย process (uvicorn --workers) ใช้โฟลเดอร์เดียวกันได้: แต่ละ process เขียน segment ของตัวเองเท่านั้น
+  (ถือ flock ของ segment ที่กำลังเขียนไว้) สร้าง segment ใหม่ / compaction ทำภายใต้ flock ของโฟลเดอร์
+"""
+import os
+import mmap
+import zlib
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from fastapi import Response
+from fastapi.responses import FileResponse
+from sqlalchemy import func
+
+from .database import SessionLocal
+from .models import PlateImageBlob
+from .logger import get_logger
+
+log = get_logger("segments")
+
+PLATE_STORE = os.getenv("PLATE_STORE", "files")  # files | segments
+SEGMENT_DIR = os.getenv("SEGMENT_DIR", "uploads/segments")
+SEGMENT_MAX_BYTES = int(os.getenv("SEGMENT_MAX_BYTES", str(256 * 1024 * 1024)))
+SEGMENT_COMPACT_RATIO = float(os.getenv("SEGMENT_COMPACT_RATIO", "0.5"))  # compact ถ้า live/total ต่ำกว่านี้
+LEGACY_PLATES_DIR = os.getenv("PLATE_IMAGE_DIR", "uploads/plates")  # ไฟล์เดิมก่อนเปิด segment store
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp", ".png": "image/png"}
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    แปลง Range header แบบช่วงเดียว -> (start, end) แบบ inclusive
+    คืน None ถ้าไม่มี/ไม่รองรับ, raise ValueError ถ้าช่วงเกินขนาดไฟล์
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            suffix = int(end_s)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - suffix), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        raise ValueError(f"invalid range: {header}")
+    if start >= size or end < start:
+        raise ValueError(f"unsatisfiable range: {header}")
+    return start, min(end, size - 1)
+
+class SegmentStore:
+    """
+    append-only segment files + mmap reader
+    writer มีได้ทีละ thread ต่อ process (self._lock) และ segment หนึ่งมี process เขียนได้ตัวเดียว
+    """
+
+    def __init__(self, directory: str = SEGMENT_DIR, max_bytes: int = SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps: dict[int, mmap.mmap] = {}
+        self._maps_lock = threading.Lock()
+        self._dir_fh = None
+        self._current, self._fh = self._new_segment()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"seg_{segment:06d}.dat")
+
+    def _segment_ids(self) -> list[int]:
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith("seg_") and name.endswith(".dat"):
+                try:
+                    ids.append(int(name[4:-4]))
+                except ValueError:
+                    pass
+        return sorted(ids)
+
+    @contextmanager
+    def _dir_lock(self):
+        """
+        flock ของทั้งโฟลเดอร์ (ข้าม process): ใช้ตอนจอง segment ใหม่และตอน compact
+        ซ้อนกันได้ใน process เดียว (compact -> _append -> _new_segment) ผู้เรียกต้องถือ self._lock
+        """
+        if self._dir_fh is not None:
+            yield
+            return
+        fh = open(os.path.join(self.directory, ".lock"), "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            self._dir_fh = fh
+            yield
+        finally:
+            self._dir_fh = None
+            fh.close()  # ปิดไฟล์ = ปล่อย lock
+
+    def _new_segment(self):
+        """
+        จองเลข segment ใหม่ (ไม่ซ้ำกับ process อื่น) แล้วถือ flock ของไฟล์นั้นไว้ตลอดที่ยังเขียนอยู่
+        offset จาก tell() จึงถูกเสมอ และ compact ของ process อื่นจะข้าม segment นี้
+        """
+        with self._dir_lock():
+            existing = self._segment_ids()
+            segment = existing[-1] + 1 if existing else 1
+            fh = open(self._path(segment), "xb")
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return segment, fh
+
+    def _append(self, data: bytes) -> tuple[int, int]:
+        """ต่อท้าย segment ปัจจุบัน (ผู้เรียกต้องถือ self._lock)"""
+        if self._fh.tell() > 0 and self._fh.tell() + len(data) > self.max_bytes:
+            self._fh.close()  # ปล่อย flock: segment นี้ compact ได้แล้ว
+            self._current, self._fh = self._new_segment()
+        offset = self._fh.tell()
+        self._fh.write(data)
+        self._fh.flush()
+        return self._current, offset
+
+    def put_many(self, items: Iterable[tuple[str, bytes]]):
+        """เขียนหลายภาพ (เช่น ภาพเต็ม + thumbnail) แล้ว commit index ครั้งเดียว"""
+        with self._lock:
+            db = SessionLocal()
+            try:
+                for key, data in items:
+                    segment, offset = self._append(data)
+                    db.merge(PlateImageBlob(
+                        key=key, segment=segment, offset=offset,
+                        length=len(data), crc32=zlib.crc32(data)
+                    ))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def _read(self, segment: int, offset: int, length: int) -> Optional[bytes]:
+        end = offset + length
+        with self._maps_lock:
+            mm = self._maps.get(segment)
+            if mm is None or len(mm) < end:
+                # segment ปัจจุบันยังโตอยู่ -> map ใหม่ให้ครอบคลุมข้อมูลล่าสุด
+                if mm is not None:
+                    mm.close()
+                    self._maps.pop(segment, None)
+                try:
+                    with open(self._path(segment), "rb") as f:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (FileNotFoundError, ValueError):
+                    return None
+                self._maps[segment] = mm
+            if len(mm) < end:
+                return None
+            return mm[offset:end]
+
+    def _drop_map(self, segment: int):
+        with self._maps_lock:
+            mm = self._maps.pop(segment, None)
+            if mm is not None:
+                mm.close()
+
+    def get(self, key: str) -> Optional[tuple[bytes, str]]:
+        """คืน (ข้อมูลภาพ, etag) หรือ None ถ้าไม่พบ"""
+        db = SessionLocal()
+        try:
+            row = db.get(PlateImageBlob, key)
+        finally:
+            db.close()
+        if row is None:
+            return None
+        data = self._read(row.segment, row.offset, row.length)
+        if data is None:
+            return None
+        return data, f'"{row.crc32:08x}"'
+
+    def delete(self, keys: Iterable[str]) -> int:
+        """ลบ index ของภาพ (พื้นที่จริงถูกคืนตอน compact)"""
+        keys = [k for k in keys if k]
+        if not keys:
+            return 0
+        db = SessionLocal()
+        try:
+            deleted = 0
+            for i in range(0, len(keys), 500):
+                deleted += db.query(PlateImageBlob).filter(
+                    PlateImageBlob.key.in_(keys[i:i + 500])
+                ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def compact(self) -> dict:
+        """
+        ย้ายภาพที่ยังใช้อยู่ออกจาก segment ที่มีข้อมูลถูกลบเยอะ แล้วลบ segment เก่าทิ้ง
+        ไม่แตะ segment ที่ process ไหนกำลังเขียนอยู่ (ยังถือ flock) และ compact ได้ทีละ process
+        """
+        compacted, reclaimed = [], 0
+        with self._lock, self._dir_lock():
+            db = SessionLocal()
+            try:
+                live_bytes = dict(
+                    db.query(PlateImageBlob.segment, func.sum(PlateImageBlob.length))
+                    .group_by(PlateImageBlob.segment).all()
+                )
+                for segment in self._segment_ids():
+                    if segment == self._current:
+                        continue
+                    path = self._path(segment)
+                    total = os.path.getsize(path)
+                    live = int(live_bytes.get(segment) or 0)
+                    if total > 0 and live / total >= SEGMENT_COMPACT_RATIO:
+                        continue
+                    with open(path, "rb") as f:
+                        try:
+                            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            continue  # process อื่นยังเขียน segment นี้อยู่
+                        rows = db.query(PlateImageBlob).filter(PlateImageBlob.segment == segment).all()
+                        for row in rows:
+                            f.seek(row.offset)
+                            row.segment, row.offset = self._append(f.read(row.length))
+                        db.commit()
+                        self._drop_map(segment)
+                        os.remove(path)
+                    compacted.append(segment)
+                    reclaimed += total - live
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+        if compacted:
+            log.info("[SEGMENTS] Compacted segments=%s reclaimed=%d bytes", compacted, reclaimed)
+        return {"segments_compacted": compacted, "bytes_reclaimed": reclaimed}
+
+    def response(self, key: str, range_header: Optional[str], if_none_match: Optional[str]) -> Response:
+        """สร้าง HTTP response พร้อม ETag / 304 / 206"""
+        found = self.get(key)
+        if found is None:
+            # ไฟล์เก่าก่อนเปิดใช้ segment store
+            legacy = os.path.join(LEGACY_PLATES_DIR, key)
+            if ".." not in key and os.path.isfile(legacy):
+                return FileResponse(legacy)
+            return Response(status_code=404)
+
+        data, etag = found
+        media_type = CONTENT_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "public, max-age=31536000, immutable",
+        }
+        if if_none_match and etag in if_none_match:
+            return Response(status_code=304, headers=headers)
+
+        size = len(data)
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            return Response(content=data, media_type=media_type, headers=headers)
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(content=data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+segment_store = SegmentStore() if PLATE_STORE == "segments" else None
@@ -0,0 +1,168 @@
+# api/session_store.py
+"""
+ที่เก็บ session ของผู้ใช้
+- memory: dict + heap ของเวลาหมดอายุ (ลบ session หมดอายุแบบ O(log n) ไม่ต้อง scan ทุก token)
+- database: ตาราง user_sessions (SQLite/PostgreSQL) ใช้ร่วมกันได้หลาย uvicorn worker
+เลือกด้วย SESSION_BACKEND=memory|database
+"""
+import os
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .database import SessionLocal
+from .models import UserSession
+from .logger import get_logger
+
+log = get_logger("auth")
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | database
+SESSION_EXPIRY_HOURS = int(os.getenv("SESSION_EXPIRY_HOURS", "24"))
+SESSION_CLEANUP_INTERVAL_SEC = int(os.getenv("SESSION_CLEANUP_INTERVAL_SEC", "300"))
+
+class SessionStore:
+    """interface กลางของ session store"""
+
+    def get(self, token: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, token: str, data: dict):
+        raise NotImplementedError
+
+    def delete(self, token: str):
+        raise NotImplementedError
+
+    def cleanup(self) -> int:
+        """ลบ session ที่หมดอายุ คืนจำนวนที่ลบ"""
+        raise NotImplementedError
+
+class MemorySessionStore(SessionStore):
+    """session ใน process เดียว (ใช้ได้กับ uvicorn worker เดียว)"""
+
+    def __init__(self, ttl_sec: float = SESSION_EXPIRY_HOURS * 3600):
+        self.ttl_sec = ttl_sec
+        self._sessions: dict[str, tuple[float, dict]] = {}  # token -> (expires_at, data)
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> int:
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, token = heapq.heappop(heap)
+            entry = self._sessions.get(token)
+            # heap อาจมี entry เก่าของ token ที่ logout หรือ set ใหม่แล้ว
+            if entry is not None and entry[0] == expires_at:
+                del self._sessions[token]
+                removed += 1
+        return removed
+
+    def get(self, token: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(token)
+        if entry is None or entry[0] <= now:
+            return None
+        return entry[1]
+
+    def set(self, token: str, data: dict):
+        expires_at = time.time() + self.ttl_sec
+        with self._lock:
+            self._sessions[token] = (expires_at, data)
+            heapq.heappush(self._expiry_heap, (expires_at, token))
+
+    def delete(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def cleanup(self) -> int:
+        with self._lock:
+            return self._expire(time.time())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class DatabaseSessionStore(SessionStore):
+    """session ในตาราง user_sessions ใช้ร่วมกันทุก worker (lookup ด้วย primary key)"""
+
+    def __init__(self, ttl_sec: float = SESSION_EXPIRY_HOURS * 3600,
+                 cleanup_interval_sec: float = SESSION_CLEANUP_INTERVAL_SEC):
+        self.ttl_sec = ttl_sec
+        self.cleanup_interval_sec = cleanup_interval_sec
+        self._next_cleanup = 0.0
+
+    def _maybe_cleanup(self):
+        # ลบ session หมดอายุผ่าน index expires_at เป็นช่วงๆ ไม่ใช่ทุก request
+        now = time.time()
+        if now >= self._next_cleanup:
+            self._next_cleanup = now + self.cleanup_interval_sec
+            self.cleanup()
+
+    def get(self, token: str) -> Optional[dict]:
+        self._maybe_cleanup()
+        db = SessionLocal()
+        try:
+            row = db.query(UserSession).filter(
+                UserSession.token == token, UserSession.expires_at > datetime.utcnow()
+            ).first()
+            if row is None:
+                return None
+            return {
+                "user_id": row.user_id,
+                "username": row.username,
+                "email": row.email,
+                "role": row.role,
+                "created_at": row.created_at,
+            }
+        finally:
+            db.close()
+
+    def set(self, token: str, data: dict):
+        created_at = data.get("created_at") or datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.merge(UserSession(
+                token=token,
+                user_id=data.get("user_id"),
+                username=data.get("username"),
+                email=data.get("email"),
+                role=data.get("role"),
+                created_at=created_at,
+                expires_at=created_at + timedelta(seconds=self.ttl_sec),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def delete(self, token: str):
+        db = SessionLocal()
+        try:
+            db.query(UserSession).filter(UserSession.token == token).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def cleanup(self) -> int:
+        db = SessionLocal()
+        try:
+            removed = db.query(UserSession).filter(
+                UserSession.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        except Exception as e:
+            db.rollback()
+            log.error("ERROR cleaning up sessions: %s", e)
+            return 0
+        finally:
+            db.close()
+
+def create_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    if backend == "database":
+        return DatabaseSessionStore()
+    if backend != "memory":
+        log.warning("[AUTH] ⚠️ Unknown SESSION_BACKEND=%s, using memory", backend)
+    return MemorySessionStore()
@@ -0,0 +1,321 @@
+# api/tracing.py
+"""
+trace ต่อ request (/detect) หรือต่อ frame วิดีโอ: span ซ้อนกันของทุก stage
+(decode, detector, reader, fallback, Tesseract ทีละครั้ง, DB query, เขียนภาพ, broadcast, คำสั่ง serial)
+- span ปัจจุบันอยู่ใน contextvar: ส่งต่อเข้า recognition executor (admission.run copy context ให้)
+  งาน background (image writer, ws fan-out, gate thread) รับ parent ไปกับงานเอง
+- ไม่มี trace อยู่ = span() คืนทันที (ต้นทุนแค่อ่าน contextvar)
+- export แบบ OTLP/JSON (ExportTraceServiceRequest ละบรรทัด แบบ file exporter ของ OpenTelemetry Collector)
+  ลง TRACE_EXPORT_PATH และ/หรือ POST ไป TRACE_OTLP_ENDPOINT (เช่น http://collector:4318/v1/traces)
+  โดย thread เบื้องหลัง คิวเต็ม = ทิ้ง (ไม่หน่วง request)
+- TRACE_SLOW_MS > 0: export เฉพาะ trace ที่ช้ากว่านี้ (ดู outlier), span ที่จบหลัง trace (เขียนภาพ/ACK) ตามไปทีหลัง
+trace id ของ /detect อยู่ใน response header X-Trace-Id
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from typing import Optional
+
+# api/logger.py import โมดูลนี้ จึงใช้ logging ตรง ๆ (ได้ logger "lpr.trace" ตัวเดียวกับ get_logger)
+log = logging.getLogger("lpr.trace")
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces/traces.jsonl")  # ว่าง = ไม่เขียนไฟล์
+TRACE_EXPORT_MAX_MB = float(os.getenv("TRACE_EXPORT_MAX_MB", "50"))  # เกินแล้วหมุนเป็น .1
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "1024"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "thai-lpr-api")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("lpr_span", default=None)
+
+def _attr_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "root", "exported", "_lock")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list["Span"] = []
+        self.root: Optional["Span"] = None
+        self.exported: Optional[bool] = None  # None = ยังไม่จบ, True/False = ส่งออกหรือไม่
+        self._lock = threading.Lock()
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else ""
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[str] = None, **attributes):
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if error:
+            self.error = error
+        if attributes:
+            self.attributes.update(attributes)
+        trace = self.trace
+        with trace._lock:
+            if trace.exported is None:
+                trace.spans.append(self)
+                return
+            late = trace.exported
+        if late:
+            exporter.submit([self])  # จบหลัง trace (งาน background) ส่งตามไปทีหลัง
+
+    def otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if not self.parent_id else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _attr_value(v)} for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+# ---------- API ----------
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.trace_id if span is not None else None
+
+def start_trace(name: str, **attributes) -> Optional[Span]:
+    """เริ่ม trace ใหม่ (root span) และตั้งเป็น span ปัจจุบัน คืน None ถ้าปิดอยู่ / ไม่ถูก sample"""
+    if not TRACE_ENABLED or (TRACE_SAMPLE_RATE < 1.0 and random.random() >= TRACE_SAMPLE_RATE):
+        return None
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    trace.root = root
+    _current.set(root)
+    return root
+
+def finish_trace(root: Optional[Span], error: Optional[str] = None, **attributes):
+    """ปิด root span แล้ว export ทั้ง trace (ถ้าผ่าน TRACE_SLOW_MS)"""
+    if root is None:
+        return
+    root.end(error, **attributes)
+    trace = root.trace
+    slow_enough = TRACE_SLOW_MS <= 0 or (root.end_ns - root.start_ns) / 1e6 >= TRACE_SLOW_MS
+    with trace._lock:
+        trace.exported = slow_enough
+        spans, trace.spans = trace.spans, []
+    if slow_enough:
+        exporter.submit(spans)
+    if _current.get() is root:
+        _current.set(None)
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+    """span ที่จบเองทีหลัง (.end()) เช่นรอ ACK ใน thread อื่น ไม่เปลี่ยน span ปัจจุบัน"""
+    parent = parent or _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent, attributes)
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes):
+    """span ซ้อนใต้ span ปัจจุบัน (หรือ parent ที่ส่งมา) ไม่มี trace = ไม่ทำอะไร yield None"""
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(parent.trace, name, parent, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+# ---------- ASGI middleware ----------
+
+class TraceMiddleware:
+    """เริ่ม trace ต่อ request ของ path ที่กำหนด และใส่ X-Trace-Id ใน response"""
+
+    def __init__(self, app, paths: tuple = ("/detect",)):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        root = start_trace(f"{scope['method']} {scope['path']}", **{"http.method": scope["method"],
+                                                                     "http.route": scope["path"]})
+        if root is None:
+            return await self.app(scope, receive, send)
+        status = {"code": None}
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-trace-id", root.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            finish_trace(root, f"{type(e).__name__}: {e}")
+            raise
+        code = status["code"]
+        finish_trace(root, f"HTTP {code}" if code and code >= 500 else None, **{"http.status_code": code})
+
+# ---------- SQLAlchemy ----------
+
+def instrument_engine(engine):
+    """span "db.query" ต่อ statement ที่รันระหว่างมี trace"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("lpr_spans", []).append(
+                start_span("db.query", **{"db.statement": statement[:300], "db.executemany": executemany}))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("lpr_spans")
+        if spans:
+            s = spans.pop()
+            if s is not None:
+                s.end(**{"db.rows": cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None})
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        spans = ctx.connection.info.get("lpr_spans") if ctx.connection is not None else None
+        if spans:
+            s = spans.pop()
+            if s is not None:
+                s.end(error=str(ctx.original_exception)[:300])
+
+# ---------- exporter ----------
+
+class SpanExporter:
+    """thread เดียวเขียน JSONL / POST OTLP ตามลำดับ คิวเต็ม = นับว่าทิ้ง"""
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, endpoint: str = TRACE_OTLP_ENDPOINT,
+                 max_queue: int = TRACE_QUEUE_MAX):
+        self.path = path
+        self.endpoint = endpoint
+        self._queue: "queue.Queue[Optional[list]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, spans: list):
+        if not spans or not (self.path or self.endpoint):
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _payload(self, spans: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "api.tracing"}, "spans": [s.otlp() for s in spans]}],
+        }]}
+
+    def _write_file(self, line: str):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            if os.path.getsize(self.path) > TRACE_EXPORT_MAX_MB * 1024 * 1024:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _post(self, body: bytes):
+        req = urllib.request.Request(self.endpoint, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            resp.read()
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            line = json.dumps(self._payload(spans), ensure_ascii=False, separators=(",", ":"))
+            try:
+                if self.path:
+                    self._write_file(line)
+                if self.endpoint:
+                    self._post(line.encode())
+                self.exported += len(spans)
+            except Exception as e:
+                self.errors += 1
+                log.warning("[TRACE] ⚠️ export failed: %s", e)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": TRACE_ENABLED,
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "slow_ms": TRACE_SLOW_MS,
+            "path": self.path or None,
+            "endpoint": self.endpoint or None,
+            "queued": self._queue.qsize(),
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+            "export_errors": self.errors,
+        }
+
+exporter = SpanExporter()
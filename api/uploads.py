@@ -0,0 +1,152 @@
+# api/uploads.py
+"""
+รับไฟล์อัปโหลดโดยไม่สร้าง temp file ค้าง และไม่ buffer ทั้งไฟล์ใน RAM
+- ภาพ: อ่านตรงจาก spooled buffer ของ UploadFile (ไม่เขียน /tmp)
+- วิดีโอ: stream ทีละ chunk ลง scratch directory ที่มี quota และลบทิ้งเสมอ
+"""
+import io
+import os
+import threading
+import urllib.request
+from uuid import uuid4
+
+import numpy as np
+from fastapi import UploadFile
+
+from .logger import get_logger
+
+log = get_logger("uploads")
+
+UPLOAD_SCRATCH_DIR = os.getenv("UPLOAD_SCRATCH_DIR", "/tmp/thai_lpr_scratch")
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_VIDEO_UPLOAD_BYTES = int(os.getenv("MAX_VIDEO_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_SCRATCH_QUOTA_BYTES = int(os.getenv("UPLOAD_SCRATCH_QUOTA_BYTES", str(4 * 1024 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT_SEC = float(os.getenv("IMAGE_FETCH_TIMEOUT_SEC", "5"))  # image_url / MJPEG ของ /detect
+
+class UploadTooLarge(Exception):
+    """ไฟล์ใหญ่เกิน limit ของแต่ละ request"""
+
+class ScratchQuotaExceeded(Exception):
+    """พื้นที่ scratch รวมของทุก request เต็ม"""
+
+_scratch_used = 0
+_scratch_lock = threading.Lock()
+
+def _reserve(nbytes: int):
+    global _scratch_used
+    with _scratch_lock:
+        if _scratch_used + nbytes > UPLOAD_SCRATCH_QUOTA_BYTES:
+            raise ScratchQuotaExceeded(
+                f"scratch quota exceeded ({_scratch_used + nbytes} > {UPLOAD_SCRATCH_QUOTA_BYTES} bytes)"
+            )
+        _scratch_used += nbytes
+
+def _release(nbytes: int):
+    global _scratch_used
+    with _scratch_lock:
+        _scratch_used = max(0, _scratch_used - nbytes)
+
+def scratch_usage() -> int:
+    return _scratch_used
+
+def purge_scratch():
+    """ลบไฟล์ที่ค้างจาก process ก่อนหน้า (เช่น crash) - เรียกตอน startup"""
+    os.makedirs(UPLOAD_SCRATCH_DIR, exist_ok=True)
+    for name in os.listdir(UPLOAD_SCRATCH_DIR):
+        try:
+            os.remove(os.path.join(UPLOAD_SCRATCH_DIR, name))
+        except OSError:
+            pass
+
+def read_image_upload(upload: UploadFile, max_bytes: int = MAX_IMAGE_UPLOAD_BYTES) -> np.ndarray:
+    """
+    คืน buffer ของไฟล์ภาพเป็น np.uint8 สำหรับ cv2.imdecode
+    ถ้า spool ยังอยู่ใน RAM ใช้ getvalue() (bytes ของตัวเอง ไม่ถือ memoryview ของ BytesIO ค้างไว้
+    ซึ่งทำให้ UploadFile.close() พังด้วย BufferError), ถ้าลงดิสก์แล้วอ่านครั้งเดียวด้วย np.fromfile
+    """
+    f = upload.file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    if size > max_bytes:
+        raise UploadTooLarge(f"image upload is {size} bytes (limit {max_bytes})")
+
+    inner = getattr(f, "_file", f)  # SpooledTemporaryFile -> BytesIO หรือไฟล์จริง
+    if isinstance(inner, io.BytesIO):
+        return np.frombuffer(inner.getvalue(), np.uint8)[:size]
+    try:
+        return np.fromfile(inner, dtype=np.uint8)
+    except (io.UnsupportedOperation, OSError):
+        return np.frombuffer(f.read(), np.uint8)
+
+def read_image_url(url: str, timeout: float = IMAGE_FETCH_TIMEOUT_SEC, max_bytes: int = MAX_IMAGE_UPLOAD_BYTES) -> np.ndarray:
+    """ดึงภาพจาก URL โดยจำกัดขนาด"""
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        data = resp.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLarge(f"image at URL exceeds {max_bytes} bytes")
+    return np.frombuffer(data, np.uint8)
+
+class ScratchFile:
+    """
+    ไฟล์ชั่วคราวใน UPLOAD_SCRATCH_DIR ที่นับ quota และลบทิ้งเมื่อ cleanup()
+    ใช้แบบ context manager หรือเรียก cleanup() ใน finally
+    """
+
+    def __init__(self, suffix: str = "", max_bytes: int = MAX_VIDEO_UPLOAD_BYTES):
+        os.makedirs(UPLOAD_SCRATCH_DIR, exist_ok=True)
+        self.path = os.path.join(UPLOAD_SCRATCH_DIR, f"{uuid4().hex}{suffix}")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._fh = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        if self.size + len(chunk) > self.max_bytes:
+            raise UploadTooLarge(f"upload exceeds {self.max_bytes} bytes")
+        _reserve(len(chunk))
+        self.size += len(chunk)
+        self._fh.write(chunk)
+
+    def finish(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+    async def save_upload(self, upload: UploadFile) -> int:
+        """stream UploadFile ลง scratch ทีละ chunk (RAM ไม่เกิน UPLOAD_CHUNK_BYTES)"""
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.write(chunk)
+        self.finish()
+        return self.size
+
+    def download(self, url: str, timeout: float = 30) -> int:
+        """ดาวน์โหลด URL ลง scratch ทีละ chunk (blocking - เรียกผ่าน asyncio.to_thread)"""
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            while True:
+                chunk = resp.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self.write(chunk)
+        self.finish()
+        return self.size
+
+    def cleanup(self):
+        self.finish()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Error cleaning up scratch file %s: %s", self.path, e)
+        _release(self.size)
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+        return False
@@ -0,0 +1,276 @@
+# api/ws_manager.py
+"""
+WebSocket connection manager
+- แต่ละ client มีคิวขาออกของตัวเอง (bounded) และ task ที่คอยส่ง
+- broadcast แค่ใส่ outbox แล้วคืนทันที (O(1)) ไม่รอ client ช้าๆ บน path ของ /detect
+- client ที่ส่งไม่ได้/ค้างเกิน WS_SEND_TIMEOUT_SEC จะถูกตัดออก
+- client เลือก subscribe เฉพาะ topic (type / source / lane / new plates only) และ encoding (json / msgpack) ได้
+  โดยส่งข้อความ {"action": "subscribe", ...} มาทาง /ws
+"""
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Optional, Union
+
+from fastapi import WebSocket
+
+from .event_bus import EventBus
+from .metrics import BROADCAST_SECONDS
+from .tracing import current_span, span
+from .logger import get_logger
+
+log = get_logger("ws")
+
+try:
+    import msgpack
+except ImportError:  # msgpack เป็น optional - ถ้าไม่มีใช้ได้แค่ JSON
+    msgpack = None
+
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "64"))
+WS_SEND_TIMEOUT_SEC = float(os.getenv("WS_SEND_TIMEOUT_SEC", "5"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")  # drop_oldest | coalesce
+WS_OUTBOX_MAX = int(os.getenv("WS_OUTBOX_MAX", "1024"))
+
+def encode_message(message: dict, encoding: str = "json") -> Union[str, bytes]:
+    # แบบเดียวกับ WebSocket.send_json ของ Starlette แต่ทำครั้งเดียวต่อ broadcast
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True, default=str)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def _as_set(value) -> Optional[frozenset]:
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, str):
+        value = [value]
+    return frozenset(str(v) for v in value)
+
+class Subscription:
+    """
+    ตัวกรอง event ของ client (ค่า None = รับทั้งหมด)
+    - types: detection, gate, ...
+    - sources: live (กล้อง/อัปโหลด) หรือ video
+    - lanes: lane/camera ของ event
+    - new_plates_only: detection เฉพาะป้ายที่เห็นครั้งแรก
+    """
+    __slots__ = ("types", "sources", "lanes", "new_plates_only", "encoding", "key")
+
+    def __init__(self, types=None, sources=None, lanes=None, new_plates_only: bool = False, encoding: str = "json"):
+        self.types = _as_set(types)
+        self.sources = _as_set(sources)
+        self.lanes = _as_set(lanes)
+        self.new_plates_only = bool(new_plates_only)
+        self.encoding = encoding if encoding == "msgpack" and msgpack is not None else "json"
+        self.key = (self.types, self.sources, self.lanes, self.new_plates_only)
+
+    @classmethod
+    def from_request(cls, req: dict) -> "Subscription":
+        return cls(
+            types=req.get("types"),
+            sources=req.get("sources"),
+            lanes=req.get("lanes"),
+            new_plates_only=req.get("new_plates_only", False),
+            encoding=req.get("encoding", "json"),
+        )
+
+    def matches(self, message: dict) -> bool:
+        msg_type = message.get("type", "")
+        if self.types is not None and msg_type not in self.types:
+            return False
+        if self.sources is not None and message.get("source", "live") not in self.sources:
+            return False
+        if self.lanes is not None and str(message.get("lane", "")) not in self.lanes:
+            return False
+        if self.new_plates_only and msg_type == "detection" and not message.get("is_new_plate", True):
+            return False
+        return True
+
+    def describe(self) -> dict:
+        return {
+            "types": sorted(self.types) if self.types else None,
+            "sources": sorted(self.sources) if self.sources else None,
+            "lanes": sorted(self.lanes) if self.lanes else None,
+            "new_plates_only": self.new_plates_only,
+            "encoding": self.encoding,
+        }
+
+ALL_TOPICS = Subscription()
+
+class ClientConnection:
+    """คิวขาออกของ client หนึ่งตัว"""
+
+    def __init__(self, websocket: WebSocket, max_queue: int = WS_SEND_QUEUE_MAX,
+                 policy: str = WS_OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self._queue: deque[tuple[str, Union[str, bytes]]] = deque()  # (message type, encoded payload)
+        self._wakeup = asyncio.Event()
+        self.dropped = 0
+        self.task: Optional[asyncio.Task] = None
+        self.subscription = ALL_TOPICS
+
+    def enqueue(self, msg_type: str, payload: Union[str, bytes]):
+        if len(self._queue) >= self.max_queue:
+            self._make_room(msg_type)
+        self._queue.append((msg_type, payload))
+        self._wakeup.set()
+
+    def _make_room(self, msg_type: str):
+        self.dropped += 1
+        if self.policy == "coalesce":
+            # แทนที่ข้อความเก่าสุดที่เป็น type เดียวกัน (ข้อความใหม่ทำให้อันเก่าล้าสมัย)
+            for i, (queued_type, _) in enumerate(self._queue):
+                if queued_type == msg_type:
+                    del self._queue[i]
+                    return
+        self._queue.popleft()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def drain(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, payload = self._queue.popleft()
+            if isinstance(payload, bytes):
+                await asyncio.wait_for(self.websocket.send_bytes(payload), WS_SEND_TIMEOUT_SEC)
+            else:
+                await asyncio.wait_for(self.websocket.send_text(payload), WS_SEND_TIMEOUT_SEC)
+
+class ConnectionManager:
+    def __init__(self, bus: Optional[EventBus] = None):
+        self.bus = bus  # ส่ง event ต่อให้ worker อื่น (ถ้ามีหลาย uvicorn worker)
+        self.clients: dict[WebSocket, ClientConnection] = {}
+        self._outbox: Optional[asyncio.Queue] = None
+        self._fanout_task: Optional[asyncio.Task] = None
+        self.evicted = 0
+        self.outbox_dropped = 0
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.clients)
+
+    def _ensure_started(self):
+        if self._fanout_task is None or self._fanout_task.done():
+            self._outbox = asyncio.Queue(maxsize=WS_OUTBOX_MAX)
+            self._fanout_task = asyncio.create_task(self._fanout())
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self._ensure_started()
+        client = ClientConnection(websocket)
+        client.task = asyncio.create_task(self._drain(client))
+        self.clients[websocket] = client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client and client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _drain(self, client: ClientConnection):
+        try:
+            await client.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("[WS] ⚠️ Evicting dead client: %r", e)
+            if self.clients.pop(client.websocket, None) is not None:
+                self.evicted += 1
+            try:
+                await asyncio.wait_for(client.websocket.close(), 1.0)
+            except Exception:
+                pass
+
+    def send_to(self, websocket: WebSocket, message: dict):
+        """ส่งถึง client เดียว ผ่านคิวของ client นั้น (ไม่ส่งซ้อนกับ drain task)"""
+        client = self.clients.get(websocket)
+        if client:
+            client.enqueue(message.get("type", ""), encode_message(message, client.subscription.encoding))
+
+    def handle_client_message(self, websocket: WebSocket, text: str):
+        """
+        ข้อความจาก client:
+          {"action": "subscribe", "types": [...], "sources": [...], "lanes": [...],
+           "new_plates_only": true, "encoding": "msgpack"}
+          {"action": "unsubscribe"}  -> กลับไปรับทุก event
+        ข้อความอื่น (เช่น ping) ตอบ pong เหมือนเดิม
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        try:
+            req = json.loads(text)
+        except (ValueError, TypeError):
+            req = None
+        action = req.get("action") if isinstance(req, dict) else None
+
+        if action == "subscribe":
+            client.subscription = Subscription.from_request(req)
+            self.send_to(websocket, {"type": "subscribed", "subscription": client.subscription.describe()})
+        elif action == "unsubscribe":
+            client.subscription = ALL_TOPICS
+            self.send_to(websocket, {"type": "subscribed", "subscription": ALL_TOPICS.describe()})
+        else:
+            self.send_to(websocket, {"type": "pong", "message": "Connected"})
+
+    def publish(self, message: dict):
+        """ส่งให้ client ใน worker นี้ และ publish ลง event bus ให้ worker อื่น"""
+        self.publish_local(message)
+        if self.bus is not None:
+            self.bus.publish(message)
+
+    def publish_local(self, message: dict):
+        """ใส่ข้อความลง outbox ของ worker นี้ (O(1) ไม่ block) พร้อม span ของผู้ส่ง (ถ้ามี trace)"""
+        self._ensure_started()
+        try:
+            self._outbox.put_nowait((message, current_span()))
+        except asyncio.QueueFull:
+            self.outbox_dropped += 1
+
+    async def broadcast(self, message: dict):
+        self.publish(message)
+
+    async def _fanout(self):
+        while True:
+            message, parent = await self._outbox.get()
+            try:
+                with BROADCAST_SECONDS.time(), span("ws.fanout", parent=parent, type=message.get("type", ""),
+                                                   clients=len(self.clients)):
+                    self._deliver(message)
+            except Exception as e:
+                log.error("[WS] ❌ Fan-out error: %s", e)
+
+    def _deliver(self, message: dict):
+        """
+        กรองตาม subscription แล้ว enqueue
+        ตรวจ filter ครั้งเดียวต่อ subscription ที่ต่างกัน และ encode ครั้งเดียวต่อ encoding
+        """
+        msg_type = message.get("type", "")
+        matched: dict[tuple, bool] = {}
+        encoded: dict[str, Union[str, bytes]] = {}
+        for client in list(self.clients.values()):
+            sub = client.subscription
+            ok = matched.get(sub.key)
+            if ok is None:
+                ok = matched[sub.key] = sub.matches(message)
+            if not ok:
+                continue
+            payload = encoded.get(sub.encoding)
+            if payload is None:
+                payload = encoded[sub.encoding] = encode_message(message, sub.encoding)
+            client.enqueue(msg_type, payload)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "outbox_pending": self._outbox.qsize() if self._outbox else 0,
+            "outbox_dropped": self.outbox_dropped,
+            "client_queue_pending": sum(c.pending() for c in self.clients.values()),
+            "client_dropped": sum(c.dropped for c in self.clients.values()),
+            "evicted": self.evicted,
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# arduino/gate_emulator.py
+"""
+Software emulator ของ gate_control_wifi.ino (ไม่ต้องมีบอร์ดจริงหรือ socat)
+โปรโตคอลเหมือน firmware:
+  - ตอน boot: READY + banner
+  - ทุกคำสั่ง echo "CMD: <คำสั่งตัวพิมพ์ใหญ่>"
+  - PING -> PONG, OPEN / OPEN:<plate> -> ACK:OPEN[:plate] (ถ้าไม้ปิดอยู่เท่านั้น),
+    CLOSE -> ACK:CLOSE (ถ้าไม้เปิดอยู่), STATUS -> STATUS:OPEN|ANGLE:90|UPTIME:12s,
+    อื่นๆ -> UNKNOWN: <cmd>
+  - ไม้ปิดเองหลัง HOLD_MS แล้วพิมพ์ ACK:CLOSE
+เพิ่ม: หน่วงคำตอบ (delay + jitter) และทิ้งคำสั่งตาม drop rate เพื่อทดสอบ timeout / heartbeat
+
+ตัวอย่าง:
+    python arduino/gate_emulator.py --socket 127.0.0.1:3333 --delay-ms 20 --jitter-ms 10 --drop-rate 0.01
+        -> SERIAL_URL=socket://127.0.0.1:3333
+    python arduino/gate_emulator.py --pty
+        -> พิมพ์ path ของ pty (เช่น /dev/pts/5) ใช้เป็น SERIAL_PORT
+"""
+import argparse
+import os
+import random
+import select
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+OPEN_ANGLE = 90
+CLOSE_ANGLE = 0
+HOLD_MS = 2000
+BANNER = ("READY", "Thai LPR Gate Control v2.0", "Commands: PING, OPEN, CLOSE, STATUS")
+
+class GateBoard:
+    """state ของบอร์ดหนึ่งตัว (processCommand / openGate / closeGate / printStatus ของ firmware)"""
+
+    def __init__(self, hold_ms: float = HOLD_MS):
+        self.hold_ms = hold_ms
+        self.booted_at = time.monotonic()
+        self.is_open = False
+        self.opened_at = 0.0
+
+    def process(self, cmd: str) -> list[str]:
+        cmd = cmd.strip().upper()
+        out = [f"CMD: {cmd}"]
+        if cmd == "PING":
+            out.append("PONG")
+        elif cmd == "OPEN":
+            out += self.open_gate("")
+        elif cmd == "CLOSE":
+            out += self.close_gate()
+        elif cmd == "STATUS":
+            out.append(self.status())
+        elif cmd.startswith("OPEN:"):
+            out += self.open_gate(cmd[5:])
+        else:
+            out.append(f"UNKNOWN: {cmd}")
+        return out
+
+    def open_gate(self, plate: str) -> list[str]:
+        if self.is_open:
+            return []  # firmware ไม่ตอบ ACK ซ้ำถ้าไม้เปิดอยู่แล้ว
+        self.is_open = True
+        self.opened_at = time.monotonic()
+        return [f"ACK:OPEN:{plate}" if plate else "ACK:OPEN"]
+
+    def close_gate(self) -> list[str]:
+        if not self.is_open:
+            return []
+        self.is_open = False
+        return ["ACK:CLOSE"]
+
+    def status(self) -> str:
+        uptime = int(time.monotonic() - self.booted_at)
+        angle = OPEN_ANGLE if self.is_open else CLOSE_ANGLE
+        return f"STATUS:{'OPEN' if self.is_open else 'CLOSED'}|ANGLE:{angle}|UPTIME:{uptime}s"
+
+    def tick(self) -> list[str]:
+        """auto-close หลัง HOLD_MS (loop() ของ firmware)"""
+        if self.is_open and (time.monotonic() - self.opened_at) * 1000 >= self.hold_ms:
+            return self.close_gate()
+        return []
+
+    def seconds_to_close(self) -> Optional[float]:
+        if not self.is_open:
+            return None
+        return max(0.0, self.hold_ms / 1000 - (time.monotonic() - self.opened_at))
+
+class GateEmulator:
+    """
+    serve GateBoard บน socket (ทุก connection = บอร์ดที่เพิ่ง boot) หรือ pty
+    delay_ms + uniform(0, jitter_ms) ก่อนตอบแต่ละคำสั่ง (ประมวลผลทีละคำสั่งเหมือน firmware)
+    drop_rate = โอกาสที่คำสั่งหายไปเลย (ไม่มีแม้แต่ CMD: echo)
+    """
+
+    def __init__(self, delay_ms: float = 0.0, jitter_ms: float = 0.0, drop_rate: float = 0.0,
+                 hold_ms: float = HOLD_MS, seed: Optional[int] = None, verbose: bool = False):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.hold_ms = hold_ms
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server: Optional[socket.socket] = None
+        self._pty_fds: list[int] = []
+        self.commands = 0
+        self.dropped = 0
+        self.connections = 0
+
+    # ---------- serving ----------
+
+    def serve_socket(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """เปิด TCP server ใน background thread คืน URL socket://host:port"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept_loop, name="gate-emulator-accept", daemon=True).start()
+        host, port = server.getsockname()[:2]
+        return f"socket://{host}:{port}"
+
+    def serve_pty(self) -> str:
+        """เปิด pseudo-terminal คืน path ของฝั่ง slave (ใช้เป็น SERIAL_PORT)"""
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._pty_fds += [master, slave]
+        path = os.ttyname(slave)
+        threading.Thread(
+            target=self._serve, args=(master, lambda data: os.write(master, data)),
+            name="gate-emulator-pty", daemon=True,
+        ).start()
+        return path
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            try:
+                self._server.close()
+            except OSError:
+                pass
+        for fd in self._pty_fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._pty_fds = []
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections += 1
+            threading.Thread(
+                target=self._serve_conn, args=(conn,), name="gate-emulator-conn", daemon=True,
+            ).start()
+
+    def _serve_conn(self, conn: socket.socket):
+        try:
+            self._serve(conn.fileno(), conn.sendall)
+        finally:
+            conn.close()
+
+    def _serve(self, fd: int, write: Callable[[bytes], None]):
+        board = GateBoard(self.hold_ms)
+        buf = bytearray()
+
+        def send(lines):
+            if lines:
+                if self.verbose:
+                    for line in lines:
+                        print(f"[EMU] -> {line}", flush=True)
+                write("".join(f"{line}\r\n" for line in lines).encode())
+
+        try:
+            send(list(BANNER))
+            while not self._stop.is_set():
+                send(board.tick())
+                wait = board.seconds_to_close()
+                ready, _, _ = select.select([fd], [], [], 0.5 if wait is None else min(wait, 0.5))
+                if not ready:
+                    continue
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    return  # ปิด connection
+                buf += chunk
+                while True:
+                    # firmware ตัดคำสั่งที่ \n หรือ \r
+                    ends = [i for i in (buf.find(b"\n"), buf.find(b"\r")) if i >= 0]
+                    if not ends:
+                        break
+                    end = min(ends)
+                    line = bytes(buf[:end]).decode("utf-8", errors="ignore")
+                    del buf[:end + 1]
+                    if line.strip():
+                        send(self._handle(board, line))
+        except OSError:
+            return
+
+    def _handle(self, board: GateBoard, line: str) -> list[str]:
+        self.commands += 1
+        with self._random_lock:
+            drop = self.drop_rate > 0 and self._random.random() < self.drop_rate
+            delay = self.delay_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0)
+        if self.verbose:
+            print(f"[EMU] <- {line.strip()}" + (" (dropped)" if drop else ""), flush=True)
+        if drop:
+            self.dropped += 1
+            return []
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return board.tick() + board.process(line)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    where = ap.add_mutually_exclusive_group()
+    where.add_argument("--socket", default="127.0.0.1:3333", help="host:port ของ TCP server")
+    where.add_argument("--pty", action="store_true", help="ใช้ pseudo-terminal แทน TCP")
+    ap.add_argument("--delay-ms", type=float, default=0.0, help="หน่วงก่อนตอบทุกคำสั่ง")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="หน่วงเพิ่มแบบสุ่ม 0..jitter")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="โอกาสที่คำสั่งหาย (0..1)")
+    ap.add_argument("--hold-ms", type=float, default=HOLD_MS, help="ไม้ปิดเองหลังกี่ ms")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--quiet", action="store_true", help="ไม่พิมพ์ทุกบรรทัดที่รับ/ส่ง")
+    args = ap.parse_args()
+
+    emulator = GateEmulator(args.delay_ms, args.jitter_ms, args.drop_rate, args.hold_ms,
+                            seed=args.seed, verbose=not args.quiet)
+    if args.pty:
+        print(f"[EMU] Gate emulator on pty {emulator.serve_pty()} (SERIAL_PORT)", flush=True)
+    else:
+        host, _, port = args.socket.rpartition(":")
+        print(f"[EMU] Gate emulator on {emulator.serve_socket(host or '127.0.0.1', int(port))} (SERIAL_URL)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.close()
+
+if __name__ == "__main__":
+    main()
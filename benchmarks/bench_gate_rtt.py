@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: round-trip latency ของ gate path (OPEN -> ACK:OPEN) ภายใต้ load พร้อมกัน
+
+ยิงคำสั่ง OPEN ผ่าน submit_open_gate (ทางเดียวกับ send_open_gate / fast path ของ /detect)
+จาก thread หลายตัวพร้อมกัน แล้ววัดต่อคำสั่ง:
+  - enqueue_ms: เวลาที่ผู้เรียกเสียไปกับการส่งเข้าคิว
+  - rtt_ms:     ตั้งแต่เรียกจนได้ ACK (รวมเวลารอคิวใน gate controller)
+  - wire_ms:    ตั้งแต่เขียนลง serial จนได้ ACK
+ไม่ระบุ --device จะเปิด emulator (arduino/gate_emulator.py) ใน process เดียวกันให้เอง
+ค่า default --hold-ms 0 ให้ไม้ปิดทันทีหลัง ACK (firmware ไม่ ACK OPEN ซ้ำระหว่างที่ไม้ยังเปิดอยู่)
+
+ตัวอย่าง:
+    python benchmarks/bench_gate_rtt.py --concurrency 1,4,16 --commands 200 \
+        --delay-ms 5 --jitter-ms 5 --drop-rate 0.01 --out bench_gate.json
+    python benchmarks/bench_gate_rtt.py --device socket://127.0.0.1:3333
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "arduino"))
+sys.path.insert(0, ROOT)
+from common import summarize_ms, write_json  # noqa: E402
+from gate_emulator import GateEmulator  # noqa: E402
+
+def run_level(arduino, concurrency: int, commands: int) -> dict:
+    enqueue, rtt, wire = [], [], []
+    counts = {"acked": 0, "no_ack": 0, "errors": 0}
+    lock = threading.Lock()
+    remaining = iter(range(commands))
+
+    def worker(n: int):
+        while True:
+            with lock:
+                i = next(remaining, None)
+            if i is None:
+                return
+            t0 = time.monotonic()
+            command = arduino.submit_open_gate(f"B{n}-{i}")
+            t1 = time.monotonic()
+            acked_at = []
+            command.future.add_done_callback(lambda f: acked_at.append(time.monotonic()))
+            try:
+                response = command.future.result(timeout=60)
+            except Exception:
+                response = None
+            with lock:
+                enqueue.append(t1 - t0)
+                if response is None:
+                    counts["errors"] += 1
+                elif not response.startswith("ACK:OPEN"):
+                    counts["no_ack"] += 1
+                else:
+                    counts["acked"] += 1
+                    rtt.append(acked_at[0] - t0)
+                    wire.append(acked_at[0] - command.sent_at)
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "commands": commands,
+        **counts,
+        "acks_per_sec": round(counts["acked"] / elapsed, 2) if elapsed else None,
+        "enqueue": summarize_ms(enqueue),
+        "rtt": summarize_ms(rtt),
+        "wire": summarize_ms(wire),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--device", help="serial path / socket:// ของบอร์ดหรือ emulator ที่รันอยู่แล้ว (ไม่ระบุ = เปิด emulator เอง)")
+    ap.add_argument("--concurrency", default="1,4,16", help="จำนวน thread ที่ยิงพร้อมกัน (คั่นด้วย ,)")
+    ap.add_argument("--commands", type=int, default=200, help="จำนวนคำสั่ง OPEN ต่อระดับ concurrency")
+    ap.add_argument("--delay-ms", type=float, default=2.0, help="emulator: หน่วงก่อนตอบ")
+    ap.add_argument("--jitter-ms", type=float, default=2.0, help="emulator: หน่วงเพิ่มแบบสุ่ม")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="emulator: โอกาสที่คำสั่งหาย")
+    ap.add_argument("--hold-ms", type=float, default=0.0, help="emulator: ไม้ปิดเองหลังกี่ ms")
+    ap.add_argument("--ack-timeout", type=float, default=1.0, help="GATE_ACK_TIMEOUT_SEC ระหว่าง benchmark")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--verbose", action="store_true", help="แสดง log ของ gate controller")
+    ap.add_argument("--out", help="บันทึกผล JSON")
+    args = ap.parse_args()
+
+    emulator = None
+    device = args.device
+    if not device:
+        emulator = GateEmulator(args.delay_ms, args.jitter_ms, args.drop_rate, args.hold_ms, seed=args.seed)
+        device = emulator.serve_socket()
+
+    # ตั้งก่อน import api.arduino (อ่าน env ตอน import)
+    os.environ["SERIAL_ENABLED"] = "true"
+    os.environ["SERIAL_URL"] = device
+    os.environ["GATE_ACK_TIMEOUT_SEC"] = str(args.ack_timeout)
+    os.environ["GATE_HEARTBEAT_SEC"] = "0"
+    os.environ.setdefault("GATE_QUEUE_MAX", str(max(64, max(int(c) for c in args.concurrency.split(",")) * 2)))
+    from api import arduino
+
+    if not args.verbose:
+        # handler ของ api/logger.py ผูกกับ sys.stdout ตัวจริงตั้งแต่ import -> ปิดที่ระดับ logger แทน
+        for name in ("lpr.gate", "lpr.arduino"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    levels = []
+    arduino.gate_controller.start(keepalive=True)
+    arduino.gate_controller.request_sync("PING")  # ต่อ link + รอ reset ก่อนจับเวลา
+    for c in args.concurrency.split(","):
+        levels.append(run_level(arduino, int(c), args.commands))
+    link = arduino.gate_controller.stats()
+    arduino.gate_controller.close()
+    if emulator is not None:
+        emulator.close()
+
+    write_json({
+        "device": device,
+        "emulator": {
+            "delay_ms": args.delay_ms, "jitter_ms": args.jitter_ms,
+            "drop_rate": args.drop_rate, "hold_ms": args.hold_ms,
+            "commands": emulator.commands, "dropped": emulator.dropped,
+        } if emulator is not None else None,
+        "ack_timeout_sec": args.ack_timeout,
+        "levels": levels,
+        "link": link,
+    }, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Load test แบบ end-to-end: ยิง /detect ตาม rate ที่กำหนด พร้อม subscriber /ws ค้างไว้ N ตัว
+
+ยิงภาพจากโฟลเดอร์ (--images) หรือ frame จากวิดีโอ (--video) แบบ open-loop ตามตาราง (--rates ครั้ง/วินาที)
+โดยมี request ค้างได้ไม่เกิน --concurrency ตัว (เกินนั้นรอคิวฝั่ง client และนับรวมใน latency)
+ต่อระดับ rate วัด:
+  - latency:      ตั้งแต่เวลาที่ควรส่งตามตารางจนได้ response (รวมเวลารอคิวฝั่ง client)
+  - service:      เวลาของ HTTP request จริง
+  - event:        ตั้งแต่ควรส่งจน subscriber ได้ event "detection" ของ record นั้น (จับคู่ด้วย id)
+  - event_lag:    event มาถึงช้ากว่า response เท่าไร (ติดลบ = มาก่อน response นับเป็น 0)
+  - error rate แยกตาม status (429 / 503 = admission control ปฏิเสธ, 0 = ต่อไม่ได้) และ event ที่ไม่มาถึง
+ผลรวมเป็น curve ของ throughput ที่ทำได้เทียบกับ p50 / p95 / p99 ใช้เลือก RECOGNITION_WORKERS / pool size
+
+ไม่ระบุ --url จะเปิด server เอง (uvicorn) กับ SQLite ชั่วคราว และ gate emulator (arduino/gate_emulator.py)
+ส่งค่า env ให้ server ได้ด้วย --env (เช่น --env RECOGNITION_WORKERS=2 --env DB_POOL_SIZE=10)
+
+ตัวอย่าง:
+    python benchmarks/bench_load.py --images samples/plates --rates 1,2,4,8 --concurrency 16 \
+        --subscribers 20 --duration 20 --out bench_load.json
+    python benchmarks/bench_load.py --video samples/gate.mp4 --stride 5 --rates 2,5 --env RECOGNITION_WORKERS=2
+    python benchmarks/bench_load.py --url http://localhost:8000 --images samples/plates --rates 1,2
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "arduino"))
+from common import WebSocketClient, get, post_file, summarize_ms, write_json  # noqa: E402
+from gate_emulator import GateEmulator  # noqa: E402
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# ---------- input ----------
+
+def load_images(path: str) -> list[tuple[str, bytes]]:
+    files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTS))
+    images = []
+    for name in files:
+        with open(os.path.join(path, name), "rb") as f:
+            images.append((name, f.read()))
+    return images
+
+def load_video_frames(path: str, stride: int, limit: int) -> list[tuple[str, bytes]]:
+    """ดึงทุก stride frame แล้ว encode เป็น JPEG (ต้องมี opencv)"""
+    import cv2
+    cap = cv2.VideoCapture(path)
+    frames, i = [], 0
+    while len(frames) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if i % stride == 0:
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if ok:
+                frames.append((f"frame_{i}.jpg", buf.tobytes()))
+        i += 1
+    cap.release()
+    return frames
+
+# ---------- local server ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args) -> tuple[str, subprocess.Popen, GateEmulator, str]:
+    """uvicorn + SQLite ชั่วคราว + gate emulator คืน (url, process, emulator, log path)"""
+    work = tempfile.mkdtemp(prefix="bench_load_")
+    emulator = GateEmulator(args.gate_delay_ms, args.gate_jitter_ms, 0.0, hold_ms=0.0, seed=1)
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{work}/load.db",
+        "SERIAL_ENABLED": "true",
+        "SERIAL_URL": emulator.serve_socket(),
+        "PLATE_IMAGE_DIR": os.path.join(work, "plates"),
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log_path = os.path.join(work, "server.log")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=open(log_path, "wb"), stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server exited ({proc.returncode}), see {log_path}")
+        if get(f"{url}/health", timeout=2)[0] == 200:
+            return url, proc, emulator, log_path
+        time.sleep(0.5)
+    proc.terminate()
+    sys.exit(f"server did not become healthy in {args.startup_timeout}s, see {log_path}")
+
+# ---------- /ws subscribers ----------
+
+class Subscribers:
+    """subscriber N ตัว เก็บเวลาที่ได้ event detection ต่อ record id"""
+
+    def __init__(self, url: str, n: int):
+        ws_url = url.replace("http://", "ws://").replace("https://", "wss://") + "/ws"
+        self.clients = [WebSocketClient(ws_url) for _ in range(n)]
+        self.lock = threading.Lock()
+        self.arrivals: dict[int, list[float]] = {}
+        self.disconnects = 0
+        for i, client in enumerate(self.clients):
+            client.send(json.dumps({"action": "subscribe", "types": ["detection"]}))
+            threading.Thread(target=self._read, args=(client,), name=f"ws-sub-{i}", daemon=True).start()
+
+    def _read(self, client: WebSocketClient):
+        while True:
+            text = client.recv()
+            if text is None:
+                with self.lock:
+                    self.disconnects += 1
+                return
+            now = time.perf_counter()
+            try:
+                msg = json.loads(text)
+            except ValueError:
+                continue
+            if msg.get("type") == "detection" and msg.get("id") is not None:
+                with self.lock:
+                    self.arrivals.setdefault(int(msg["id"]), []).append(now)
+
+    def take(self, record_id: int) -> list[float]:
+        with self.lock:
+            return self.arrivals.pop(record_id, [])
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+# ---------- one rate level ----------
+
+def run_level(args, url: str, images: list, subs: Subscribers, rate: float) -> dict:
+    jobs: queue.Queue = queue.Queue()
+    lock = threading.Lock()
+    done = []  # (scheduled, sent, received, status, record_id)
+    headers = {"X-Latency-Budget-Ms": str(args.budget_ms)} if args.budget_ms else None
+    fields = {"priority": args.priority} if args.priority else None
+
+    def worker():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            scheduled, (name, content) = job
+            sent = time.perf_counter()
+            status, body, _ = post_file(f"{url}/detect", "file", name, content,
+                                        headers=headers, fields=fields, timeout=args.timeout)
+            received = time.perf_counter()
+            record_id = None
+            if status == 200:
+                try:
+                    record_id = json.loads(body).get("id")
+                except ValueError:
+                    pass
+            with lock:
+                done.append((scheduled, sent, received, status, record_id))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        scheduled = start + sent * interval
+        if scheduled - start >= args.duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put((scheduled, images[sent % len(images)]))
+        sent += 1
+    for _ in threads:
+        jobs.put(None)
+    for t in threads:
+        t.join(timeout=args.timeout + 5)
+    elapsed = max(args.duration, time.perf_counter() - start)
+    time.sleep(args.drain)  # รอ event ที่ยังค้างในคิวของ /ws
+
+    latency, service, event, event_lag = [], [], [], []
+    statuses: dict[str, int] = {}
+    expected_events = delivered = 0
+    with lock:
+        results = list(done)
+    for scheduled, t_sent, received, status, record_id in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status != 200:
+            continue
+        latency.append(received - scheduled)
+        service.append(received - t_sent)
+        if record_id is None or not subs.clients:
+            continue
+        expected_events += len(subs.clients)
+        arrivals = subs.take(int(record_id))
+        delivered += len(arrivals)
+        event += [t - scheduled for t in arrivals]
+        event_lag += [max(0.0, t - received) for t in arrivals]
+
+    ok = statuses.get("200", 0)
+    completed = len(results)
+    return {
+        "rate": rate,
+        "sent": sent,
+        "completed": completed,
+        "ok": ok,
+        "achieved_rps": round(ok / elapsed, 2) if elapsed else None,
+        "error_rate": round(1 - ok / completed, 4) if completed else None,
+        "statuses": statuses,
+        "unfinished": sent - completed,
+        "latency": summarize_ms(latency),
+        "service": summarize_ms(service),
+        "events": {
+            "expected": expected_events,
+            "delivered": delivered,
+            "missed_rate": round(1 - delivered / expected_events, 4) if expected_events else None,
+            "event": summarize_ms(event),
+            "event_lag": summarize_ms(event_lag),
+        },
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="server ที่รันอยู่แล้ว (ไม่ระบุ = เปิด uvicorn + SQLite + gate emulator เอง)")
+    ap.add_argument("--images", help="โฟลเดอร์ภาพที่ใช้ยิง")
+    ap.add_argument("--video", help="วิดีโอที่ใช้ดึง frame มายิง")
+    ap.add_argument("--stride", type=int, default=5, help="--video: ใช้ทุกกี่ frame")
+    ap.add_argument("--max-frames", type=int, default=200, help="--video: จำนวน frame สูงสุด")
+    ap.add_argument("--rates", default="1,2,4", help="request ต่อวินาทีแต่ละระดับ (คั่นด้วย ,)")
+    ap.add_argument("--concurrency", type=int, default=16, help="request ค้างพร้อมกันได้สูงสุด")
+    ap.add_argument("--subscribers", type=int, default=10, help="จำนวน client /ws ที่เปิดค้างไว้")
+    ap.add_argument("--duration", type=float, default=15, help="วินาทีต่อระดับ rate")
+    ap.add_argument("--drain", type=float, default=1.0, help="รอ event ที่ค้างหลังจบแต่ละระดับ (วินาที)")
+    ap.add_argument("--timeout", type=float, default=60, help="timeout ของแต่ละ request")
+    ap.add_argument("--priority", help="ส่ง priority (gate / upload / batch) ไปกับ /detect")
+    ap.add_argument("--budget-ms", type=float, help="ส่ง X-Latency-Budget-Ms ไปกับ /detect")
+    ap.add_argument("--env", action="append", default=[], help="KEY=VALUE ให้ server ที่เปิดเอง (ใส่ซ้ำได้)")
+    ap.add_argument("--gate-delay-ms", type=float, default=5.0, help="gate emulator: หน่วงก่อนตอบ")
+    ap.add_argument("--gate-jitter-ms", type=float, default=5.0, help="gate emulator: หน่วงเพิ่มแบบสุ่ม")
+    ap.add_argument("--startup-timeout", type=float, default=120, help="รอ server (รวมโหลดโมเดล) กี่วินาที")
+    ap.add_argument("--out", help="บันทึกผล JSON")
+    args = ap.parse_args()
+
+    if args.images:
+        images = load_images(args.images)
+    elif args.video:
+        images = load_video_frames(args.video, args.stride, args.max_frames)
+    else:
+        sys.exit("--images or --video is required")
+    if not images:
+        sys.exit("no input images")
+
+    proc = emulator = log_path = None
+    url = args.url
+    if not url:
+        url, proc, emulator, log_path = start_server(args)
+    subs = None
+    try:
+        # warm-up: โหลดโมเดล / JIT ก่อนเริ่มจับเวลา
+        post_file(f"{url}/detect", "file", images[0][0], images[0][1], timeout=args.timeout)
+        subs = Subscribers(url, args.subscribers)
+        levels = [run_level(args, url, images, subs, float(r)) for r in args.rates.split(",")]
+        disconnects = subs.disconnects
+        ws_stats = get(f"{url}/api/ws/stats")[1]
+        admission = get(f"{url}/api/admission")[1]
+    finally:
+        if subs is not None:
+            subs.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if emulator is not None:
+            emulator.close()
+
+    def _json(raw: bytes):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    write_json({
+        "url": args.url or "local (SQLite + gate emulator)",
+        "server_env": args.env,
+        "server_log": log_path,
+        "inputs": len(images),
+        "concurrency": args.concurrency,
+        "subscribers": args.subscribers,
+        "duration_sec": args.duration,
+        "subscriber_disconnects": disconnects,
+        "curve": [
+            {"rate": lv["rate"], "achieved_rps": lv["achieved_rps"], "error_rate": lv["error_rate"],
+             "p50_ms": lv["latency"]["p50_ms"], "p95_ms": lv["latency"]["p95_ms"],
+             "p99_ms": lv["latency"]["p99_ms"], "event_p95_ms": lv["events"]["event"]["p95_ms"]}
+            for lv in levels
+        ],
+        "levels": levels,
+        "ws_stats": _json(ws_stats),
+        "admission": _json(admission),
+    }, args.out)
+
+if __name__ == "__main__":
+    main()
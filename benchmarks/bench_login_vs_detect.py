@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: login throughput เทียบกับ latency ของ /detect ภายใต้ load พร้อมกัน
+
+วัด 2 ช่วง:
+  1) baseline - ยิง /detect ต่อเนื่องอย่างเดียว
+  2) under_login_load - ยิง /detect แบบเดิม พร้อมกับ thread หลายตัวยิง /api/auth/login
+ถ้า PBKDF2 ยังรันบน event loop จะเห็น p95/p99 ของ /detect พุ่งขึ้นชัดเจนในช่วงที่ 2
+
+ตัวอย่าง:
+    python benchmarks/bench_login_vs_detect.py --url http://localhost:8000 \
+        --image sample.jpg --login-concurrency 16 --duration 20 --out bench_login.json
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import post_file, post_form, summarize_ms, write_json  # noqa: E402
+
+def _detect_loop(url: str, image: bytes, concurrency: int, stop: threading.Event) -> dict:
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal errors
+        while not stop.is_set():
+            status, _, elapsed = post_file(f"{url}/detect", "file", "bench.jpg", image)
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    return {"threads": threads, "latencies": latencies, "errors": lambda: errors}
+
+def _login_loop(url: str, username: str, password: str, concurrency: int, stop: threading.Event) -> dict:
+    counts = {"ok": 0, "busy": 0, "error": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            status, _, elapsed = post_form(f"{url}/api/auth/login", {"username": username, "password": password})
+            with lock:
+                if status == 200:
+                    counts["ok"] += 1
+                    latencies.append(elapsed)
+                elif status in (429, 503):
+                    counts["busy"] += 1
+                else:
+                    counts["error"] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    return {"threads": threads, "counts": counts, "latencies": latencies}
+
+def run_phase(args, image: bytes, with_logins: bool) -> dict:
+    stop = threading.Event()
+    detect = _detect_loop(args.url, image, args.detect_concurrency, stop)
+    login = _login_loop(args.url, args.username, args.password, args.login_concurrency, stop) if with_logins else None
+    start = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for t in detect["threads"] + (login["threads"] if login else []):
+        t.join(timeout=120)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "detect": {**summarize_ms(detect["latencies"]), "errors": detect["errors"]()},
+    }
+    if login:
+        result["login"] = {
+            **summarize_ms(login["latencies"]),
+            **login["counts"],
+            "logins_per_sec": round(login["counts"]["ok"] / elapsed, 2),
+        }
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--image", required=True, help="JPEG ที่ใช้ยิง /detect")
+    ap.add_argument("--username", default="bench_user")
+    ap.add_argument("--password", default="bench_pass123")
+    ap.add_argument("--duration", type=float, default=15, help="วินาทีต่อช่วง")
+    ap.add_argument("--detect-concurrency", type=int, default=1)
+    ap.add_argument("--login-concurrency", type=int, default=16)
+    ap.add_argument("--out", help="บันทึกผล JSON")
+    args = ap.parse_args()
+
+    with open(args.image, "rb") as f:
+        image = f.read()
+
+    # สร้าง user สำหรับ benchmark (ถ้ามีอยู่แล้วจะได้ 400 ซึ่งไม่เป็นไร)
+    post_form(f"{args.url}/api/auth/register", {
+        "username": args.username, "email": f"{args.username}@bench.local",
+        "password": args.password, "confirm_password": args.password,
+    })
+
+    result = {
+        "url": args.url,
+        "duration_sec": args.duration,
+        "detect_concurrency": args.detect_concurrency,
+        "login_concurrency": args.login_concurrency,
+        "baseline": run_phase(args, image, with_logins=False),
+        "under_login_load": run_phase(args, image, with_logins=True),
+    }
+    write_json(result, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark ของ pipeline อ่านป้ายทีละ stage (ไม่ผ่าน HTTP / DB / serial)
+
+รันฟังก์ชันเดียวกับ /detect (api/recognition.py) บนโฟลเดอร์ภาพ แล้วสรุปต่อ stage เป็น p50/p95/p99:
+  decode        decode_for_detection (decode แบบย่อขนาด + resize ในขั้นเดียวแบบที่ /detect ทำ)
+  resize        resize_to_width ของภาพที่ decode เต็มขนาด (ทางของ MJPEG / วิดีโอ)
+  detector, crop, reader, reader_decode (beam) / reader_greedy (top-1), segmentation, ocr, parse
+  crop_write    encode_plate_image (ภาพ + thumbnail) แล้วเขียนลงโฟลเดอร์ชั่วคราว
+stage ที่ไม่ได้รันกับภาพนั้น (เช่น fallback) จะไม่นับ sample พร้อมอัตรา fallback / beam vs greedy
+ถ้ามี --labels (CSV: filename,plate[,province] หรือ JSON: {"filename": "plate"} / {"filename": {"plate":..,"province":..}})
+จะคิด exact-match accuracy (เทียบหลังตัดช่องว่างและ "-")
+
+ใช้เป็น regression gate: --compare baseline.json แล้ว exit 1 ถ้า p95 ของ stage ไหนช้ากว่า baseline
+เกิน --tolerance หรือ accuracy ต่ำลง
+
+ตัวอย่าง:
+    python benchmarks/bench_pipeline.py --images samples/plates --labels samples/labels.csv --out bench_pipeline.json
+    python benchmarks/bench_pipeline.py --images samples/plates --labels samples/labels.csv --compare bench_pipeline.json --tolerance 0.2
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common import summarize_ms, write_json  # noqa: E402
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from api.cascade import Cascade  # noqa: E402
+from api.image_decode import decode_for_detection, resize_to_width  # noqa: E402
+from api.image_store import encode_plate_image  # noqa: E402
+from api.recognition import recognize_plate  # noqa: E402
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+def load_labels(path: str) -> dict:
+    """filename -> (plate, province)"""
+    labels = {}
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            for name, value in json.load(f).items():
+                if isinstance(value, dict):
+                    labels[name] = (value.get("plate", ""), value.get("province", ""))
+                else:
+                    labels[name] = (str(value), "")
+        return labels
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().lower() in ("", "filename") or row[0].startswith("#"):
+                continue
+            labels[row[0].strip()] = (row[1].strip() if len(row) > 1 else "",
+                                      row[2].strip() if len(row) > 2 else "")
+    return labels
+
+def _norm(s: str) -> str:
+    return "".join(ch for ch in (s or "") if ch not in " -")
+
+def run_image(buf: np.ndarray, out_dir: str) -> tuple[dict, dict]:
+    """อ่านป้ายหนึ่งภาพ -> (เวลาแต่ละ stage เป็นวินาที, ผลลัพธ์)"""
+    times = {}
+    cascade = Cascade(None)
+    start = time.perf_counter()
+    dec = decode_for_detection(buf)
+    times["decode"] = time.perf_counter() - start
+    if dec is None:
+        return times, None
+
+    full = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    start = time.perf_counter()
+    resize_to_width(full)
+    times["resize"] = time.perf_counter() - start
+    del full
+
+    result = recognize_plate(dec, cascade)
+    for name, ms in cascade.stages.items():
+        times[name] = ms / 1000
+
+    if result["used_crop"]:
+        start = time.perf_counter()
+        img_bytes, thumb_bytes = encode_plate_image(result["img_for_ocr"])
+        with open(os.path.join(out_dir, "plate.jpg"), "wb") as f:
+            f.write(img_bytes)
+        with open(os.path.join(out_dir, "plate_thumb.jpg"), "wb") as f:
+            f.write(thumb_bytes)
+        times["crop_write"] = time.perf_counter() - start
+    return times, result
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """รายการ regression เทียบกับ baseline (ว่าง = ผ่าน)"""
+    failures = []
+    for name, stats in baseline.get("stages", {}).items():
+        base_p95 = stats.get("p95_ms")
+        cur_p95 = current["stages"].get(name, {}).get("p95_ms")
+        if base_p95 and cur_p95 is not None and cur_p95 > base_p95 * (1 + tolerance):
+            failures.append(f"{name}: p95 {cur_p95:.1f} ms > baseline {base_p95:.1f} ms (+{tolerance:.0%})")
+    base_acc = (baseline.get("accuracy") or {}).get("exact_match")
+    cur_acc = (current.get("accuracy") or {}).get("exact_match")
+    if base_acc is not None and cur_acc is not None and cur_acc < base_acc:
+        failures.append(f"accuracy: {cur_acc:.3f} < baseline {base_acc:.3f}")
+    return failures
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", required=True, help="โฟลเดอร์ภาพ")
+    ap.add_argument("--labels", help="ไฟล์ label (CSV หรือ JSON)")
+    ap.add_argument("--warmup", type=int, default=2, help="จำนวนภาพที่รันก่อนเริ่มจับเวลา (โหลดโมเดล / cache)")
+    ap.add_argument("--repeat", type=int, default=1, help="รันทั้งโฟลเดอร์กี่รอบ")
+    ap.add_argument("--compare", help="ไฟล์ผลเดิม (JSON) ที่ใช้เป็น baseline")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="p95 ช้ากว่า baseline ได้ไม่เกินสัดส่วนนี้")
+    ap.add_argument("--out", help="บันทึกผล JSON")
+    args = ap.parse_args()
+
+    files = sorted(f for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTS))
+    if not files:
+        sys.exit(f"no images in {args.images}")
+    labels = load_labels(args.labels) if args.labels else {}
+    buffers = {}
+    for name in files:
+        with open(os.path.join(args.images, name), "rb") as f:
+            buffers[name] = np.frombuffer(f.read(), dtype=np.uint8)
+
+    out_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    for name in files[:args.warmup]:
+        run_image(buffers[name], out_dir)
+
+    samples: dict[str, list] = {}
+    counts = {"runs": 0, "unreadable": 0, "segmentation": 0, "ocr": 0,
+              "beam": 0, "greedy": 0, "no_reader": 0, "no_detection": 0, "empty_text": 0}
+    correct = labelled = 0
+    mismatches = []
+    for rep in range(args.repeat):
+        for name in files:
+            times, result = run_image(buffers[name], out_dir)
+            counts["runs"] += 1
+            for stage, sec in times.items():
+                samples.setdefault(stage, []).append(sec)
+            if result is None:
+                counts["unreadable"] += 1
+                continue
+            counts[result["reader_method"] or "no_reader"] += 1
+            counts["segmentation"] += "segmentation" in times
+            counts["ocr"] += "ocr" in times
+            counts["no_detection"] += not result["used_crop"]
+            counts["empty_text"] += not result["plate_text"]
+            if name in labels:
+                labelled += 1
+                plate, province = labels[name]
+                ok = _norm(result["plate_text"]) == _norm(plate) and (
+                    not province or result["province_text"] == province)
+                correct += ok
+                if not ok and rep == 0 and len(mismatches) < 50:
+                    mismatches.append({"file": name, "expected": f"{plate} {province}".strip(),
+                                       "got": f"{result['plate_text']} {result['province_text']}".strip()})
+
+    runs = max(1, counts["runs"])
+    result = {
+        "images": len(files),
+        "repeat": args.repeat,
+        "stages": {name: summarize_ms(s) for name, s in samples.items()},
+        "rates": {
+            "segmentation_fallback": round(counts["segmentation"] / runs, 4),
+            "ocr_fallback": round(counts["ocr"] / runs, 4),
+            "reader_beam": round(counts["beam"] / runs, 4),
+            "reader_greedy": round(counts["greedy"] / runs, 4),
+            "no_detection": round(counts["no_detection"] / runs, 4),
+            "empty_text": round(counts["empty_text"] / runs, 4),
+            "unreadable": round(counts["unreadable"] / runs, 4),
+        },
+        "accuracy": {
+            "labelled": labelled,
+            "exact_match": round(correct / labelled, 4) if labelled else None,
+            "mismatches": mismatches,
+        } if labels else None,
+    }
+
+    failures = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            failures = compare(result, json.load(f), args.tolerance)
+        result["regressions"] = failures
+    write_json(result, args.out)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: parse_plate / score_plate บน corpus ของสตริง OCR
+
+เทียบกับ implementation เดิม (regex ทุกครั้ง, extract_province ซ้ำ 2 รอบ, compile pattern ต่อ candidate)
+ที่คัดลอกไว้ในไฟล์นี้เป็น baseline และนับว่าผลต่างกันกี่สตริง
+(ต่างกันได้เฉพาะรหัสหลายตัวอักษรอย่าง "หนอ", "สิง", "ระยอง", "กระบี่" ที่ของเดิมจับไม่ได้)
+
+corpus: ไฟล์ข้อความบรรทัดละหนึ่งสตริง (--corpus) หรือสุ่มสร้างจากรหัสจังหวัด + เลข + noise แบบ OCR
+
+ตัวอย่าง:
+    python benchmarks/bench_plate_parser.py --size 200000 --out bench_parser.json
+    python benchmarks/bench_plate_parser.py --corpus ocr_strings.txt
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common import write_json  # noqa: E402
+from api.province_parser import THAI_PROVINCES, PLATE_CHARS, parse_plate, score_plate  # noqa: E402
+
+# ---------- baseline: implementation ก่อนใช้ trie / grammar ที่ compile ไว้ ----------
+
+def _legacy_extract(text: str) -> tuple[str, str]:
+    if not text or len(text) < 2:
+        return text, ""
+    text = text.strip()
+    match = re.match(r'^([ก-ฮ]{1,2})\s*(.+)$', text)
+    if match:
+        if match.group(1) in THAI_PROVINCES:
+            return match.group(2).strip(), match.group(1)
+        return text, ""
+    match = re.search(r'([ก-ฮ]{1,2})', text)
+    if match and match.group(1) in THAI_PROVINCES:
+        return text.replace(match.group(1), '').strip(), match.group(1)
+    return text, ""
+
+def _legacy_parse(text: str) -> dict:
+    plate_number, province_code = _legacy_extract(text)
+    formatted = text
+    if text:
+        number2, code2 = _legacy_extract(text)
+        if code2:
+            formatted = f"{code2} {number2}".strip()
+    return {
+        "plate_number": plate_number,
+        "province_code": province_code,
+        "province_name": THAI_PROVINCES.get(province_code, province_code) if province_code else "",
+        "full_text": text,
+        "formatted_text": formatted,
+    }
+
+def _legacy_score(s: str) -> int:
+    s0 = s
+    s = s.replace("|", "").replace("/", "").replace("-", "").strip()
+    score = 0
+    m1 = re.compile(r'^([ก-ฮ]{2})\s*([0-9]{3,4})$').match(s)
+    if m1:
+        return 100 + len(m1.group(2)) * 10
+    m2 = re.compile(r'^([0-9]{1})([ก-ฮ]{2})\s*([0-9]{4,5})$').match(s)
+    if m2:
+        return 95 + len(m2.group(3)) * 8
+    m3 = re.compile(r'([ก-ฮ]{1,2})\s*([0-9]+)').search(s)
+    if m3:
+        score += 50 + len(m3.group(2)) * 5 + len(m3.group(1)) * 3
+    score += len([ch for ch in s0 if ch in PLATE_CHARS])
+    score -= len([ch for ch in s0 if ch not in PLATE_CHARS]) * 5
+    return max(0, score)
+
+# ---------- corpus ----------
+
+_NOISE = "ะาิีุูเแ่้๊|/-.,:;'\"()[]_~ OoIl"
+
+def synthetic_corpus(size: int, seed: int) -> list[str]:
+    """สตริงแบบผล OCR: ป้ายถูกรูปแบบ, มีเลขนำ, มี noise แทรก, และขยะล้วน"""
+    rnd = random.Random(seed)
+    codes = list(THAI_PROVINCES)
+    consonants = [chr(c) for c in range(ord("ก"), ord("ฮ") + 1)]
+    corpus = []
+    for _ in range(size):
+        r = rnd.random()
+        code = rnd.choice(codes)
+        if r < 0.35:
+            s = f"{code}{rnd.choice(['', ' '])}{rnd.randint(100, 9999)}"
+        elif r < 0.55:
+            s = f"{rnd.randint(1, 9)}{code} {rnd.randint(1000, 99999)}"
+        elif r < 0.85:
+            s = f"{code} {rnd.randint(1, 9999)}"
+            for _ in range(rnd.randint(1, 3)):
+                i = rnd.randint(0, len(s))
+                s = s[:i] + rnd.choice(_NOISE) + s[i:]
+        else:
+            s = "".join(rnd.choice(consonants + list(_NOISE) + list("0123456789"))
+                        for _ in range(rnd.randint(1, 12)))
+        corpus.append(s)
+    return corpus
+
+def _time(fn, corpus: list[str], repeat: int) -> float:
+    """ns ต่อสตริง (ดีที่สุดจาก repeat รอบ)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for s in corpus:
+            fn(s)
+        best = min(best, time.perf_counter() - start)
+    return round(best / len(corpus) * 1e9, 1)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", help="ไฟล์สตริง OCR บรรทัดละหนึ่งสตริง")
+    ap.add_argument("--size", type=int, default=100000, help="ขนาด corpus ที่สุ่มสร้าง")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", help="บันทึกผล JSON")
+    args = ap.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.rstrip("\n") for line in f]
+    else:
+        corpus = synthetic_corpus(args.size, args.seed)
+
+    # ผลต่างจาก baseline (ไม่รวม score ที่ parse_plate เพิ่มเข้ามา)
+    parse_diff = sum(
+        1 for s in corpus
+        if {k: v for k, v in parse_plate(s).items() if k != "score"} != _legacy_parse(s)
+    )
+    score_diff = sum(1 for s in corpus if score_plate(s) != _legacy_score(s))
+
+    timings = {
+        # parse_plate คืนคะแนนมาด้วย จึงเทียบกับ parse + score ของเดิม
+        "parse_plate_ns": _time(parse_plate, corpus, args.repeat),
+        "legacy_parse_plate_ns": _time(lambda s: (_legacy_parse(s), _legacy_score(s)), corpus, args.repeat),
+        "score_plate_ns": _time(score_plate, corpus, args.repeat),
+        "legacy_score_plate_ns": _time(_legacy_score, corpus, args.repeat),
+    }
+    write_json({
+        "corpus": args.corpus or f"synthetic(size={args.size}, seed={args.seed})",
+        "strings": len(corpus),
+        **timings,
+        "parse_speedup": round(timings["legacy_parse_plate_ns"] / timings["parse_plate_ns"], 2),
+        "score_speedup": round(timings["legacy_score_plate_ns"] / timings["score_plate_ns"], 2),
+        "parse_differs_from_legacy": parse_diff,
+        "score_differs_from_legacy": score_diff,
+    }, args.out)
+
+if __name__ == "__main__":
+    main()
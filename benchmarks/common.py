@@ -0,0 +1,178 @@
+# benchmarks/common.py
+"""
+ตัวช่วยร่วมของสคริปต์ benchmark (ใช้แค่ standard library)
+"""
+import base64
+import json
+import os
+import socket
+import ssl
+import struct
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Optional
+from uuid import uuid4
+
+def percentile(values: list, p: float) -> Optional[float]:
+    """percentile แบบ nearest-rank (p = 0..100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+def summarize_ms(samples_sec: list) -> dict:
+    """สรุป latency (วินาที) เป็น ms"""
+    ms = [s * 1000 for s in samples_sec]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "p50_ms": _r(percentile(ms, 50)),
+        "p95_ms": _r(percentile(ms, 95)),
+        "p99_ms": _r(percentile(ms, 99)),
+        "max_ms": _r(max(ms)) if ms else None,
+    }
+
+def _r(v):
+    return round(v, 3) if v is not None else None
+
+def _request(req: urllib.request.Request, timeout: float) -> tuple[int, bytes, float]:
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        status = e.code
+    except Exception:
+        return 0, b"", time.perf_counter() - start
+    return status, body, time.perf_counter() - start
+
+def post_form(url: str, fields: dict, timeout: float = 30) -> tuple[int, bytes, float]:
+    """POST application/x-www-form-urlencoded -> (status, body, seconds); status 0 = connection error"""
+    data = urllib.parse.urlencode(fields).encode()
+    req = urllib.request.Request(url, data=data, method="POST",
+                                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    return _request(req, timeout)
+
+def get(url: str, timeout: float = 10) -> tuple[int, bytes, float]:
+    """GET -> (status, body, seconds)"""
+    return _request(urllib.request.Request(url), timeout)
+
+def post_file(url: str, field: str, filename: str, content: bytes, content_type: str = "image/jpeg",
+              headers: Optional[dict] = None, timeout: float = 60,
+              fields: Optional[dict] = None) -> tuple[int, bytes, float]:
+    """POST multipart/form-data ที่มีไฟล์เดียว (+ form fields) -> (status, body, seconds)"""
+    boundary = uuid4().hex
+    body = b"".join([
+        *(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+          for k, v in (fields or {}).items()),
+        f"--{boundary}\r\n".encode(),
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode(),
+        f"Content-Type: {content_type}\r\n\r\n".encode(),
+        content,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    req = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        **(headers or {}),
+    })
+    return _request(req, timeout)
+
+class WebSocketClient:
+    """
+    client WebSocket ขั้นต่ำ (RFC 6455, ไม่มี extension / compression) สำหรับ benchmark
+    recv() block จนได้ข้อความ (ตอบ ping ให้เอง) คืน None เมื่อ server ปิด; close() จาก thread อื่นได้
+    """
+
+    def __init__(self, url: str, timeout: float = 10):
+        u = urllib.parse.urlsplit(url)
+        secure = u.scheme in ("wss", "https")
+        sock = socket.create_connection((u.hostname, u.port or (443 if secure else 80)), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=u.hostname)
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {u.netloc}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                      f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        self.sock = sock
+        self._buf = b""
+        while b"\r\n\r\n" not in self._buf:
+            self._fill()
+        head, self._buf = self._buf.split(b"\r\n\r\n", 1)
+        status_line = head.split(b"\r\n", 1)[0].decode(errors="replace")
+        if " 101 " not in f"{status_line} ":
+            sock.close()
+            raise ConnectionError(f"WebSocket handshake failed: {status_line}")
+        sock.settimeout(None)
+
+    def _fill(self):
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("connection closed")
+        self._buf += chunk
+
+    def _read(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            self._fill()
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def _send_frame(self, opcode: int, payload: bytes):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+        elif n < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+        mask = os.urandom(4)
+        self.sock.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    def send(self, text: str):
+        self._send_frame(0x1, text.encode())
+
+    def recv(self) -> Optional[str]:
+        message = b""
+        try:
+            while True:
+                b0, b1 = self._read(2)
+                opcode, n = b0 & 0x0F, b1 & 0x7F
+                if n == 126:
+                    n = struct.unpack("!H", self._read(2))[0]
+                elif n == 127:
+                    n = struct.unpack("!Q", self._read(8))[0]
+                mask = self._read(4) if b1 & 0x80 else None
+                payload = self._read(n)
+                if mask:
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                if opcode == 0x8:
+                    return None
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+                    continue
+                if opcode == 0xA:
+                    continue
+                message += payload
+                if b0 & 0x80:
+                    return message.decode(errors="replace")
+        except (ConnectionError, OSError):
+            return None
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+def write_json(result: dict, path: Optional[str]):
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -466,6 +466,7 @@ async function processWebRTCFrame() {
             // Send to API
             const formData = new FormData();
             formData.append('file', blob, 'camera_capture.jpg');
+            formData.append('priority', 'gate');  // live camera: คิวเดียวกับกล้องหน้าไม้กั้น
             
             try {
                 const response = await fetch('/detect', {
@@ -733,6 +734,7 @@ function startVideoDetection(videoElement) {
                 try {
                     const formData = new FormData();
                     formData.append('file', blob, 'video_frame.jpg');
+                    formData.append('priority', 'batch');
                     
                     const response = await fetch('/detect', {
                         method: 'POST',
@@ -1059,7 +1061,7 @@ function displayRecords(records) {
             <td>${record.id}</td>
             <td class="plate-image-cell">
                 ${record.plate_image 
-                    ? `<img src="${record.plate_image}" class="plate-thumbnail" alt="Plate" onclick="showImageModal('${record.plate_image}')">`
+                    ? `<img src="${record.plate_thumb || record.plate_image}" class="plate-thumbnail" alt="Plate" onclick="showImageModal('${record.plate_image}')">`
                     : 'N/A'}
             </td>
             <td><strong>${record.plate_text || 'N/A'}</strong></td>
@@ -1114,7 +1116,7 @@ async function loadPlateStatus() {
                                 </div>
                             </div>
                             ${plate.plate_image ? `
-                                <img src="${plate.plate_image}" style="width: 80px; height: 50px; object-fit: cover; border-radius: 6px; margin-left: 15px;" onclick="showImageModal('${plate.plate_image}')">
+                                <img src="${plate.plate_thumb || plate.plate_image}" style="width: 80px; height: 50px; object-fit: cover; border-radius: 6px; margin-left: 15px;" onclick="showImageModal('${plate.plate_image}')">
                             ` : ''}
                         </div>
                     </div>
@@ -1145,7 +1147,7 @@ async function loadPlateStatus() {
                                 </div>
                             </div>
                             ${plate.plate_image ? `
-                                <img src="${plate.plate_image}" style="width: 80px; height: 50px; object-fit: cover; border-radius: 6px; margin-left: 15px;" onclick="showImageModal('${plate.plate_image}')">
+                                <img src="${plate.plate_thumb || plate.plate_image}" style="width: 80px; height: 50px; object-fit: cover; border-radius: 6px; margin-left: 15px;" onclick="showImageModal('${plate.plate_image}')">
                             ` : ''}
                         </div>
                     </div>
@@ -1300,7 +1302,7 @@ function handleWebSocketMessage(data) {
     }
     
     if (data.type === 'gate') {
-        const gateStatus = data.action === 'opened' ? '✅ OPENED' : data.action === 'closed' ? '🔒 CLOSED' : '⚠️ ERROR';
+        const gateStatus = data.action === 'opened' ? '✅ OPENED' : data.action === 'closed' ? '🔒 CLOSED' : data.action === 'denied' ? '⛔ DENIED' : '⚠️ ERROR';
         const plateInfo = data.plate_text ? ` | Plate: ${data.plate_text}` : '';
         const reasonInfo = data.reason ? ` | Reason: ${data.reason}` : '';
         addRealtimeLog(`🚪 Gate ${gateStatus}${plateInfo}${reasonInfo}`);